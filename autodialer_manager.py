@@ -3,10 +3,25 @@
 用于在后台运行和管理外呼客户端，可通过 MML 界面控制
 """
 
+import os
+import re
+import json
+import queue
 import threading
 import time
+import logging
+import logging.handlers
+import concurrent.futures
 from typing import Optional, Dict, List
 from sip_client_standalone import AutoDialerClient
+from sipcore.logger import get_logger
+
+# 外呼管理器日志（子记录器，服务运行期间经队列异步输出，避免外呼线程阻塞在终端/文件 I/O 上）
+log = get_logger("ims-sip-server.autodialer")
+
+
+# Contact URI 端口（sip:user@ip:port[;params]），锚定在末尾避免误匹配用户名
+_PORT_RE = re.compile(r':(\d+)(?:;|$)')
 
 
 class AutoDialerManager:
@@ -25,9 +40,24 @@ class AutoDialerManager:
         self.client: Optional[AutoDialerClient] = None
         self.is_running = False
         self.is_registered = False
-        self._lock = threading.Lock()
+        # 状态锁：仅 start/stop/update_config 持有；状态查询直接读取引用快照（无锁）
+        self._state_lock = threading.Lock()
+        # 线程池锁：仅保护线程池的延迟创建
+        self._executor_lock = threading.Lock()
+        # 配置写入锁：串行化配置文件写入
+        self._config_io_lock = threading.Lock()
         self.start_time: Optional[float] = None
         self.main_port = 10000  # 主端口（外呼终端端口）
+        # 外呼线程池（首次使用时创建，跨批次复用）
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._executor_workers = 32
+        # 批量外呼准入控制：限制已提交但未完成的呼叫数（随线程池一起创建）
+        self._admission: Optional[threading.Semaphore] = None
+        # 服务未启动时的配置缓存：(配置文件 mtime, 配置字典)
+        self._config_cache: Optional[tuple[int, Dict]] = None
+        # 异步日志（start 时启用，stop 时关闭并刷新队列）
+        self._log_handler: Optional[logging.handlers.QueueHandler] = None
+        self._log_listener: Optional[logging.handlers.QueueListener] = None
         
     def start(self) -> tuple[bool, str]:
         """
@@ -36,25 +66,27 @@ class AutoDialerManager:
         Returns:
             (成功标志, 消息)
         """
-        with self._lock:
+        with self._state_lock:
             if self.is_running:
                 return False, "外呼服务已启动"
             
             try:
-                # 创建外呼客户端
-                self.client = AutoDialerClient(self.config_file)
+                # 创建外呼客户端（注册成功后再发布到 self.client）
+                client = AutoDialerClient(self.config_file)
                 
                 # 更新主端口配置（从客户端配置读取）
-                self.main_port = self.client.config.get("local_port", 10000)
+                self.main_port = client.config.get("local_port", 10000)
+                self._executor_workers = client.config.get("batch_workers", 32)
                 
                 # 注册到 SIP 服务器
-                if not self.client.register():
-                    self.client = None
+                if not client.register():
                     return False, "注册到 SIP 服务器失败"
                 
+                self.client = client
                 self.is_running = True
                 self.is_registered = True
                 self.start_time = time.time()
+                self._start_log_listener()
                 
                 return True, "外呼服务启动成功"
                 
@@ -71,19 +103,27 @@ class AutoDialerManager:
         Returns:
             (成功标志, 消息)
         """
-        with self._lock:
+        with self._state_lock:
             if not self.is_running:
                 return False, "外呼服务未启动"
             
             try:
-                if self.client:
-                    self.client.close()
-                    self.client = None
-                
+                # 先标记为停止，使新的外呼请求立即被拒绝
                 self.is_running = False
                 self.is_registered = False
                 self.start_time = None
                 
+                client, self.client = self.client, None
+                if client:
+                    client.close()
+                
+                with self._executor_lock:
+                    executor, self._executor = self._executor, None
+                if executor:
+                    executor.shutdown(wait=False)
+                
+                self._stop_log_listener()
+                
                 return True, "外呼服务已停止"
                 
             except Exception as e:
@@ -102,35 +142,28 @@ class AutoDialerManager:
         Returns:
             (成功标志, 消息)
         """
-        with self._lock:
-            if not self.is_running or not self.is_registered:
-                return False, "外呼服务未启动，请先启动外呼服务"
-            
-            if not self.client:
-                return False, "外呼客户端未初始化"
+        # 读取状态快照（无锁），避免与 start/stop 及状态查询争用
+        client = self.client
+        if not self.is_running or not self.is_registered:
+            return False, "外呼服务未启动，请先启动外呼服务"
+        
+        if not client:
+            return False, "外呼客户端未初始化"
         
-        # 在锁外执行，避免阻塞
         try:
             # 使用 dial_concurrent 避免阻塞和状态冲突
-            import threading
-            
             def dial_async():
                 try:
-                    self.client.dial_concurrent(callee, media_file, duration)
+                    client.dial_concurrent(callee, media_file, duration)
                 except Exception as e:
-                    print(f"[ERROR] [{callee}] 异步外呼失败: {e}")
-                    import traceback
-                    traceback.print_exc()
+                    log.error(f"[{callee}] 异步外呼失败: {e}", exc_info=True)
             
-            # 在后台线程中执行（daemon=True 确保不会阻塞主进程）
-            thread = threading.Thread(target=dial_async, daemon=True)
-            thread.start()
+            # 提交到共享线程池执行（不等待结果）
+            self._get_executor().submit(dial_async)
             
             return True, f"外呼请求已发送到 {callee}（后台执行中）"
         except Exception as e:
-            print(f"[ERROR] [{callee}] 外呼异常: {e}")
-            import traceback
-            traceback.print_exc()
+            log.error(f"[{callee}] 外呼异常: {e}", exc_info=True)
             return False, f"外呼异常: {str(e)}"
     
     def dial_batch(self, callees: List[str], media_file: Optional[str] = None,
@@ -146,20 +179,20 @@ class AutoDialerManager:
         Returns:
             (成功标志, 消息, 结果字典) - 立即返回，批量呼叫在后台执行
         """
-        with self._lock:
-            if not self.is_running or not self.is_registered:
-                return False, "外呼服务未启动，请先启动外呼服务", {}
-            
-            if not self.client:
-                return False, "外呼客户端未初始化", {}
-            
-            if not callees:
-                return False, "被叫号码列表为空", {}
+        # 读取状态快照（无锁），避免与 start/stop 及状态查询争用
+        client = self.client
+        if not self.is_running or not self.is_registered:
+            return False, "外呼服务未启动，请先启动外呼服务", {}
+        
+        if not client:
+            return False, "外呼客户端未初始化", {}
+        
+        if not callees:
+            return False, "被叫号码列表为空", {}
         
-        # 在锁外执行，避免阻塞
         try:
-            import threading
-            import concurrent.futures
+            executor = self._get_executor()
+            admission = self._admission
             
             def dial_batch_async():
                 """后台批量外呼函数"""
@@ -168,57 +201,66 @@ class AutoDialerManager:
                     def dial_single(callee: str) -> tuple:
                         """单个呼叫函数（带异常保护）"""
                         try:
-                            success = self.client.dial_concurrent(callee, media_file, duration)
+                            success = client.dial_concurrent(callee, media_file, duration)
                             return (callee, success)
                         except Exception as e:
-                            print(f"[ERROR] [{callee}] 批量外呼异常: {e}")
-                            import traceback
-                            traceback.print_exc()
+                            log.error(f"[{callee}] 批量外呼异常: {e}", exc_info=True)
                             return (callee, False)
+                        finally:
+                            # 释放准入名额，允许提交下一个呼叫
+                            admission.release()
+                    
+                    deadline = time.monotonic() + 300.0  # 最多等待 5 分钟
                     
-                    # 使用线程池并发执行
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(callees), 10)) as executor:
-                        # 提交所有呼叫任务
-                        futures = {executor.submit(dial_single, callee): callee for callee in callees}
-                        
-                        # 等待所有呼叫完成（带超时保护）
+                    # 使用共享线程池并发执行
+                    # 按准入名额逐个提交，避免超大批量一次性塞满线程池队列
+                    futures = {}
+                    for callee in callees:
+                        if not admission.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                            results[callee] = False
+                            log.warning(f"[AutoDialerManager] [{callee}] 呼叫未提交（超时）")
+                            continue
                         try:
-                            for future in concurrent.futures.as_completed(futures, timeout=300.0):  # 最多等待 5 分钟
+                            futures[executor.submit(dial_single, callee)] = callee
+                        except Exception:
+                            admission.release()
+                            raise
+                    
+                    # 等待所有呼叫完成（带超时保护）
+                    try:
+                        for future in concurrent.futures.as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+                            callee = futures[future]
+                            try:
+                                # as_completed 只产出已完成的 future，无需再设超时
+                                callee_result, success = future.result()
+                                results[callee_result] = success
+                                log.info(f"[AutoDialerManager] [{callee_result}] 呼叫完成: {'成功' if success else '失败'}")
+                            except Exception as e:
+                                results[callee] = False
+                                log.error(f"[AutoDialerManager] [{callee}] 呼叫异常: {e}", exc_info=True)
+                    except concurrent.futures.TimeoutError:
+                        # 批量呼叫总超时
+                        log.warning(f"[AutoDialerManager] 批量外呼超时（部分呼叫可能仍在进行）")
+                        # 记录未完成的呼叫
+                        for future in futures:
+                            if not future.done():
                                 callee = futures[future]
-                                try:
-                                    result = future.result(timeout=1.0)  # 每个 future 最多等待 1 秒
-                                    callee_result, success = result
-                                    results[callee_result] = success
-                                    print(f"[AutoDialerManager] [{callee_result}] 呼叫完成: {'成功' if success else '失败'}")
-                                except concurrent.futures.TimeoutError:
-                                    results[callee] = False
-                                    print(f"[WARNING] [AutoDialerManager] [{callee}] 呼叫超时")
-                                except Exception as e:
-                                    results[callee] = False
-                                    print(f"[ERROR] [AutoDialerManager] [{callee}] 呼叫异常: {e}")
-                                    import traceback
-                                    traceback.print_exc()
-                        except concurrent.futures.TimeoutError:
-                            # 批量呼叫总超时
-                            print(f"[WARNING] [AutoDialerManager] 批量外呼超时（部分呼叫可能仍在进行）")
-                            # 记录未完成的呼叫
-                            for future in futures:
-                                if not future.done():
-                                    callee = futures[future]
-                                    results[callee] = False
-                                    print(f"[WARNING] [AutoDialerManager] [{callee}] 呼叫未完成（超时）")
+                                results[callee] = False
+                                log.warning(f"[AutoDialerManager] [{callee}] 呼叫未完成（超时）")
                     
                     success_count = sum(1 for v in results.values() if v)
                     total_count = len(results)
-                    print(f"[AutoDialerManager] 批量外呼完成: {success_count}/{total_count} 成功")
+                    log.info(f"[AutoDialerManager] 批量外呼完成: {success_count}/{total_count} 成功")
                     
-                    # 清理残留注册（除主端口外）
-                    self._cleanup_residual_registrations()
+                    # 清理残留注册（除主端口外），交给线程池执行，不阻塞批量完成
+                    try:
+                        executor.submit(self._cleanup_residual_registrations)
+                    except RuntimeError:
+                        # 线程池已关闭（服务已停止），直接在当前线程清理
+                        self._cleanup_residual_registrations()
                     
                 except Exception as pool_err:
-                    print(f"[ERROR] [AutoDialerManager] 批量外呼线程池异常: {pool_err}")
-                    import traceback
-                    traceback.print_exc()
+                    log.error(f"[AutoDialerManager] 批量外呼线程池异常: {pool_err}", exc_info=True)
             
             # 在后台线程中执行（daemon=True 确保不会阻塞主进程）
             thread = threading.Thread(target=dial_batch_async, daemon=True)
@@ -228,11 +270,63 @@ class AutoDialerManager:
             return True, f"批量外呼请求已提交 {len(callees)} 个号码（后台执行中）", {}
             
         except Exception as e:
-            print(f"[ERROR] [AutoDialerManager] 批量外呼启动异常: {e}")
-            import traceback
-            traceback.print_exc()
+            log.error(f"[AutoDialerManager] 批量外呼启动异常: {e}", exc_info=True)
             return False, f"批量外呼启动异常: {str(e)}", {}
     
+    def _start_log_listener(self):
+        """
+        启用异步日志：外呼日志写入队列，由后台监听线程输出到上级记录器的处理器
+        """
+        if self._log_listener:
+            return
+        
+        # 收集原本会处理外呼日志的处理器（沿记录器层级向上）
+        handlers = []
+        logger = log.logger.parent
+        while logger:
+            handlers.extend(logger.handlers)
+            if not logger.propagate:
+                break
+            logger = logger.parent
+        if not handlers:
+            return
+        
+        log_queue = queue.SimpleQueue()
+        self._log_handler = logging.handlers.QueueHandler(log_queue)
+        self._log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self._log_listener.start()
+        log.logger.addHandler(self._log_handler)
+        log.logger.propagate = False
+    
+    def _stop_log_listener(self):
+        """
+        关闭异步日志：恢复同步输出，并刷新队列中剩余的日志
+        """
+        if not self._log_listener:
+            return
+        
+        log.logger.propagate = True
+        log.logger.removeHandler(self._log_handler)
+        self._log_listener.stop()
+        self._log_handler = None
+        self._log_listener = None
+    
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """
+        获取共享外呼线程池（首次调用时创建）
+        
+        Returns:
+            线程池实例
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._executor_workers,
+                    thread_name_prefix="dialer"
+                )
+                self._admission = threading.Semaphore(self._executor_workers * 2)
+            return self._executor
+    
     def get_status(self) -> Dict:
         """
         获取外呼服务状态
@@ -240,28 +334,30 @@ class AutoDialerManager:
         Returns:
             状态字典
         """
-        with self._lock:
-            status = {
-                "running": self.is_running,
-                "registered": self.is_registered,
-                "start_time": self.start_time,
-                "uptime": None,
-                "stats": {}
+        # 无锁读取：引用赋值在 GIL 下是原子的，轮询不会阻塞外呼路径
+        client = self.client
+        start_time = self.start_time
+        status = {
+            "running": self.is_running,
+            "registered": self.is_registered,
+            "start_time": start_time,
+            "uptime": None,
+            "stats": {}
+        }
+        
+        if start_time:
+            status["uptime"] = int(time.time() - start_time)
+        
+        if client:
+            status["stats"] = client.stats.copy()
+        else:
+            status["stats"] = {
+                "total_calls": 0,
+                "successful_calls": 0,
+                "failed_calls": 0
             }
-            
-            if self.start_time:
-                status["uptime"] = int(time.time() - self.start_time)
-            
-            if self.client:
-                status["stats"] = self.client.stats.copy()
-            else:
-                status["stats"] = {
-                    "total_calls": 0,
-                    "successful_calls": 0,
-                    "failed_calls": 0
-                }
-            
-            return status
+        
+        return status
     
     def get_config(self) -> Dict:
         """
@@ -270,16 +366,29 @@ class AutoDialerManager:
         Returns:
             配置字典
         """
-        with self._lock:
-            if self.client:
-                return self.client.config.copy()
-            else:
-                # 尝试加载配置
+        client = self.client
+        if client:
+            return client.config.copy()
+        else:
+            # 尝试加载配置（按配置文件 mtime 缓存，文件未变化时不重复解析）
+            try:
                 try:
-                    client = AutoDialerClient(self.config_file)
-                    return client.config.copy()
-                except:
-                    return {}
+                    mtime = os.stat(self.config_file).st_mtime_ns
+                except OSError:
+                    mtime = None
+                
+                cache = self._config_cache
+                if cache and mtime is not None and cache[0] == mtime:
+                    return cache[1].copy()
+                
+                config = AutoDialerClient(self.config_file).config
+                if mtime is None:
+                    # 配置文件不存在时 AutoDialerClient 会创建默认配置文件
+                    mtime = os.stat(self.config_file).st_mtime_ns
+                self._config_cache = (mtime, config)
+                return config.copy()
+            except:
+                return {}
     
     def update_config(self, updates: Dict) -> tuple[bool, str]:
         """
@@ -291,21 +400,55 @@ class AutoDialerManager:
         Returns:
             (成功标志, 消息)
         """
-        with self._lock:
-            try:
-                if not self.client:
+        try:
+            # 锁内只更新内存中的配置
+            with self._state_lock:
+                client = self.client
+                if not client:
                     return False, "外呼客户端未初始化"
                 
                 # 更新配置
-                self.client.config.update(updates)
-                
-                # 保存配置
-                self.client._save_config(self.client.config, self.config_file)
-                
-                return True, "配置已更新（重启服务后生效）"
-                
-            except Exception as e:
-                return False, f"更新配置失败: {str(e)}"
+                client.config.update(updates)
+            
+            # 保存配置（在状态锁外执行磁盘 I/O；写入锁内取快照，保证最后写入的是最新配置）
+            with self._config_io_lock:
+                client._save_config(client.config.copy(), self.config_file)
+            
+            return True, "配置已更新（重启服务后生效）"
+            
+        except Exception as e:
+            return False, f"更新配置失败: {str(e)}"
+    
+    def _split_bindings(self, bindings: List[Dict], now: int) -> tuple[List[Dict], Optional[Dict], List[Dict]]:
+        """
+        将绑定划分为主端口绑定和非主端口绑定
+        
+        Args:
+            bindings: 绑定列表
+            now: 当前时间戳（用于过滤过期绑定）
+        
+        Returns:
+            (未过期绑定列表, 主端口绑定, 非主端口绑定列表)
+        """
+        # 过滤掉已过期的绑定
+        valid_bindings = [b for b in bindings if b["expires"] > now]
+        
+        # 查找需要保留的主端口绑定和非主端口绑定
+        main_binding = None
+        other_bindings = []
+        
+        for binding in valid_bindings:
+            contact = binding["contact"]
+            # 解析端口号（格式：sip:user@ip:port）
+            port_match = _PORT_RE.search(contact)
+            if port_match:
+                port = int(port_match.group(1))
+                if port == self.main_port:
+                    main_binding = binding
+                else:
+                    other_bindings.append(binding)
+        
+        return valid_bindings, main_binding, other_bindings
     
     def _cleanup_residual_registrations(self):
         """
@@ -324,7 +467,6 @@ class AutoDialerManager:
             else:
                 # 从配置文件中读取
                 try:
-                    import json
                     with open(self.config_file, 'r', encoding='utf-8') as f:
                         config = json.load(f)
                     username = config.get("username", "0000")
@@ -336,50 +478,47 @@ class AutoDialerManager:
             # 构造 AOR（Address of Record）
             aor = f"sip:{username}@{server_ip}"
             
-            if aor not in reg_bindings:
-                return
-            
-            bindings = reg_bindings[aor]
-            now = int(time.time())
+            # REG_BINDINGS 锁：与 SIP 注册处理共享（没有时创建一个）
+            reg_lock = self.server_globals.setdefault('REG_LOCK', threading.Lock())
             
-            # 过滤掉已过期的绑定
-            valid_bindings = [b for b in bindings if b["expires"] > now]
+            # 锁内只取快照，解析和过滤在锁外完成
+            with reg_lock:
+                bindings = reg_bindings.get(aor)
+                if bindings is None:
+                    return
+                snapshot = list(bindings)
             
-            # 查找需要保留的主端口绑定和非主端口绑定
-            main_binding = None
-            other_bindings = []
-            
-            for binding in valid_bindings:
-                contact = binding["contact"]
-                # 解析端口号（格式：sip:user@ip:port）
-                import re
-                port_match = re.search(r':(\d+)', contact)
-                if port_match:
-                    port = int(port_match.group(1))
-                    if port == self.main_port:
-                        main_binding = binding
-                    else:
-                        other_bindings.append(binding)
+            now = int(time.time())
+            valid_bindings, main_binding, other_bindings = self._split_bindings(snapshot, now)
             
             # 如果有非主端口的绑定，清理它们
             if other_bindings:
-                print(f"[AutoDialerManager] 发现 {len(other_bindings)} 个残留注册（非主端口），正在清理...")
+                log.info(f"[AutoDialerManager] 发现 {len(other_bindings)} 个残留注册（非主端口），正在清理...")
                 
-                # 直接清理 REG_BINDINGS（最简单直接的方法）
                 if main_binding:
                     # 只保留主端口的绑定
-                    reg_bindings[aor] = [main_binding]
-                    print(f"[AutoDialerManager] 已清理残留注册，仅保留主端口 {self.main_port} 的注册")
+                    kept = [main_binding]
                 else:
                     # 如果没有主端口绑定，删除所有非主端口的绑定（保留所有绑定避免误删）
-                    reg_bindings[aor] = [b for b in valid_bindings if b not in other_bindings]
-                    if reg_bindings[aor]:
-                        print(f"[AutoDialerManager] 已清理 {len(other_bindings)} 个非主端口注册，保留 {len(reg_bindings[aor])} 个其他注册")
-                    else:
-                        print(f"[WARNING] [AutoDialerManager] 未找到主端口 {self.main_port} 的注册，已清理所有非主端口注册")
+                    kept = [b for b in valid_bindings if b not in other_bindings]
+                
+                with reg_lock:
+                    current = reg_bindings.get(aor)
+                    if current is not bindings or current != snapshot:
+                        # 快照期间绑定已被修改：基于最新绑定重新计算（通常很少发生）
+                        if current is None:
+                            return
+                        valid_bindings, main_binding, other_bindings = self._split_bindings(current, now)
+                        kept = [main_binding] if main_binding else [b for b in valid_bindings if b not in other_bindings]
+                    reg_bindings[aor] = kept
+                
+                if main_binding:
+                    log.info(f"[AutoDialerManager] 已清理残留注册，仅保留主端口 {self.main_port} 的注册")
+                elif kept:
+                    log.info(f"[AutoDialerManager] 已清理 {len(other_bindings)} 个非主端口注册，保留 {len(kept)} 个其他注册")
+                else:
+                    log.warning(f"[AutoDialerManager] 未找到主端口 {self.main_port} 的注册，已清理所有非主端口注册")
             
         except Exception as e:
-            print(f"[WARNING] [AutoDialerManager] 清理残留注册异常（已忽略）: {e}")
-            import traceback
-            traceback.print_exc()
+            log.warning(f"[AutoDialerManager] 清理残留注册异常（已忽略）: {e}", exc_info=True)
 
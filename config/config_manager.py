@@ -3,75 +3,180 @@
 支持动态修改配置，不影响业务运行
 """
 import json
+import os
+import sys
+import atexit
+import logging
 import threading
 from pathlib import Path
+from types import MappingProxyType
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+from sipcore.logger import get_logger
+from sipcore.utils import compile_networks
+
+log = get_logger("ims-sip-server.config")
+
+# JSON 序列化后端：优先使用 orjson（可选依赖），否则回退到标准库 json
+try:
+    import orjson
+    
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+    
+    def _loads(data: bytes):
+        return json.loads(data.decode('utf-8'))
+
+
+# 缺省值哨兵：区分"配置项不存在"与"值为 None"
+_MISSING = object()
+
+
+def _log_change(key: str, old_value: Any, value: Any):
+    """记录配置修改（参数延迟格式化；USERS 可能很大，只记录数量）"""
+    if key == "USERS":
+        log.debug("[CONFIG] %s: %d -> %d users", key,
+                  len(old_value) if isinstance(old_value, dict) else 0, len(value))
+    else:
+        log.debug("[CONFIG] %s: %s -> %s", key, old_value, value)
+
+
 class ConfigManager:
     """配置管理器 - 支持动态修改和持久化"""
     
+    # 写入合并间隔（秒）：连续修改只触发一次落盘
+    FLUSH_INTERVAL = 0.1
+    # 保留上次落盘内容的大小上限，超过则不保留（避免长期占用大块内存）
+    MAX_SAVED_PAYLOAD = 128 * 1024
+    
     def __init__(self, config_file: str = "config.json"):
         self.config_file = Path(config_file)
-        self.lock = threading.RLock()
+        # 读写时直接使用字符串路径，避免重复构造 Path 对象
+        self._path_str = str(config_file)
+        self._tmp_path_str = os.path.splitext(self._path_str)[0] + '.json.tmp'
+        self.lock = threading.Lock()  # 仅写操作加锁（各临界区互不嵌套，无需可重入锁）
+        # 配置快照：视为不可变，写操作构建新字典后整体替换引用，读操作无需加锁
         self._config_cache: Dict[str, Any] = {}
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+        self._flush_lock = threading.Lock()  # 串行化落盘，避免并发写同一个临时文件
+        self._saved_payload: Optional[bytes] = None  # 上次落盘的序列化结果
         self._load_config()
+        # 进程退出前保存尚未落盘的修改
+        atexit.register(self.flush)
         
     def _load_config(self):
-        """从文件加载配置"""
-        if self.config_file.exists():
+        """从文件加载配置（无缓冲读取整个文件，再一次性解析）"""
+        if os.path.exists(self._path_str):
             try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    self._config_cache = json.load(f)
+                with open(self._path_str, 'rb', buffering=0) as f:
+                    self._config_cache = _loads(f.read())
             except Exception as e:
-                print(f"[CONFIG] Failed to load config: {e}")
+                log.warning("[CONFIG] Failed to load config: %s", e)
                 self._config_cache = {}
     
-    def _save_config(self):
-        """保存配置到文件"""
+    def _save_config(self, config: Dict[str, Any]):
+        """保存配置到文件（内存中序列化后一次写入临时文件，fsync 后原子替换）"""
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self._config_cache, f, indent=4, ensure_ascii=False)
+            data = _dumps(config)
+            if data == self._saved_payload:
+                # 内容与磁盘上一致（如改回原值），跳过写入
+                return
+            with open(self._tmp_path_str, 'wb', buffering=0) as f:
+                f.write(data)
+                os.fsync(f.fileno())
+            os.replace(self._tmp_path_str, self._path_str)
+            self._saved_payload = data if len(data) <= self.MAX_SAVED_PAYLOAD else None
         except Exception as e:
-            print(f"[CONFIG] Failed to save config: {e}")
+            log.error("[CONFIG] Failed to save config: %s", e)
+    
+    def _schedule_flush(self):
+        """标记为待保存，并在 FLUSH_INTERVAL 后统一落盘（需持有 self.lock）"""
+        self._dirty = True
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.FLUSH_INTERVAL, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def flush(self):
+        """立即保存尚未落盘的修改（锁内只取快照，磁盘 I/O 在锁外进行）"""
+        with self._flush_lock:
+            with self.lock:
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+            # 快照不可变，直接序列化当前引用即可
+            self._save_config(self._config_cache)
+    
+    def close(self):
+        """关闭配置管理器（保存尚未落盘的修改）"""
+        self.flush()
     
     def get(self, key: str, default: Any = None) -> Any:
-        """获取配置项"""
-        with self.lock:
-            return self._config_cache.get(key, default)
+        """获取配置项（无锁读取当前快照）"""
+        return self._config_cache.get(key, default)
     
     def set(self, key: str, value: Any) -> bool:
         """设置配置项"""
         with self.lock:
-            old_value = self._config_cache.get(key)
-            self._config_cache[key] = value
-            self._save_config()
+            old_value = self._config_cache.get(key, _MISSING)
+            if type(old_value) is type(value) and old_value == value:
+                # 值未变化，无需重写配置文件
+                return True
+            if old_value is _MISSING:
+                old_value = None
+            new_config = dict(self._config_cache)
+            new_config[key] = value
+            self._config_cache = new_config
+            self._schedule_flush()
             
             # 记录修改
-            print(f"[CONFIG] {key}: {old_value} -> {value}")
+            _log_change(key, old_value, value)
             return True
     
     def get_all(self) -> Dict[str, Any]:
-        """获取所有配置"""
-        with self.lock:
-            return self._config_cache.copy()
+        """获取所有配置（返回副本，调用方可自由修改）"""
+        return self._config_cache.copy()
     
     def update_batch(self, updates: Dict[str, Any]) -> Dict[str, bool]:
         """批量更新配置"""
         results = {}
         with self.lock:
+            # 过滤掉值未变化的配置项
+            current = self._config_cache
+            changed = {}
             for key, value in updates.items():
+                old_value = current.get(key, _MISSING)
+                if type(old_value) is type(value) and old_value == value:
+                    results[key] = True
+                else:
+                    changed[key] = value
+            if not changed:
+                return results
+            
+            new_config = dict(current)
+            for key, value in changed.items():
                 try:
-                    old_value = self._config_cache.get(key)
-                    self._config_cache[key] = value
-                    print(f"[CONFIG] {key}: {old_value} -> {value}")
+                    old_value = new_config.get(key)
+                    new_config[key] = value
+                    _log_change(key, old_value, value)
                     results[key] = True
                 except Exception as e:
-                    print(f"[CONFIG] Failed to set {key}: {e}")
+                    log.warning("[CONFIG] Failed to set %s: %s", key, e)
                     results[key] = False
+            self._config_cache = new_config
             
             # 统一保存
-            self._save_config()
+            self._schedule_flush()
         
         return results
 
@@ -93,6 +198,42 @@ def get_config_manager() -> ConfigManager:
     return _config_manager
 
 
+# 配置项校验函数（模块级函数，避免每次校验都创建/调用 lambda）
+def _check_user_item(item) -> bool:
+    """校验单个用户条目：用户名和密码均为字符串"""
+    return type(item[0]) is str and type(item[1]) is str
+
+
+def _is_str(v) -> bool:
+    return type(v) is str
+
+
+def _is_bool(v) -> bool:
+    return type(v) is bool
+
+
+def _validate_users(v) -> bool:
+    return type(v) is dict and all(map(_check_user_item, v.items()))
+
+
+def _validate_str_list(v) -> bool:
+    return type(v) is list and all(map(_is_str, v))
+
+
+# 日志级别可选值（列表用于前端展示，frozenset 用于校验）
+_LOG_LEVEL_OPTIONS = ["DEBUG", "INFO", "WARNING", "ERROR"]
+_LOG_LEVELS = frozenset(_LOG_LEVEL_OPTIONS)
+_LOG_LEVEL_MAP = {name: getattr(logging, name) for name in _LOG_LEVEL_OPTIONS}
+
+
+def _validate_log_level(v) -> bool:
+    return type(v) is str and v in _LOG_LEVELS
+
+
+def _validate_port(v) -> bool:
+    return type(v) is int and 1024 <= v <= 65535
+
+
 # 可动态修改的配置项定义
 DYNAMIC_CONFIG = {
     # 用户管理（可动态修改）
@@ -101,7 +242,7 @@ DYNAMIC_CONFIG = {
         "editable": True,
         "restart_required": False,
         "description": "用户账号和密码",
-        "validator": lambda v: isinstance(v, dict) and all(isinstance(k, str) and isinstance(v2, str) for k, v2 in v.items())
+        "validator": _validate_users
     },
     
     # 网络配置（部分可动态修改）
@@ -110,7 +251,7 @@ DYNAMIC_CONFIG = {
         "editable": True,
         "restart_required": False,
         "description": "强制本地地址模式",
-        "validator": lambda v: isinstance(v, bool)
+        "validator": _is_bool
     },
     
     "LOCAL_NETWORKS": {
@@ -118,7 +259,7 @@ DYNAMIC_CONFIG = {
         "editable": True,
         "restart_required": False,
         "description": "本地网络地址列表",
-        "validator": lambda v: isinstance(v, list) and all(isinstance(i, str) for i in v)
+        "validator": _validate_str_list
     },
     
     # 日志配置（可动态修改）
@@ -127,8 +268,8 @@ DYNAMIC_CONFIG = {
         "editable": True,
         "restart_required": False,
         "description": "日志级别",
-        "validator": lambda v: v in ["DEBUG", "INFO", "WARNING", "ERROR"],
-        "options": ["DEBUG", "INFO", "WARNING", "ERROR"]
+        "validator": _validate_log_level,
+        "options": _LOG_LEVEL_OPTIONS
     },
     
     # CDR 配置（可动态修改）
@@ -137,7 +278,7 @@ DYNAMIC_CONFIG = {
         "editable": True,
         "restart_required": False,
         "description": "CDR 记录合并模式",
-        "validator": lambda v: isinstance(v, bool)
+        "validator": _is_bool
     },
     
     # 不可动态修改的配置（需要重启）
@@ -146,7 +287,7 @@ DYNAMIC_CONFIG = {
         "editable": False,
         "restart_required": True,
         "description": "服务器 IP 地址（修改需重启）",
-        "validator": lambda v: isinstance(v, str)
+        "validator": _is_str
     },
     
     "SERVER_PORT": {
@@ -154,10 +295,16 @@ DYNAMIC_CONFIG = {
         "editable": False,
         "restart_required": True,
         "description": "服务器端口（修改需重启）",
-        "validator": lambda v: isinstance(v, int) and 1024 <= v <= 65535
+        "validator": _validate_port
     },
 }
 
+# 校验表：导入时预先编译，key -> (editable, validator, restart_required)
+_VALIDATORS = MappingProxyType({
+    key: (config.get("editable", False), config.get("validator"), config.get("restart_required", False))
+    for key, config in DYNAMIC_CONFIG.items()
+})
+
 
 def validate_config(key: str, value: Any) -> tuple[bool, str]:
     """
@@ -166,22 +313,112 @@ def validate_config(key: str, value: Any) -> tuple[bool, str]:
     Returns:
         (是否有效, 错误消息)
     """
-    config_def = DYNAMIC_CONFIG.get(key)
+    config_def = _VALIDATORS.get(key)
     
-    if not config_def:
+    if config_def is None:
         return False, f"未知的配置项: {key}"
     
-    if not config_def.get("editable", False):
+    editable, validator, _ = config_def
+    if not editable:
         return False, f"配置项 {key} 不可修改（需要重启服务器）"
     
     # 类型验证
-    validator = config_def.get("validator")
     if validator and not validator(value):
         return False, f"配置项 {key} 的值无效"
     
     return True, ""
 
 
+# 缓存的 run 模块对象（首次使用时解析）
+_run_module = None
+
+def _get_run_module():
+    """获取 run 模块（使用 sys.modules 访问已导入的 run 模块，避免重新执行模块级别代码）"""
+    global _run_module
+    if _run_module is None:
+        run = sys.modules.get('run')
+        if run is None:
+            # 如果 run 模块还未导入（不太可能），则正常导入
+            import run as run_module
+            run = run_module
+        _run_module = run
+    return _run_module
+
+
+def _apply_users(run, value) -> tuple[bool, str]:
+    # 动态更新用户列表（整体替换引用，读取方不会看到中间的空状态）
+    run.USERS = dict(value)
+    return True, f"用户列表已更新（当前 {len(value)} 个用户）"
+
+
+def _apply_force_local_addr(run, value) -> tuple[bool, str]:
+    # 动态更新强制本地模式
+    run.FORCE_LOCAL_ADDR = value
+    return True, f"强制本地地址模式已{'启用' if value else '禁用'}"
+
+
+def _apply_local_networks(run, value) -> tuple[bool, str]:
+    # 动态更新本地网络列表（先预编译网络区间，再整体替换引用）
+    nets = compile_networks(value)
+    run.LOCAL_NETWORKS = list(value)
+    run.LOCAL_NETWORK_NETS = nets
+    return True, f"本地网络地址已更新（{len(value)} 个地址）"
+
+
+def _apply_log_level(run, value) -> tuple[bool, str]:
+    # 动态更新日志级别
+    level = _LOG_LEVEL_MAP[value]
+    # 尝试设置日志级别
+    try:
+        # SIPLogger 包装类，通过 logger 属性访问底层 Logger
+        if hasattr(run.log, 'logger') and hasattr(run.log.logger, 'setLevel'):
+            run.log.logger.setLevel(level)
+            # 同时更新所有处理器的级别（遍历快照，避免与 addHandler 并发修改冲突）
+            for handler in tuple(run.log.logger.handlers):
+                handler.setLevel(level)
+            return True, f"日志级别已更新为 {value}（立即生效）"
+        else:
+            # 如果是标准 Logger 对象
+            if hasattr(run.log, 'setLevel'):
+                run.log.setLevel(level)
+                return True, f"日志级别已更新为 {value}（立即生效）"
+            else:
+                # 保存配置但无法立即应用
+                return True, f"日志级别配置已保存为 {value}（重启后生效）"
+    except Exception as e:
+        # 出现错误，配置已保存但可能需要重启
+        log.warning("[CONFIG] Failed to apply LOG_LEVEL: %s", e)
+        return True, f"日志级别配置已保存为 {value}（重启后生效）"
+
+
+def _apply_cdr_merge_mode(run, value) -> tuple[bool, str]:
+    # CDR 合并模式（新创建的 CDR 会使用新设置）
+    return True, f"CDR 合并模式已{'启用' if value else '禁用'}（对新记录生效）"
+
+
+# 运行时应用函数分发表：配置项 -> handler(run, value)
+_APPLIERS = {
+    "USERS": _apply_users,
+    "FORCE_LOCAL_ADDR": _apply_force_local_addr,
+    "LOCAL_NETWORKS": _apply_local_networks,
+    "LOG_LEVEL": _apply_log_level,
+    "CDR_MERGE_MODE": _apply_cdr_merge_mode,
+}
+
+
+def _apply_runtime(run, key: str, value: Any) -> tuple[bool, str]:
+    """
+    将单个配置项应用到运行时（调用前需已通过验证）
+    
+    Returns:
+        (是否成功, 消息)
+    """
+    handler = _APPLIERS.get(key)
+    if handler is None:
+        return False, f"配置项 {key} 暂不支持动态修改"
+    return handler(run, value)
+
+
 def apply_config_change(key: str, value: Any) -> tuple[bool, str]:
     """
     应用配置更改到运行时
@@ -200,78 +437,65 @@ def apply_config_change(key: str, value: Any) -> tuple[bool, str]:
         config_mgr.set(key, value)
         
         # 应用到运行时
-        # 使用 sys.modules 访问已导入的 run 模块，避免重新执行模块级别代码
-        import sys
-        run = sys.modules.get('run')
-        if run is None:
-            # 如果 run 模块还未导入（不太可能），则正常导入
-            import run as run_module
-            run = run_module
-        
-        if key == "USERS":
-            # 动态更新用户列表
-            run.USERS.clear()
-            run.USERS.update(value)
-            return True, f"用户列表已更新（当前 {len(value)} 个用户）"
-        
-        elif key == "FORCE_LOCAL_ADDR":
-            # 动态更新强制本地模式
-            run.FORCE_LOCAL_ADDR = value
-            return True, f"强制本地地址模式已{'启用' if value else '禁用'}"
-        
-        elif key == "LOCAL_NETWORKS":
-            # 动态更新本地网络列表
-            run.LOCAL_NETWORKS.clear()
-            run.LOCAL_NETWORKS.extend(value)
-            return True, f"本地网络地址已更新（{len(value)} 个地址）"
-        
-        elif key == "LOG_LEVEL":
-            # 动态更新日志级别
-            import logging
-            level = getattr(logging, value)
-            # 尝试设置日志级别
-            try:
-                # SIPLogger 包装类，通过 logger 属性访问底层 Logger
-                if hasattr(run.log, 'logger') and hasattr(run.log.logger, 'setLevel'):
-                    run.log.logger.setLevel(level)
-                    # 同时更新所有处理器的级别
-                    for handler in run.log.logger.handlers:
-                        handler.setLevel(level)
-                    return True, f"日志级别已更新为 {value}（立即生效）"
-                else:
-                    # 如果是标准 Logger 对象
-                    if hasattr(run.log, 'setLevel'):
-                        run.log.setLevel(level)
-                        return True, f"日志级别已更新为 {value}（立即生效）"
-                    else:
-                        # 保存配置但无法立即应用
-                        return True, f"日志级别配置已保存为 {value}（重启后生效）"
-            except Exception as e:
-                # 出现错误，配置已保存但可能需要重启
-                print(f"[CONFIG] Failed to apply LOG_LEVEL: {e}")
-                return True, f"日志级别配置已保存为 {value}（重启后生效）"
-        
-        elif key == "CDR_MERGE_MODE":
-            # CDR 合并模式（新创建的 CDR 会使用新设置）
-            return True, f"CDR 合并模式已{'启用' if value else '禁用'}（对新记录生效）"
-        
-        else:
-            return False, f"配置项 {key} 暂不支持动态修改"
+        return _apply_runtime(_get_run_module(), key, value)
     
     except Exception as e:
         return False, f"应用配置失败: {str(e)}"
 
 
-def get_editable_configs() -> Dict[str, Any]:
-    """获取所有可编辑的配置项定义"""
-    return {
-        key: {
-            "type": config["type"],
-            "description": config["description"],
-            "restart_required": config["restart_required"],
-            "options": config.get("options")
-        }
-        for key, config in DYNAMIC_CONFIG.items()
-        if config.get("editable", False)
+def apply_config_changes(updates: Dict[str, Any]) -> Dict[str, tuple[bool, str]]:
+    """
+    批量应用配置更改：先统一验证，再一次性保存，最后逐项应用到运行时
+    
+    Returns:
+        {配置项: (是否成功, 消息)}
+    """
+    results: Dict[str, tuple[bool, str]] = {}
+    valid_updates: Dict[str, Any] = {}
+    
+    # 验证所有配置项
+    for key, value in updates.items():
+        valid, error_msg = validate_config(key, value)
+        if valid:
+            valid_updates[key] = value
+        else:
+            results[key] = (False, error_msg)
+    
+    if not valid_updates:
+        return results
+    
+    try:
+        # 统一保存到配置文件
+        get_config_manager().update_batch(valid_updates)
+        run = _get_run_module()
+    except Exception as e:
+        for key in valid_updates:
+            results[key] = (False, f"应用配置失败: {str(e)}")
+        return results
+    
+    # 应用到运行时
+    for key, value in valid_updates.items():
+        try:
+            results[key] = _apply_runtime(run, key, value)
+        except Exception as e:
+            results[key] = (False, f"应用配置失败: {str(e)}")
+    
+    return results
+
+
+# 可编辑配置项定义（DYNAMIC_CONFIG 为常量，导入时计算一次）
+_EDITABLE_CONFIGS: Dict[str, Any] = {
+    key: {
+        "type": config["type"],
+        "description": config["description"],
+        "restart_required": config["restart_required"],
+        "options": config.get("options")
     }
+    for key, config in DYNAMIC_CONFIG.items()
+    if config.get("editable", False)
+}
+
 
+def get_editable_configs() -> Dict[str, Any]:
+    """获取所有可编辑的配置项定义（返回共享的缓存对象，调用方请勿修改）"""
+    return _EDITABLE_CONFIGS
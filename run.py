@@ -1,11 +1,13 @@
 # run.py
 import asyncio, time, re, socket
 import os
+import threading
+from dataclasses import dataclass
 
 from sipcore.transport_udp import UDPServer
 from sipcore.parser import parse
 from sipcore.message import SIPMessage
-from sipcore.utils import gen_tag, sip_date
+from sipcore.utils import gen_tag, sip_date, compile_networks, in_networks
 from sipcore.auth import make_401, check_digest
 from sipcore.logger import init_logging
 from sipcore.timers import create_timers
@@ -21,7 +23,8 @@ from config.config_manager import init_config_manager
 config_mgr = init_config_manager("config/config.json")
 
 # 初始化 CDR 系统（日志输出已移到 init_cdr 内部）
-cdr = init_cdr(base_dir="CDR")
+# 话单每 50ms 批量落盘，文件 I/O 在后台定时器线程中进行，不阻塞 SIP 收发
+cdr = init_cdr(base_dir="CDR", flush_interval=0.05)
 
 # 初始化用户管理系统（日志输出已移到 init_user_manager 内部）
 user_mgr = init_user_manager(data_file="data/users.json")
@@ -71,6 +74,8 @@ LOCAL_NETWORKS = [
 # 从环境变量读取局域网网段，如果没有则使用默认值
 LOCAL_NETWORK_CIDR = os.getenv("LOCAL_NETWORK_CIDR", "192.168.0.0/16")
 LOCAL_NETWORKS.extend([LOCAL_NETWORK_CIDR])
+# 预编译的网络区间（CIDR 二分匹配用），LOCAL_NETWORKS 动态修改时一并整体替换
+LOCAL_NETWORK_NETS = compile_networks(LOCAL_NETWORKS)
 
 # FORCE_LOCAL_ADDR: 强制使用本地地址（仅用于单机测试）
 # 设置为 False 时，支持真实的多机网络环境
@@ -78,6 +83,8 @@ FORCE_LOCAL_ADDR = False   # True: 本机测试模式 | False: 真实网络模
 
 # 注册绑定: AOR -> list of bindings: [{"contact": "sip:1001@ip:port", "expires": epoch}]
 REG_BINDINGS: dict[str, list[dict]] = {}
+# 注册绑定锁：保护其他线程（如外呼管理器）与 SIP 处理对 REG_BINDINGS 的并发修改
+REG_LOCK = threading.Lock()
 
 # 请求追踪：Call-ID -> 原始发送地址
 PENDING_REQUESTS: dict[str, tuple[str, int]] = {}
@@ -89,17 +96,53 @@ DIALOGS: dict[str, tuple[tuple[str, int], tuple[str, int]]] = {}
 # INVITE 事务的 branch 需要被 CANCEL 复用，以满足某些非标准客户端（如 Zoiper 2.x）的要求
 INVITE_BRANCHES: dict[str, str] = {}
 
+# 首选绑定缓存：AOR -> (绑定字典, (contact, host, port))
+# 绑定字典仍为 REG_BINDINGS[aor][0] 时直接复用，避免每个请求都过滤列表、解析 contact
+# 定时清理、MML 等处会直接删除 REG_BINDINGS[aor]，因此查找时发现无绑定也要移除缓存，并限制大小
+_AOR_PRIMARY: dict[str, tuple[dict, tuple[str, str, int]]] = {}
+_AOR_PRIMARY_MAX = 4096
+
 # 最后响应状态追踪：Call-ID -> 最后响应状态码（用于区分 2xx 和非 2xx ACK）
 # 当收到 INVITE 的最终响应时，记录状态码，用于后续 ACK 类型判断
 LAST_RESPONSE_STATUS: dict[str, str] = {}
 
+# 当前时间（秒）缓存：批量收包时每批刷新一次，同一批数据报共用，避免逐包读取时钟
+# 为 0 表示未启用批量刷新（如回退到 asyncio 默认传输），此时直接读取 time.time()
+_NOW_CACHE: list[int] = [0]
+
+def _refresh_now():
+    """UDP 批量收包前调用，刷新时间缓存"""
+    _NOW_CACHE[0] = int(time.time())
+
+def _now() -> int:
+    """返回当前时间（秒），用于注册绑定的过期判断"""
+    return _NOW_CACHE[0] or int(time.time())
+
+# ====== 预编译正则 ======
+_RE_SIP_USER = re.compile(r"sip:([^@;>]+)")
+_RE_SIP_VERSION = re.compile(r'\bSIP/2\.0', re.I)
+_RE_URI_HOST = re.compile(r"@[^;>]+")
+_RE_URI_HOST_ONLY = re.compile(r"@[^:;>]+")
+_RE_SEMI_PARAMS = re.compile(r";[^,]*")
+_RE_OB = re.compile(r";ob\b")
+_RE_TRANSPORT = re.compile(r";transport=\w+")
+# R-URI 指向服务器自身（CANCEL 需要改写为被叫实际地址）
+_RE_SELF_RURI = re.compile("|".join(map(re.escape, (SERVER_IP, "127.0.0.1"))))
+# R-URI 含 ;ob 或外部/私网地址（BYE/UPDATE 需要改写为本地 contact）
+_RE_FIXUP_RURI = re.compile(r";ob|@(?:100|192|172)\.")
+
+# 服务器端口字符串（Route 是否指向我们的判断用）
+_SERVER_PORT_STR = str(SERVER_PORT)
+
 # ====== 工具函数 ======
-def _aor_from_from(from_val: str | None) -> str:
-    if not from_val:
+def _aor_from_header(val: str | None) -> str:
+    """从 From/To 头（或 R-URI）中提取 AOR，去掉显示名、尖括号和 URI 参数"""
+    if not val:
         return ""
-    s = from_val
-    if "<sip:" in s and ">" in s:
-        uri = s[s.find("<")+1:s.find(">")]
+    s = val
+    gt = s.find(">")
+    if gt >= 0 and "<sip:" in s:
+        uri = s[s.find("<")+1:gt]
     else:
         p = s.find("sip:")
         uri = s[p:] if p >= 0 else s
@@ -108,27 +151,23 @@ def _aor_from_from(from_val: str | None) -> str:
         uri = uri[:semi]
     return uri  # e.g., sip:1002@sip.local
 
+# From / To 头的 AOR 提取规则相同
+_aor_from_from = _aor_from_header
+_aor_from_to = _aor_from_header
+
 def _same_user(uri1: str, uri2: str) -> bool:
     """比较两个 SIP URI 是否同一用户（忽略域名和端口）"""
-    import re
     def extract_user(u):
-        m = re.search(r"sip:([^@;>]+)", u)
+        m = _RE_SIP_USER.search(u)
         return m.group(1) if m else u
     return extract_user(uri1) == extract_user(uri2)
 
-def _aor_from_to(to_val: str | None) -> str:
-    if not to_val:
-        return ""
-    s = to_val
-    if "<sip:" in s and ">" in s:
-        uri = s[s.find("<")+1:s.find(">")]
-    else:
-        p = s.find("sip:")
-        uri = s[p:] if p >= 0 else s
-    semi = uri.find(";")
-    if semi > 0:
-        uri = uri[:semi]
-    return uri  # e.g., sip:1001@sip.local
+_DIGITS = "0123456789"
+
+def _leading_int(s: str) -> int | None:
+    """解析字符串开头的连续数字，没有数字时返回 None"""
+    n = len(s) - len(s.lstrip(_DIGITS))
+    return int(s[:n]) if n else None
 
 def _parse_contacts(req: SIPMessage):
     out = []
@@ -136,11 +175,16 @@ def _parse_contacts(req: SIPMessage):
         uri = c
         if "<" in c and ">" in c:
             uri = c[c.find("<")+1:c.find(">")]
-        exp = 3600
-        m = re.search(r"expires=(\d+)", c, re.I)
-        if m:
-            exp = int(m.group(1))
-        else:
+        exp = None
+        lc = c.lower()
+        i = lc.find("expires=")
+        while i >= 0:
+            exp = _leading_int(lc[i+8:])
+            if exp is not None:
+                break
+            i = lc.find("expires=", i + 8)
+        if exp is None:
+            exp = 3600
             e = req.get("expires")
             if e and e.isdigit():
                 exp = int(e)
@@ -150,35 +194,43 @@ def _parse_contacts(req: SIPMessage):
 def _host_port_from_via(via_val: str) -> tuple[str, int]:
     # 例：Via: SIP/2.0/UDP 192.168.1.50:5062;branch=z9hG4bK;rport=5060;received=192.168.1.50
     # 优先使用 received 和 rport 参数（RFC 3261 Section 18.2.2）
+    params = via_val.split(";")
     
-    # 先检查 received 参数
-    received_match = re.search(r"received=([^\s;]+)", via_val, re.I)
-    if received_match:
-        host = received_match.group(1).strip()
-        
-        # 检查 rport 参数
-        rport_match = re.search(r"rport=(\d+)", via_val, re.I)
-        if rport_match:
-            port = int(rport_match.group(1))
-            return (host, port)
-        else:
-            # 没有 rport，使用 sent-by 的端口
-            sent_by_match = re.search(r"SIP/2\.0/\w+\s+([^;]+)", via_val, re.I)
-            if sent_by_match:
-                sent_by = sent_by_match.group(1).strip()
-                if ":" in sent_by:
-                    _, p = sent_by.rsplit(":", 1)
-                    try:
-                        return (host, int(p))
-                    except:
-                        return (host, 5060)
-            return (host, 5060)
+    # 解析 received / rport 参数
+    received = None
+    rport = None
+    for p in params[1:]:
+        p = p.strip()
+        name = p[:9].lower()
+        if received is None and name == "received=":
+            v = p[9:].split(None, 1)
+            if v:
+                received = v[0]
+        elif rport is None and name[:6] == "rport=":
+            rport = _leading_int(p[6:])
+    
+    # sent-by：第一段 "SIP/2.0/UDP host:port"
+    sent_by = None
+    head = params[0].split(None, 1)
+    if len(head) == 2 and len(head[0]) > 8 and head[0][:8].upper() == "SIP/2.0/":
+        sent_by = head[1].strip()
+    
+    if received is not None:
+        host = received
+        if rport is not None:
+            return (host, rport)
+        # 没有 rport，使用 sent-by 的端口
+        if sent_by and ":" in sent_by:
+            _, p = sent_by.rsplit(":", 1)
+            try:
+                return (host, int(p))
+            except:
+                return (host, 5060)
+        return (host, 5060)
     
     # 没有 received 参数，使用 sent-by
-    m = re.search(r"SIP/2\.0/\w+\s+([^;]+)", via_val, re.I)
-    if not m:
+    if not sent_by:
         return ("", 0)
-    sent_by = m.group(1).strip()
     if ":" in sent_by:
         h, p = sent_by.rsplit(":", 1)
         try:
@@ -188,29 +240,90 @@ def _host_port_from_via(via_val: str) -> tuple[str, int]:
     else:
         return (sent_by, 5060)
 
+# 响应状态码分类表：状态码（0-999）-> 标志位，一次查表代替多次元组扫描
+_ST_DROP = 0x1               # 482/483/502/503/504：错误响应，不再继续转发（避免环路）
+_ST_INVITE_FINAL_FAIL = 0x2  # 486/487/488/600/603/604：非 2xx 最终响应，等待 ACK 后清理
+_ST_OTHER_FAIL = 0x4         # 其余 4xx/5xx/6xx 失败响应
+_ST_FINAL = 0x8              # 2xx-6xx 最终响应（非 1xx）
+
+def _build_status_table() -> bytes:
+    table = bytearray(1000)
+    for code in range(200, 700):
+        table[code] = _ST_FINAL
+    for code in range(400, 700):
+        table[code] |= _ST_OTHER_FAIL
+    for code in (486, 487, 488, 600, 603, 604):
+        table[code] = _ST_FINAL | _ST_INVITE_FINAL_FAIL
+    for code in (482, 483, 502, 503, 504):
+        table[code] |= _ST_DROP
+    return bytes(table)
+
+_STATUS_CLASS = _build_status_table()
+
+def _status_flags(status_code: str) -> int:
+    """返回状态码字符串对应的分类标志位（非三位数字时为 0）"""
+    if len(status_code) == 3 and status_code.isdigit():
+        return _STATUS_CLASS[int(status_code)]
+    return 0
+
+# SIP URI -> (host, port) 解析结果缓存（Contact / Route 在各事务间基本不变）
+_URI_HOST_PORT_CACHE: dict[str, tuple[str, int]] = {}
+_URI_HOST_PORT_CACHE_MAX = 8192
+
 def _host_port_from_sip_uri(uri: str) -> tuple[str, int]:
+    hit = _URI_HOST_PORT_CACHE.get(uri)
+    if hit is None:
+        hit = _parse_sip_uri_host_port(uri)
+        if len(_URI_HOST_PORT_CACHE) >= _URI_HOST_PORT_CACHE_MAX:
+            _URI_HOST_PORT_CACHE.clear()
+        _URI_HOST_PORT_CACHE[uri] = hit
+    return hit
+
+def _parse_sip_uri_host_port(uri: str) -> tuple[str, int]:
     # 例：sip:1002@192.168.1.60:5066;transport=udp
     # 或 sip:192.168.1.60:5066
-    u = uri
-    if u.startswith("sip:"):
-        u = u[4:]
+    u = uri[4:] if uri.startswith("sip:") else uri
     # 去掉用户@部分
-    if "@" in u:
-        u = u.split("@", 1)[1]
+    _, at, rest = u.partition("@")
+    if at:
+        u = rest
     # 去掉参数
-    if ";" in u:
-        u = u.split(";", 1)[0]
-    if ":" in u:
-        host, port = u.rsplit(":", 1)
+    u = u.partition(";")[0]
+    host, colon, port = u.rpartition(":")
+    if colon:
         try:
             return host, int(port)
         except:
             return host, 5060
     return u, 5060
 
-def _ensure_header(msg: SIPMessage, name: str, default: str):
-    if not msg.get(name):
-        msg.add_header(name, default)
+def _lookup_binding(aor: str, now: int | None = None) -> tuple[str, str, int] | None:
+    """
+    查找 AOR 的首个绑定，返回 (contact, host, port)，没有时返回 None
+    
+    指定 now 时跳过已过期的绑定；不指定时与直接取 REG_BINDINGS[aor][0] 等价
+    """
+    binds = REG_BINDINGS.get(aor)
+    if not binds:
+        _AOR_PRIMARY.pop(aor, None)
+        return None
+    first = binds[0]
+    if now is None or first["expires"] > now:
+        cached = _AOR_PRIMARY.get(aor)
+        if cached is not None and cached[0] is first:
+            return cached[1]
+        contact = first["contact"]
+        target = (contact, *_host_port_from_sip_uri(contact))
+        if cached is None and len(_AOR_PRIMARY) >= _AOR_PRIMARY_MAX:
+            _AOR_PRIMARY.clear()
+        _AOR_PRIMARY[aor] = (first, target)
+        return target
+    # 首个绑定已过期：顺序查找下一个有效绑定（少见，不缓存）
+    for b in binds[1:]:
+        if b["expires"] > now:
+            contact = b["contact"]
+            return (contact, *_host_port_from_sip_uri(contact))
+    return None
 
 def _decrement_max_forwards(msg: SIPMessage) -> bool:
     mf = msg.get("max-forwards")
@@ -226,11 +339,16 @@ def _decrement_max_forwards(msg: SIPMessage) -> bool:
     msg.add_header("max-forwards", str(v))
     return True
 
+_VIA_PREFIX = f"SIP/2.0/UDP {SERVER_IP}:{SERVER_PORT};branch="
+
 def _add_top_via(msg: SIPMessage, branch: str):
-    via = f"SIP/2.0/UDP {SERVER_IP}:{SERVER_PORT};branch={branch};rport"
-    # 插入为第一条 Via
-    old = msg.headers.get("via", [])
-    msg.headers["via"] = [via] + old
+    via = _VIA_PREFIX + branch + ";rport"
+    # 插入为第一条 Via（原地插入，不复制整个 Via 列表）
+    vias = msg.headers.get("via")
+    if vias:
+        vias.insert(0, via)
+    else:
+        msg.headers["via"] = [via]
 
 def _split_via_header(via_str: str) -> list[str]:
     """
@@ -254,9 +372,7 @@ def _split_via_header(via_str: str) -> list[str]:
         return [current] if current else []
     
     # 查找所有 "SIP/2.0" 的位置（这些是新的 Via 头的开始）
-    import re
-    sip_pattern = re.compile(r'\bSIP/2\.0', re.I)
-    matches = list(sip_pattern.finditer(current))
+    matches = list(_RE_SIP_VERSION.finditer(current))
     
     if len(matches) <= 1:
         # 只有一个 SIP/2.0，说明这是单个 Via 头（可能有参数值包含逗号）
@@ -299,33 +415,38 @@ def _pop_top_via(resp: SIPMessage):
         else:
             resp.headers.pop("via", None)
     else:
-        # 第一个元素是单个 Via，正常弹出
-        vias.pop(0)
-        if vias:
-            resp.headers["via"] = vias
-        else:
+        # 第一个元素是单个 Via，原地弹出
+        del vias[0]
+        if not vias:
             resp.headers.pop("via", None)
 
 def _is_request(start_line: str) -> bool:
     return not start_line.startswith("SIP/2.0")
 
 def _method_of(msg: SIPMessage) -> str:
-    return msg.start_line.split()[0]
+    # partition 遇到第一个空格即停止，不必切分整行
+    return msg.start_line.partition(" ")[0]
+
+def _route_targets_us(route: str) -> bool:
+    """Route 头是否指向本服务器"""
+    return SERVER_IP in route or _SERVER_PORT_STR in route
 
 def _is_initial_request(msg: SIPMessage) -> bool:
     # 初始请求：无 "Route" 指向我们，且是新的对话（简单判断：无 "To" tag）
-    to = msg.get("to") or ""
-    has_tag = "tag=" in to
-    routes = msg.headers.get("route", [])
-    targeted_us = any(SERVER_IP in r or str(SERVER_PORT) in r for r in routes)
-    return (not has_tag) or targeted_us  # 宽松判断即可
+    to = msg.get("to")
+    if to is None or "tag=" not in to:
+        return True
+    # 只看顶层 Route（RFC 3261 按顶层 Route 路由）
+    routes = msg.headers.get("route")
+    if routes:
+        return _route_targets_us(routes[0])
+    return False  # 宽松判断即可
 
 def _strip_our_top_route_and_get_next(msg: SIPMessage) -> None:
     routes = msg.headers.get("route", [])
     if not routes:
         return
-    top = routes[0]
-    if SERVER_IP in top or str(SERVER_PORT) in top:
+    if _route_targets_us(routes[0]):
         routes.pop(0)
         if routes:
             msg.headers["route"] = routes
@@ -337,25 +458,84 @@ def _add_record_route_for_initial(msg: SIPMessage):
     msg.add_header("record-route", f"<{SERVER_URI}>")
 
 def _make_response(req: SIPMessage, code: int, reason: str, extra_headers: dict | None = None, body: bytes = b"") -> SIPMessage:
-    r = SIPMessage(start_line=f"SIP/2.0 {code} {reason}")
-    for v in req.headers.get("via", []):
-        r.add_header("via", v)
     to_val = req.get("to") or ""
     if "tag=" not in to_val and code >= 200:
         to_val = f"{to_val};tag={gen_tag()}"
-    r.add_header("to", to_val)
-    r.add_header("from", req.get("from") or "")
-    r.add_header("call-id", req.get("call-id") or "")
-    r.add_header("cseq", req.get("cseq") or "")
-    r.add_header("server", "ims-sip-server/0.0.3")
-    r.add_header("allow", ALLOW)
-    r.add_header("date", sip_date())
-    r.add_header("content-length", "0" if not body else str(len(body)))
+    # 一次性构建头域字典（顺序即输出顺序）
+    hdrs = {}
+    vias = req.headers.get("via")
+    if vias:
+        hdrs["via"] = list(vias)
+    hdrs["to"] = [to_val]
+    hdrs["from"] = [req.get("from") or ""]
+    hdrs["call-id"] = [req.get("call-id") or ""]
+    hdrs["cseq"] = [req.get("cseq") or ""]
+    hdrs["server"] = ["ims-sip-server/0.0.3"]
+    hdrs["allow"] = [ALLOW]
+    hdrs["date"] = [sip_date()]
+    hdrs["content-length"] = ["0" if not body else str(len(body))]
+    r = SIPMessage(start_line=f"SIP/2.0 {code} {reason}", headers=hdrs)
     if extra_headers:
         for k, v in extra_headers.items():
             r.add_header(k, v)
     return r
 
+# 简单响应（无额外头域、无消息体）的起始行缓存：(code, reason) -> "SIP/2.0 code reason\r\n"
+_RESP_START_LINES: dict[tuple[int, str], str] = {}
+# 简单响应中固定不变的头域（与 _make_response 的顺序和格式一致）
+_RESP_FIXED_HEADERS = f"Server: ims-sip-server/0.0.3\r\nAllow: {ALLOW}\r\nDate: "
+# 简单响应的结尾（无消息体）
+_RESP_TAIL = "Content-Length: 0\r\n\r\n"
+# OPTIONS 200 OK 的结尾：额外头域固定不变，预先拼好
+_OPTIONS_200_TAIL = "Content-Length: 0\r\nAccept: application/sdp\r\nSupported: 100rel, timer, path\r\n\r\n"
+
+def _fast_response_bytes(req: SIPMessage, code: int, reason: str, tail: str = _RESP_TAIL) -> bytes:
+    """
+    直接拼接简单响应的字节串，输出与 _make_response(req, code, reason).to_bytes() 一致
+    
+    跳过 SIPMessage 构造和逐个 add_header，用于 100/4xx/5xx 等无额外头域的响应；
+    tail 为 Content-Length 起的固定结尾（如 _OPTIONS_200_TAIL）
+    """
+    start = _RESP_START_LINES.get((code, reason))
+    if start is None:
+        start = _RESP_START_LINES[(code, reason)] = f"SIP/2.0 {code} {reason}\r\n"
+    to_val = req.get("to") or ""
+    if "tag=" not in to_val and code >= 200:
+        to_val = f"{to_val};tag={gen_tag()}"
+    vias = "".join(f"Via: {v}\r\n" for v in req.headers.get("via", ()))
+    return (
+        f"{start}{vias}To: {to_val}\r\nFrom: {req.get('from') or ''}\r\n"
+        f"Call-Id: {req.get('call-id') or ''}\r\nCseq: {req.get('cseq') or ''}\r\n"
+        f"{_RESP_FIXED_HEADERS}{sip_date()}\r\n{tail}"
+    ).encode()
+
+def _send_simple_response(transport, addr, req: SIPMessage, code: int, reason: str, extra: str = ""):
+    """发送简单响应并记录日志"""
+    transport.sendto(_fast_response_bytes(req, code, reason), addr)
+    log.tx(addr, f"SIP/2.0 {code} {reason}", extra=extra)
+
+# 重发 INVITE 的 100 Trying 缓存：Call-ID -> (顶层 Via, CSeq, 响应字节)
+# 同一事务的重发报文 Via/CSeq 相同，直接复用首次生成的字节（Date 保持首次应答时的值）
+_TRYING_CACHE: dict[str, tuple[str | None, str | None, bytes]] = {}
+_TRYING_CACHE_MAX = 1024
+
+def _send_cached_trying(transport, addr, req: SIPMessage, call_id: str):
+    """对重发的初始 INVITE 回 100 Trying，同一事务只拼接一次"""
+    vias = req.headers.get("via")
+    top_via = vias[0] if vias else None
+    cseq = req.get("cseq")
+    cached = _TRYING_CACHE.get(call_id)
+    if cached is not None and cached[0] == top_via and cached[1] == cseq:
+        data = cached[2]
+    else:
+        data = _fast_response_bytes(req, 100, "Trying")
+        if len(_TRYING_CACHE) >= _TRYING_CACHE_MAX:
+            # 条目带校验，整体清空即可，无需逐个淘汰
+            _TRYING_CACHE.clear()
+        _TRYING_CACHE[call_id] = (top_via, cseq, data)
+    transport.sendto(data, addr)
+    log.tx(addr, "SIP/2.0 100 Trying", extra="duplicate INVITE handling")
+
 # ====== 业务处理 ======
 
 def handle_register(msg: SIPMessage, addr, transport):
@@ -381,9 +561,7 @@ def handle_register(msg: SIPMessage, addr, transport):
 
     aor = _aor_from_to(msg.get("to"))
     if not aor:
-        resp = _make_response(msg, 400, "Bad Request")
-        transport.sendto(resp.to_bytes(), addr)
-        log.tx(addr, resp.start_line)
+        _send_simple_response(transport, addr, msg, 400, "Bad Request")
         return
 
     binds = _parse_contacts(msg)
@@ -393,31 +571,39 @@ def handle_register(msg: SIPMessage, addr, transport):
     for b in binds:
         contact = b["contact"]
         # 提取 sip:user@IP:port
-        import re
-        contact = re.sub(r"@[^;>]+", f"@{addr[0]}:{addr[1]}", contact)
+        contact = _RE_URI_HOST.sub(f"@{addr[0]}:{addr[1]}", contact)
         b["contact"] = contact
         fixed_binds.append(b)
     binds = fixed_binds
     # ------------------------------------
 
-    now = int(time.time())
-    lst = REG_BINDINGS.setdefault(aor, [])
-    lst[:] = [b for b in lst if b["expires"] > now]
-    for b in binds:
-        if b["expires"] == 0:
-            lst[:] = [x for x in lst if x["contact"] != b["contact"]]
-        else:
-            abs_exp = now + b["expires"]
-            for x in lst:
-                if x["contact"] == b["contact"]:
-                    x["expires"] = abs_exp
-                    break
-            else:
-                lst.append({"contact": b["contact"], "expires": abs_exp})
+    now = _now()
+    with REG_LOCK:
+        lst = REG_BINDINGS.setdefault(aor, [])
+        # 本次请求的绑定按 contact 建索引（同一 contact 以最后一条为准），单次遍历完成过期清理、刷新和注销
+        updates = {b["contact"]: b["expires"] for b in binds}
+        kept = []
+        for x in lst:
+            if x["expires"] <= now:
+                continue
+            exp = updates.pop(x["contact"], None)
+            if exp is None:
+                kept.append(x)
+            elif exp:
+                x["expires"] = now + exp
+                kept.append(x)
+        # 剩余的是新增绑定（expires=0 的注销请求忽略）
+        for contact, exp in updates.items():
+            if exp:
+                kept.append({"contact": contact, "expires": now + exp})
+        lst[:] = kept
+        if not lst:
+            _AOR_PRIMARY.pop(aor, None)
 
     resp = _make_response(msg, 200, "OK")
-    for b in lst:
-        resp.add_header("contact", f"<{b['contact']}>")
+    if lst:
+        # 直接追加到 Contact 列表，避免每条绑定都调用 add_header
+        resp.headers.setdefault("contact", []).extend([f"<{b['contact']}>" for b in lst])
     transport.sendto(resp.to_bytes(), addr)
     log.tx(addr, resp.start_line, extra=f"bindings={len(lst)}")
     
@@ -451,6 +637,302 @@ def handle_register(msg: SIPMessage, addr, transport):
             server_port=SERVER_PORT
         )
 
+@dataclass(slots=True)
+class _FwdContext:
+    """单个请求转发过程中各阶段共享的已解析字段"""
+    method: str
+    to_hdr: str
+    to_aor: str
+    call_id: str | None
+    sl_parts: list[str]          # start_line.split() 的结果，R-URI 改写直接修改 sl_parts[1]
+    ruri_changed: bool = False   # R-URI 被改写过，发送前需回写 start_line
+    dialog: tuple | None = None  # DIALOGS 中的 (主叫地址, 被叫地址)，入口处查一次
+    has_route: bool = False      # 删除我们的 Route 之前是否带有 Route（用于 ACK 类型判断）
+    is_2xx_ack: bool = False
+
+def _add_via_and_defaults(msg: SIPMessage, ctx: _FwdContext, branch: str):
+    """加顶层 Via，并为缺失的关键头域兜底（兜底值同步到 ctx）"""
+    _add_top_via(msg, branch)
+
+    # 如果没有 Max-Forwards、CSeq 等关键头，给个兜底（少见）
+    h = msg.headers
+    h.setdefault("cseq", ["1 " + ctx.method])
+    if "from" not in h:
+        h["from"] = ["<sip:unknown@localhost>;tag=" + gen_tag()]
+    if "to" not in h:
+        ctx.to_hdr = "<sip:unknown@localhost>"
+        ctx.to_aor = _aor_from_to(ctx.to_hdr)
+        h["to"] = [ctx.to_hdr]
+    if "call-id" not in h:
+        ctx.call_id = gen_tag() + "@localhost"
+        h["call-id"] = [ctx.call_id]
+
+def _route_initial(msg: SIPMessage, addr, transport, ctx: _FwdContext) -> bool:
+    """初始 INVITE/MESSAGE：查位置，改 R-URI，插入 Record-Route；无绑定时回 480 并返回 False"""
+    method = ctx.method
+    to_aor = ctx.to_aor
+    # --- IMS 模式: 删除 UA 自带的 Route，清理 ;ob 参数 ---
+    route_count = len(msg.headers.get("route", []))
+    if route_count > 0:
+        if log.debug_on:
+            log.debug(f"[{method}-INITIAL] Deleting {route_count} Route headers")
+    msg.headers.pop("route", None)
+
+    # 解析被叫 AOR
+    aor = to_aor or ctx.sl_parts[1]
+    if log.debug_on:
+        log.debug(f"[{method}-INITIAL] AOR: {aor} | To: {ctx.to_hdr}")
+    hit = _lookup_binding(aor, _now())
+    if log.debug_on:
+        log.debug(f"[{method}-INITIAL] Valid binding for AOR {aor}: {hit[0] if hit else None}")
+    if not hit:
+        log.warning(f"[{method}-INITIAL] No valid bindings for AOR: {aor}")
+        _send_simple_response(transport, addr, msg, 480, "Temporarily Unavailable", extra=f"aor={aor}")
+        return False
+
+    # 取第一个绑定的 contact，去掉 ;ob / ;transport 等参数
+    target_uri = hit[0]
+    target_uri = _RE_OB.sub("", target_uri)
+    target_uri = _RE_TRANSPORT.sub("", target_uri)
+
+    # 改写 Request-URI
+    ctx.sl_parts[1] = target_uri
+    ctx.ruri_changed = True
+    # --- 修正 From / To 防环路 ---
+    try:
+        from_aor = _aor_from_from(msg.get("from"))
+
+        # 如果主叫和被叫用户名相同（同一UA呼自己）
+        if _same_user(from_aor, to_aor):
+            # 强制改写被叫为目标AOR（即被叫注册的Contact）
+            hit = _lookup_binding(to_aor)
+            if hit:
+                target_uri = hit[0]
+                # 改写Request-URI
+                ctx.sl_parts[1] = target_uri
+                # 修正From为主叫AOR
+                for aor, binds in REG_BINDINGS.items():
+                    for b in binds:
+                        ip, port = _host_port_from_sip_uri(b["contact"])
+                        if addr[1] == port:
+                            msg.headers["from"] = [f"<{aor}>;tag={gen_tag()}"]
+                            break
+    except Exception as e:
+        log.warning(f"From/To normalize failed: {e}")
+
+    # 插入 Record-Route（RFC 3261 强制要求）
+    # 当代理修改 R-URI 时，必须添加 Record-Route，
+    # 这样后续的 in-dialog 请求（如 ACK, BYE）会通过 Route 头路由回代理
+    _add_record_route_for_initial(msg)
+    if log.debug_on:
+        log.debug(f"[RECORD-ROUTE] Added Record-Route for initial INVITE")
+    return True
+
+# ---- 按方法分派的转发前处理 ----
+# 每个处理函数负责本方法特有的 R-URI 修正 / 初始请求定位 / 顶层 Via，
+# 返回 False 表示请求已就地应答（如 480），不再继续转发。
+#
+# 顶层 Via（我们）
+# RFC 3261: 
+# - INVITE: 有状态代理，添加服务器 Via，并保存 branch（用于 CANCEL 复用）
+# - CANCEL: 有状态代理，复用对应 INVITE 的 branch（兼容非标准客户端如 Zoiper 2.x）
+# - ACK (非2xx): 有状态代理，复用对应 INVITE 的 branch，添加服务器 Via（确保 Via 栈与 INVITE 一致）
+# - ACK (2xx): 无状态转发，不添加 Via（正常对话建立后的 ACK）
+# - 其他请求: 有状态代理，添加服务器 Via
+# 
+# RFC 3261 Section 9.1 关于 CANCEL:
+# "The CANCEL request uses the same Via headers as the request being cancelled"
+# 标准理解：客户端的 Via 头相同（branch 参数相同），代理可以添加不同的 Via branch
+# 但 Zoiper 2.x 要求整个 Via 栈都匹配，因此需要复用 INVITE 的 branch
+# 
+# RFC 3261 Section 17.2.3 关于非 2xx ACK:
+# "The ACK MUST have the same Via branch identifier and Call-ID as the INVITE
+#  to which it refers, but only the methods differ."
+# 作为有状态代理，为了匹配原始 INVITE 的 Via 栈，需要复用 INVITE 的 branch
+#
+# CANCEL/ACK/BYE/UPDATE 请求特殊处理：修正 R-URI（去除外部 IP 和 ;ob 参数，使用本地地址）
+# RFC 3261 重要规则：
+# - CANCEL：R-URI 必须和对应的 INVITE 转发后的 R-URI 一致
+# - 非 2xx 响应的 ACK：R-URI 必须与原始 INVITE 相同，不能修改！
+# - 2xx 响应的 ACK：R-URI 应该使用 Contact 头中的地址，可以修改
+# - BYE/UPDATE：对话内请求，可以修改
+
+def _fwd_invite(msg: SIPMessage, addr, transport, ctx: _FwdContext) -> bool:
+    if _is_initial_request(msg) and not _route_initial(msg, addr, transport, ctx):
+        return False
+    # 生成新的 branch，并保存供后续 CANCEL 和 ACK 使用
+    branch = f"z9hG4bK-{gen_tag(10)}"
+    call_id = ctx.call_id
+    if call_id:
+        INVITE_BRANCHES[call_id] = branch
+        if log.debug_on:
+            log.debug(f"[INVITE] Saved branch: {branch} for Call-ID: {call_id}")
+    _add_via_and_defaults(msg, ctx, branch)
+    return True
+
+def _fwd_message(msg: SIPMessage, addr, transport, ctx: _FwdContext) -> bool:
+    if _is_initial_request(msg) and not _route_initial(msg, addr, transport, ctx):
+        return False
+    _add_via_and_defaults(msg, ctx, f"z9hG4bK-{gen_tag(10)}")
+    return True
+
+def _fwd_cancel(msg: SIPMessage, addr, transport, ctx: _FwdContext) -> bool:
+    # CANCEL R-URI 修正逻辑
+    # RFC 3261: CANCEL 的 R-URI 必须和对应的 INVITE 一致
+    # 由于服务器转发 INVITE 时已经修改了 R-URI，CANCEL 也必须使用相同的修正后的 R-URI
+    try:
+        ruri = ctx.sl_parts[1]
+        # 如果 R-URI 指向服务器地址，需要修正为实际被叫地址
+        # 检查 R-URI 是否指向服务器地址或本地地址
+        if _RE_SELF_RURI.search(ruri):
+            # 提取被叫 AOR（从 To 头）
+            aor = ctx.to_aor
+            if not aor:
+                # 如果 To 头没有 AOR，从 R-URI 提取
+                aor = _aor_from_to(ruri)
+            
+            hit = _lookup_binding(aor, _now())
+            if hit:
+                target_uri = hit[0]
+                # 完全移除所有参数（包括 ;ob, transport 等）
+                target_uri = _RE_SEMI_PARAMS.sub("", target_uri)  # 移除所有 ; 开始的参数
+                target_uri = target_uri.strip()
+                # 改写 R-URI
+                ctx.sl_parts[1] = target_uri
+                ctx.ruri_changed = True
+                if log.debug_on:
+                    log.debug(f"CANCEL R-URI corrected: {ruri} -> {target_uri}")
+    except Exception as e:
+        log.warning(f"CANCEL R-URI correction failed: {e}")
+
+    # 为 CANCEL 复用对应 INVITE 的 branch
+    call_id = ctx.call_id
+    branch = INVITE_BRANCHES.get(call_id) if call_id else None
+    if branch:
+        if log.debug_on:
+            log.debug(f"[CANCEL] Reusing INVITE branch: {branch} for Call-ID: {call_id}")
+    else:
+        branch = f"z9hG4bK-{gen_tag(10)}"
+    _add_via_and_defaults(msg, ctx, branch)
+    return True
+
+def _fwd_bye_update(msg: SIPMessage, addr, transport, ctx: _FwdContext) -> bool:
+    # BYE 和 UPDATE：对话内请求，可以修正 R-URI
+    method = ctx.method
+    try:
+        ruri = ctx.sl_parts[1]
+        # 如果 R-URI 包含外部 IP 或 ;ob 参数，需要修正
+        if _RE_FIXUP_RURI.search(ruri):
+            # 从 To 头获取被叫 AOR
+            if ctx.to_aor:
+                # 查找该 AOR 的本地 contact
+                hit = _lookup_binding(ctx.to_aor)
+                if hit:
+                    target_uri = hit[0]
+                    # 完全移除所有参数（包括 ;ob, transport 等）
+                    # 先清理 URI，提取基本地址
+                    target_uri = _RE_SEMI_PARAMS.sub("", target_uri)  # 移除所有 ; 开始的参数
+                    target_uri = target_uri.strip()
+                    # 改写 R-URI
+                    ctx.sl_parts[1] = target_uri
+                    ctx.ruri_changed = True
+                    # 清理 Route 和 Record-Route 头，避免 ;ob 和参数问题
+                    msg.headers.pop("route", None)
+                    msg.headers.pop("record-route", None)
+                    if log.debug_on:
+                        log.debug(f"{method} R-URI corrected: {ruri} -> {target_uri}")
+    except Exception as e:
+        log.warning(f"{method} R-URI correction failed: {e}")
+    _add_via_and_defaults(msg, ctx, f"z9hG4bK-{gen_tag(10)}")
+    return True
+
+def _fwd_ack(msg: SIPMessage, addr, transport, ctx: _FwdContext) -> bool:
+    # ACK 特殊处理：区分 2xx 和非 2xx 响应
+    # RFC 3261: 
+    # - 2xx ACK：通过 Route 头路由（保留 Route）
+    # - 非 2xx ACK：透传，保持所有头域不变（包括 R-URI）
+    
+    # 判断方法：
+    # 1. 检查原始 Route 头（删除服务器 Route 之前）：2xx ACK 有 Route
+    # 2. 检查 To tag：2xx ACK 必须有 To tag
+    # 3. 检查 DIALOGS：Call-ID 在 DIALOGS 说明是已建立的对话
+    call_id = ctx.call_id
+    in_dialog = ctx.dialog is not None
+    has_route_before_strip = ctx.has_route
+    to_tag = "tag=" in ctx.to_hdr
+    
+    # 改进的 ACK 类型判断：优先使用最后响应状态
+    # 1. 如果有最后响应状态记录，直接使用（最准确）
+    # 2. 否则，使用 Route 头和有 To tag 的判断（兼容旧逻辑）
+    last_status = LAST_RESPONSE_STATUS.get(call_id) if call_id else None
+    
+    # 详细日志：记录 ACK 类型判断的完整过程
+    log.info(f"[ACK-TYPE-CHECK] Call-ID: {call_id} | Last status: {last_status} | To tag: {to_tag} | Has Route: {has_route_before_strip} | In DIALOGS: {in_dialog}")
+    
+    if last_status:
+        # 有响应状态记录：根据状态码判断
+        if last_status.startswith("2"):
+            # 2xx 响应：2xx ACK
+            is_2xx_ack = True
+            log.info(f"[ACK-TYPE] Determined as 2xx ACK: Last response status={last_status} (from LAST_RESPONSE_STATUS)")
+        else:
+            # 非 2xx 响应：非 2xx ACK
+            is_2xx_ack = False
+            log.info(f"[ACK-TYPE] Determined as non-2xx ACK: Last response status={last_status} (from LAST_RESPONSE_STATUS)")
+    elif (has_route_before_strip and to_tag) or (to_tag and in_dialog):
+        # 没有响应状态记录：使用旧逻辑判断
+        # 2xx ACK：有原始 Route 头或 Call-ID 在 DIALOGS
+        is_2xx_ack = True
+        log.info(f"[ACK-TYPE] Determined as 2xx ACK (fallback): Original Route={has_route_before_strip}, To tag=YES, Dialog={in_dialog}")
+        log.warning(f"[ACK-TYPE-WARNING] Using fallback logic for Call-ID {call_id}: No LAST_RESPONSE_STATUS record! This may be incorrect if it's a non-2xx ACK.")
+        # ACK 成功转发后，可以清理 DIALOGS（会话已确认建立）
+        if in_dialog:
+            if log.debug_on:
+                log.debug(f"[ACK-RECEIVED] ACK for Call-ID {call_id}, dialog confirmed")
+    else:
+        # 非 2xx ACK：透传，不修改任何头域
+        is_2xx_ack = False
+        log.info(f"[ACK-TYPE] Determined as non-2xx ACK (fallback): Original Route={has_route_before_strip}, To tag={to_tag}")
+    ctx.is_2xx_ack = is_2xx_ack
+
+    # 根据 ACK 类型处理 Via
+    if not is_2xx_ack:
+        # 非 2xx ACK：检查是否有 INVITE_BRANCHES
+        branch = INVITE_BRANCHES.get(call_id) if call_id else None
+        if branch:
+            # 有状态代理，复用 INVITE 的 branch，添加服务器 Via
+            # 确保被叫收到的 ACK 的 Via 栈与原始 INVITE 一致：[服务器Via, 主叫Via]
+            _add_top_via(msg, branch)
+            log.info(f"[ACK-STATE] Non-2xx ACK: Reusing INVITE branch {branch} and adding server Via (stateful proxy mode)")
+        else:
+            # 非 2xx ACK 但没有 INVITE_BRANCHES（可能已被清理或 INVITE 未保存）
+            log.warning(f"[ACK-WARNING] Non-2xx ACK for Call-ID {call_id} but INVITE_BRANCHES not found! Cannot add server Via. This may cause the callee to not recognize the ACK.")
+            if log.debug_on:
+                log.debug(f"[ACK-STATELESS] Non-2xx ACK: Forwarding without adding Via (INVITE_BRANCHES missing)")
+    else:
+        # 2xx ACK：无状态转发，不修改 Via（正常对话建立后的 ACK，不需要匹配原始 INVITE）
+        if log.debug_on:
+            log.debug(f"[ACK-STATELESS] 2xx ACK: Forwarding without adding Via (stateless proxy mode)")
+    return True
+
+def _fwd_generic(msg: SIPMessage, addr, transport, ctx: _FwdContext) -> bool:
+    _add_via_and_defaults(msg, ctx, f"z9hG4bK-{gen_tag(10)}")
+    return True
+
+_METHOD_DISPATCH = {
+    "INVITE": _fwd_invite,
+    "MESSAGE": _fwd_message,
+    "CANCEL": _fwd_cancel,
+    "BYE": _fwd_bye_update,
+    "UPDATE": _fwd_bye_update,
+    "ACK": _fwd_ack,
+}
+
+# 需要用注册绑定修正目标地址并记录 PENDING_REQUESTS 的方法
+_BINDING_ROUTED_METHODS = frozenset(("INVITE", "BYE", "CANCEL", "UPDATE", "PRACK", "MESSAGE", "REFER", "NOTIFY", "SUBSCRIBE"))
+# 无绑定时直接回 480 的方法
+_UNAVAILABLE_480_METHODS = frozenset(("MESSAGE", "REFER", "NOTIFY", "SUBSCRIBE"))
+
 def _forward_request(msg: SIPMessage, addr, transport):
     """
     将请求转发到下一跳：
@@ -459,32 +941,37 @@ def _forward_request(msg: SIPMessage, addr, transport):
     - 统一：加顶层 Via、递减 Max-Forwards
     """
     method = _method_of(msg)
+    # 常用头域只解析一次（下文不会改写 To / Call-ID，缺失时的兜底值会同步更新到 ctx）
+    # 热路径上频繁访问的属性绑定为局部变量
+    headers = msg.headers
+    mget = msg.get
+    to_hdr = mget("to") or ""
+    # start line 只切分一次，R-URI 的读取与改写都基于 sl_parts
+    ctx = _FwdContext(method, to_hdr, _aor_from_to(to_hdr), mget("call-id"), msg.start_line.split())
+    call_id = ctx.call_id
+    # 对话状态只查一次（本函数内不会改动该 Call-ID 的 DIALOGS 记录，直到发送后的清理）
+    if call_id:
+        ctx.dialog = DIALOGS.get(call_id)
 
     # 忽略/丢弃 Max-Forwards<=0
     if not _decrement_max_forwards(msg):
-        resp = _make_response(msg, 483, "Too Many Hops")
-        transport.sendto(resp.to_bytes(), addr)
-        log.tx(addr, resp.start_line)
+        _send_simple_response(transport, addr, msg, 483, "Too Many Hops")
         return
 
     # 在删除 Route 之前，先保存 Route 信息（用于 ACK 类型判断）
-    call_id = msg.get("call-id")
-    original_routes = msg.headers.get("route", [])
-    has_route_before_strip = len(original_routes) > 0
+    ctx.has_route = bool(headers.get("route"))
 
     # in-dialog：如果顶层 Route 就是我们，弹掉它
     _strip_our_top_route_and_get_next(msg)
 
     # 防止重复请求：检查 Call-ID 是否已经在 DIALOGS 中（可能是重发）
-    call_id = msg.get("call-id")
-    if call_id and call_id in DIALOGS:
+    if ctx.dialog is not None:
         # 区分重发的初始 INVITE 和 re-INVITE
         if method == "INVITE":
             # 通过 To 头的 tag 参数区分：
             # - 初始 INVITE：To 头没有 tag
             # - re-INVITE：To 头有 tag（对话已建立）
-            to_header = msg.get("to") or ""
-            has_to_tag = "tag=" in to_header
+            has_to_tag = "tag=" in to_hdr
             
             if has_to_tag:
                 # re-INVITE：对话内的媒体协商（hold/resume/add video 等）
@@ -492,260 +979,33 @@ def _forward_request(msg: SIPMessage, addr, transport):
                 # 继续处理，不 return
             else:
                 # 重发的初始 INVITE：返回 100 Trying，不转发
-                log.debug(f"[DUPLICATE] Initial INVITE retransmission for Call-ID: {call_id}")
-                resp = _make_response(msg, 100, "Trying")
-                transport.sendto(resp.to_bytes(), addr)
-                log.tx(addr, resp.start_line, extra="duplicate INVITE handling")
+                if log.debug_on:
+                    log.debug(f"[DUPLICATE] Initial INVITE retransmission for Call-ID: {call_id}")
+                _send_cached_trying(transport, addr, msg, call_id)
                 return
         # 其他 in-dialog 请求（BYE, UPDATE等）继续处理
-        log.debug(f"[REQ-TRACK] Call-ID {call_id} is in DIALOGS, treating as in-dialog {method} request")
-
-    # CANCEL/ACK/BYE/UPDATE 请求特殊处理：修正 R-URI（去除外部 IP 和 ;ob 参数，使用本地地址）
-    # RFC 3261 重要规则：
-    # - CANCEL：R-URI 必须和对应的 INVITE 转发后的 R-URI 一致
-    # - 非 2xx 响应的 ACK：R-URI 必须与原始 INVITE 相同，不能修改！
-    # - 2xx 响应的 ACK：R-URI 应该使用 Contact 头中的地址，可以修改
-    # - BYE/UPDATE：对话内请求，可以修改
-    if method == "CANCEL":
-        # CANCEL R-URI 修正逻辑
-        # RFC 3261: CANCEL 的 R-URI 必须和对应的 INVITE 一致
-        # 由于服务器转发 INVITE 时已经修改了 R-URI，CANCEL 也必须使用相同的修正后的 R-URI
-        try:
-            ruri = msg.start_line.split()[1]
-            # 如果 R-URI 指向服务器地址，需要修正为实际被叫地址
-            # 检查 R-URI 是否指向服务器地址或本地地址
-            if f"{SERVER_IP}" in ruri or "127.0.0.1" in ruri:
-                # 提取被叫 AOR（从 To 头）
-                aor = _aor_from_to(msg.get("to"))
-                if not aor:
-                    # 如果 To 头没有 AOR，从 R-URI 提取
-                    aor = _aor_from_to(ruri)
-                
-                targets = REG_BINDINGS.get(aor, [])
-                now = int(time.time())
-                targets = [t for t in targets if t["expires"] > now]
-                if targets:
-                    target_uri = targets[0]["contact"]
-                    # 完全移除所有参数（包括 ;ob, transport 等）
-                    import re
-                    target_uri = re.sub(r";[^,]*", "", target_uri)  # 移除所有 ; 开始的参数
-                    target_uri = target_uri.strip()
-                    # 改写 R-URI
-                    parts = msg.start_line.split()
-                    original_ruri = parts[1]
-                    parts[1] = target_uri
-                    msg.start_line = " ".join(parts)
-                    log.debug(f"CANCEL R-URI corrected: {original_ruri} -> {target_uri}")
-        except Exception as e:
-            log.warning(f"CANCEL R-URI correction failed: {e}")
-    elif method in ("BYE", "UPDATE"):
-        # BYE 和 UPDATE：对话内请求，可以修正 R-URI
-        try:
-            ruri = msg.start_line.split()[1]
-            # 如果 R-URI 包含外部 IP 或 ;ob 参数，需要修正
-            if ";ob" in ruri or "@100." in ruri or "@192." in ruri or "@172." in ruri:
-                # 从 To 头获取被叫 AOR
-                to_val = msg.get("to")
-                to_aor = _aor_from_to(to_val)
-                if to_aor:
-                    # 查找该 AOR 的本地 contact
-                    targets = REG_BINDINGS.get(to_aor, [])
-                    if targets:
-                        target_uri = targets[0]["contact"]
-                        # 完全移除所有参数（包括 ;ob, transport 等）
-                        import re
-                        # 先清理 URI，提取基本地址
-                        target_uri = re.sub(r";[^,]*", "", target_uri)  # 移除所有 ; 开始的参数
-                        target_uri = target_uri.strip()
-                        # 改写 R-URI
-                        parts = msg.start_line.split()
-                        parts[1] = target_uri
-                        msg.start_line = " ".join(parts)
-                        # 清理 Route 和 Record-Route 头，避免 ;ob 和参数问题
-                        msg.headers.pop("route", None)
-                        msg.headers.pop("record-route", None)
-                        log.debug(f"{method} R-URI corrected: {ruri} -> {target_uri}")
-        except Exception as e:
-            log.warning(f"{method} R-URI correction failed: {e}")
-    # ACK 类型判断（用于后续处理）
-    is_2xx_ack = False
-    if method == "ACK":
-        # ACK 特殊处理：区分 2xx 和非 2xx 响应
-        # RFC 3261: 
-        # - 2xx ACK：通过 Route 头路由（保留 Route）
-        # - 非 2xx ACK：透传，保持所有头域不变（包括 R-URI）
-        
-        # 判断方法：
-        # 1. 检查原始 Route 头（删除服务器 Route 之前）：2xx ACK 有 Route
-        # 2. 检查 To tag：2xx ACK 必须有 To tag
-        # 3. 检查 DIALOGS：Call-ID 在 DIALOGS 说明是已建立的对话
-        to_tag = "tag=" in (msg.get("to") or "")
-        
-        # 改进的 ACK 类型判断：优先使用最后响应状态
-        # 1. 如果有最后响应状态记录，直接使用（最准确）
-        # 2. 否则，使用 Route 头和有 To tag 的判断（兼容旧逻辑）
-        last_status = LAST_RESPONSE_STATUS.get(call_id) if call_id else None
-        
-        # 详细日志：记录 ACK 类型判断的完整过程
-        log.info(f"[ACK-TYPE-CHECK] Call-ID: {call_id} | Last status: {last_status} | To tag: {to_tag} | Has Route: {has_route_before_strip} | In DIALOGS: {call_id in DIALOGS if call_id else False}")
-        
-        if last_status:
-            # 有响应状态记录：根据状态码判断
-            if last_status.startswith("2"):
-                # 2xx 响应：2xx ACK
-                is_2xx_ack = True
-                log.info(f"[ACK-TYPE] Determined as 2xx ACK: Last response status={last_status} (from LAST_RESPONSE_STATUS)")
-            else:
-                # 非 2xx 响应：非 2xx ACK
-                is_2xx_ack = False
-                log.info(f"[ACK-TYPE] Determined as non-2xx ACK: Last response status={last_status} (from LAST_RESPONSE_STATUS)")
-        elif (has_route_before_strip and to_tag) or (to_tag and call_id and call_id in DIALOGS):
-            # 没有响应状态记录：使用旧逻辑判断
-            # 2xx ACK：有原始 Route 头或 Call-ID 在 DIALOGS
-            is_2xx_ack = True
-            log.info(f"[ACK-TYPE] Determined as 2xx ACK (fallback): Original Route={has_route_before_strip}, To tag=YES, Dialog={call_id in DIALOGS if call_id else False}")
-            log.warning(f"[ACK-TYPE-WARNING] Using fallback logic for Call-ID {call_id}: No LAST_RESPONSE_STATUS record! This may be incorrect if it's a non-2xx ACK.")
-            # ACK 成功转发后，可以清理 DIALOGS（会话已确认建立）
-            if call_id and call_id in DIALOGS:
-                log.debug(f"[ACK-RECEIVED] ACK for Call-ID {call_id}, dialog confirmed")
-        else:
-            # 非 2xx ACK：透传，不修改任何头域
-            is_2xx_ack = False
-            log.info(f"[ACK-TYPE] Determined as non-2xx ACK (fallback): Original Route={has_route_before_strip}, To tag={to_tag}")
-
-    # 初始 INVITE/MESSAGE/其他初始请求：查位置，改 R-URI
-    if method in ("INVITE", "MESSAGE") and _is_initial_request(msg):
-        # --- IMS 模式: 删除 UA 自带的 Route，清理 ;ob 参数 ---
-        route_count = len(msg.headers.get("route", []))
-        if route_count > 0:
-            log.debug(f"[{method}-INITIAL] Deleting {route_count} Route headers")
-        msg.headers.pop("route", None)
-
-        # 解析被叫 AOR
-        aor = _aor_from_to(msg.get("to")) or msg.start_line.split()[1]
-        log.debug(f"[{method}-INITIAL] AOR: {aor} | To: {msg.get('to')}")
-        targets = REG_BINDINGS.get(aor, [])
-        now = int(time.time())
-        targets = [t for t in targets if t["expires"] > now]
-        log.debug(f"[{method}-INITIAL] Found {len(targets)} valid bindings for AOR: {aor}")
-        if not targets:
-            log.warning(f"[{method}-INITIAL] No valid bindings for AOR: {aor}")
-            resp = _make_response(msg, 480, "Temporarily Unavailable")
-            transport.sendto(resp.to_bytes(), addr)
-            log.tx(addr, resp.start_line, extra=f"aor={aor}")
-            return
-
-        # 取第一个绑定的 contact，去掉 ;ob / ;transport 等参数
-        import re
-        target_uri = targets[0]["contact"]
-        target_uri = re.sub(r";ob\b", "", target_uri)
-        target_uri = re.sub(r";transport=\w+", "", target_uri)
-
-        # 改写 Request-URI
-        parts = msg.start_line.split()
-        parts[1] = target_uri
-        msg.start_line = " ".join(parts)
-        # --- 修正 From / To 防环路 ---
-        try:
-            from_aor = _aor_from_from(msg.get("from"))
-            to_aor = _aor_from_to(msg.get("to"))
-
-            # 如果主叫和被叫用户名相同（同一UA呼自己）
-            if _same_user(from_aor, to_aor):
-                # 强制改写被叫为目标AOR（即被叫注册的Contact）
-                targets = REG_BINDINGS.get(to_aor, [])
-                if targets:
-                    target_uri = targets[0]["contact"]
-                    # 改写Request-URI
-                    parts = msg.start_line.split()
-                    parts[1] = target_uri
-                    msg.start_line = " ".join(parts)
-                    # 修正From为主叫AOR
-                    for aor, binds in REG_BINDINGS.items():
-                        for b in binds:
-                            ip, port = _host_port_from_sip_uri(b["contact"])
-                            if addr[1] == port:
-                                msg.headers["from"] = [f"<{aor}>;tag={gen_tag()}"]
-                                break
-        except Exception as e:
-            log.warning(f"From/To normalize failed: {e}")
-
-        # 插入 Record-Route（RFC 3261 强制要求）
-        # 当代理修改 R-URI 时，必须添加 Record-Route，
-        # 这样后续的 in-dialog 请求（如 ACK, BYE）会通过 Route 头路由回代理
-        _add_record_route_for_initial(msg)
-        log.debug(f"[RECORD-ROUTE] Added Record-Route for initial INVITE")
-
-    # 顶层 Via（我们）
-    # RFC 3261: 
-    # - INVITE: 有状态代理，添加服务器 Via，并保存 branch（用于 CANCEL 复用）
-    # - CANCEL: 有状态代理，复用对应 INVITE 的 branch（兼容非标准客户端如 Zoiper 2.x）
-    # - ACK (非2xx): 有状态代理，复用对应 INVITE 的 branch，添加服务器 Via（确保 Via 栈与 INVITE 一致）
-    # - ACK (2xx): 无状态转发，不添加 Via（正常对话建立后的 ACK）
-    # - 其他请求: 有状态代理，添加服务器 Via
-    # 
-    # RFC 3261 Section 9.1 关于 CANCEL:
-    # "The CANCEL request uses the same Via headers as the request being cancelled"
-    # 标准理解：客户端的 Via 头相同（branch 参数相同），代理可以添加不同的 Via branch
-    # 但 Zoiper 2.x 要求整个 Via 栈都匹配，因此需要复用 INVITE 的 branch
-    # 
-    # RFC 3261 Section 17.2.3 关于非 2xx ACK:
-    # "The ACK MUST have the same Via branch identifier and Call-ID as the INVITE
-    #  to which it refers, but only the methods differ."
-    # 作为有状态代理，为了匹配原始 INVITE 的 Via 栈，需要复用 INVITE 的 branch
-    if method != "ACK":
-        # 获取 Call-ID
-        call_id = msg.get("call-id")
-        
-        # 为 CANCEL 复用对应 INVITE 的 branch
-        if method == "CANCEL" and call_id and call_id in INVITE_BRANCHES:
-            branch = INVITE_BRANCHES[call_id]
-            log.debug(f"[CANCEL] Reusing INVITE branch: {branch} for Call-ID: {call_id}")
-        else:
-            # 其他请求生成新的 branch
-            branch = f"z9hG4bK-{gen_tag(10)}"
-            # 如果是 INVITE，保存 branch 供后续 CANCEL 和 ACK 使用
-            if method == "INVITE" and call_id:
-                INVITE_BRANCHES[call_id] = branch
-                log.debug(f"[INVITE] Saved branch: {branch} for Call-ID: {call_id}")
-        
-        _add_top_via(msg, branch)
-
-        # 如果没有 Max-Forwards、CSeq 等关键头，给个兜底（少见）
-        _ensure_header(msg, "cseq", "1 " + method)
-        _ensure_header(msg, "from", msg.get("from") or "<sip:unknown@localhost>;tag=" + gen_tag())
-        _ensure_header(msg, "to", msg.get("to") or "<sip:unknown@localhost>")
-        _ensure_header(msg, "call-id", msg.get("call-id") or gen_tag() + "@localhost")
-        _ensure_header(msg, "via", f"SIP/2.0/UDP {SERVER_IP}:{SERVER_PORT};branch={branch};rport")
-    else:
-        # ACK 请求：根据 ACK 类型处理 Via
-        # 注意：此时 is_2xx_ack 已经在上面判断过了
-        call_id = msg.get("call-id")
-        if not is_2xx_ack:
-            # 非 2xx ACK：检查是否有 INVITE_BRANCHES
-            if call_id and call_id in INVITE_BRANCHES:
-                # 有状态代理，复用 INVITE 的 branch，添加服务器 Via
-                # 确保被叫收到的 ACK 的 Via 栈与原始 INVITE 一致：[服务器Via, 主叫Via]
-                branch = INVITE_BRANCHES[call_id]
-                _add_top_via(msg, branch)
-                log.info(f"[ACK-STATE] Non-2xx ACK: Reusing INVITE branch {branch} and adding server Via (stateful proxy mode)")
-            else:
-                # 非 2xx ACK 但没有 INVITE_BRANCHES（可能已被清理或 INVITE 未保存）
-                log.warning(f"[ACK-WARNING] Non-2xx ACK for Call-ID {call_id} but INVITE_BRANCHES not found! Cannot add server Via. This may cause the callee to not recognize the ACK.")
-                log.debug(f"[ACK-STATELESS] Non-2xx ACK: Forwarding without adding Via (INVITE_BRANCHES missing)")
-        else:
-            # 2xx ACK：无状态转发，不修改 Via（正常对话建立后的 ACK，不需要匹配原始 INVITE）
-            log.debug(f"[ACK-STATELESS] 2xx ACK: Forwarding without adding Via (stateless proxy mode)")
+        if log.debug_on:
+            log.debug(f"[REQ-TRACK] Call-ID {call_id} is in DIALOGS, treating as in-dialog {method} request")
 
+    # 按方法分派：R-URI 修正 / ACK 类型判断 / 初始请求定位，以及顶层 Via
+    if not _METHOD_DISPATCH.get(method, _fwd_generic)(msg, addr, transport, ctx):
+        return
+    to_hdr = ctx.to_hdr
+    to_aor = ctx.to_aor
+    call_id = ctx.call_id
+    is_2xx_ack = ctx.is_2xx_ack
+    sl_parts = ctx.sl_parts
+    dialog = ctx.dialog
     # 确定下一跳：优先 Route，否则用 Request-URI
     next_hop = None
-    routes = msg.headers.get("route", [])
+    routes = headers.get("route", [])
     
     # 如果是已知对话的请求，且有 Route 头，弹出我们的 Route
-    if call_id in DIALOGS and routes:
-        log.debug(f"[ROUTE] In-dialog request with {len(routes)} Route headers")
+    if dialog is not None and routes:
+        if log.debug_on:
+            log.debug(f"[ROUTE] In-dialog request with {len(routes)} Route headers")
         _strip_our_top_route_and_get_next(msg)
-        routes = msg.headers.get("route", [])
+        routes = headers.get("route", [])
     
     if routes:
         # 取首个 Route 的 URI
@@ -756,23 +1016,23 @@ def _forward_request(msg: SIPMessage, addr, transport):
             ruri = r.split(":", 1)[-1]
         nh = _host_port_from_sip_uri(ruri)
         next_hop = nh
-        log.debug(f"[ROUTE] Using Route header: {ruri} -> {next_hop}")
+        if log.debug_on:
+            log.debug(f"[ROUTE] Using Route header: {ruri} -> {next_hop}")
     else:
         # 用 Request-URI
-        ruri = msg.start_line.split()[1]
+        ruri = sl_parts[1]
         next_hop = _host_port_from_sip_uri(ruri)
-        log.debug(f"[ROUTE] Using Request-URI: {ruri} -> {next_hop}")
+        if log.debug_on:
+            log.debug(f"[ROUTE] Using Request-URI: {ruri} -> {next_hop}")
 
     if not next_hop or next_hop == ("", 0):
-        resp = _make_response(msg, 502, "Bad Gateway")
-        transport.sendto(resp.to_bytes(), addr)
-        log.tx(addr, resp.start_line, extra="no next hop")
+        _send_simple_response(transport, addr, msg, 502, "Bad Gateway", extra="no next hop")
         return
 
     host, port = next_hop
     
     # 如果是已知对话的请求且检测到环路，尝试从 REG_BINDINGS 获取正确的目标
-    is_in_dialog = call_id and call_id in DIALOGS if 'call_id' in locals() else False
+    is_in_dialog = dialog is not None
     
     # === 🔒 防止自环 ===
     # 注意：ACK 请求的 R-URI 可能是 sip:user@127.0.0.1，会被误判为环路
@@ -786,8 +1046,8 @@ def _forward_request(msg: SIPMessage, addr, transport):
             if not is_2xx_ack:
                 log.info(f"[ACK-NON2XX] Non-2xx ACK detected (Call-ID: {call_id}), finding target")
                 # 优先从 DIALOGS 获取被叫地址
-                if call_id and call_id in DIALOGS:
-                    caller_addr, callee_addr = DIALOGS[call_id]
+                if dialog is not None:
+                    caller_addr, callee_addr = dialog
                     host, port = callee_addr
                     log.info(f"[ACK-NON2XX] ✓ Routing to callee from DIALOGS: {host}:{port}")
                 else:
@@ -795,20 +1055,13 @@ def _forward_request(msg: SIPMessage, addr, transport):
                     # 从 To 头获取被叫 AOR，然后查找注册的 contact 地址
                     log.info(f"[ACK-NON2XX] Call-ID {call_id} not in DIALOGS, trying REG_BINDINGS")
                     try:
-                        to_header = msg.get("to") or ""
-                        log.info(f"[ACK-NON2XX] To header: {to_header}")
-                        to_aor = _aor_from_to(to_header)
+                        log.info(f"[ACK-NON2XX] To header: {to_hdr}")
                         log.info(f"[ACK-NON2XX] Extracted AOR: {to_aor}")
                         if to_aor:
-                            targets = REG_BINDINGS.get(to_aor, [])
-                            log.info(f"[ACK-NON2XX] Found {len(targets)} bindings for AOR {to_aor}")
-                            now = int(time.time())
-                            targets = [t for t in targets if t["expires"] > now]
-                            log.info(f"[ACK-NON2XX] {len(targets)} valid (not expired) bindings")
-                            if targets:
-                                b_uri = targets[0]["contact"]
+                            hit = _lookup_binding(to_aor, _now())
+                            if hit:
+                                b_uri, real_host, real_port = hit
                                 log.info(f"[ACK-NON2XX] Using contact: {b_uri}")
-                                real_host, real_port = _host_port_from_sip_uri(b_uri)
                                 if real_host and real_port:
                                     host, port = real_host, real_port
                                     log.info(f"[ACK-NON2XX] ✓ Routing to callee from REG_BINDINGS: {host}:{port} (AOR: {to_aor})")
@@ -820,7 +1073,7 @@ def _forward_request(msg: SIPMessage, addr, transport):
                                 log.info(f"[ACK-NON2XX] All bindings: {REG_BINDINGS.get(to_aor, [])}")
                                 return
                         else:
-                            log.error(f"[ACK-NON2XX] ✗ Cannot extract AOR from To header: {to_header}, cannot route ACK")
+                            log.error(f"[ACK-NON2XX] ✗ Cannot extract AOR from To header: {to_hdr}, cannot route ACK")
                             return
                     except Exception as e:
                         log.error(f"[ACK-NON2XX] ✗ Failed to find callee address: {e}, cannot route ACK")
@@ -830,18 +1083,18 @@ def _forward_request(msg: SIPMessage, addr, transport):
             else:
                 # 2xx ACK：尝试使用注册表中的 contact 地址
                 try:
-                    to_aor = _aor_from_to(msg.get("to"))
-                    ruri = msg.start_line.split()[1]
-                    log.debug(f"[ACK-2XX-CHECK] To AOR: {to_aor} | R-URI: {ruri} | Detected loop: {host}:{port}")
+                    ruri = sl_parts[1]
+                    if log.debug_on:
+                        log.debug(f"[ACK-2XX-CHECK] To AOR: {to_aor} | R-URI: {ruri} | Detected loop: {host}:{port}")
                     
                     if to_aor:
-                        targets = REG_BINDINGS.get(to_aor, [])
-                        if targets:
-                            b_uri = targets[0]["contact"]
-                            real_host, real_port = _host_port_from_sip_uri(b_uri)
+                        hit = _lookup_binding(to_aor)
+                        if hit:
+                            b_uri, real_host, real_port = hit
                             if real_host and real_port:
                                 host, port = real_host, real_port
-                                log.debug(f"ACK (2xx) using contact address: {b_uri} -> {host}:{port}")
+                                if log.debug_on:
+                                    log.debug(f"ACK (2xx) using contact address: {b_uri} -> {host}:{port}")
                             else:
                                 log.drop(f"ACK (2xx) loop detected: skipping self-forward to {host}:{port}")
                                 return
@@ -856,19 +1109,19 @@ def _forward_request(msg: SIPMessage, addr, transport):
         # 如果是已知对话的请求且目标指向服务器，尝试使用注册表中的地址（非 ACK）
         elif is_in_dialog:
             try:
-                to_aor = _aor_from_to(msg.get("to")) or msg.start_line.split()[1]
-                targets = REG_BINDINGS.get(to_aor, [])
-                if targets:
-                    b_uri = targets[0]["contact"]
-                    real_host, real_port = _host_port_from_sip_uri(b_uri)
+                dialog_aor = to_aor or sl_parts[1]
+                hit = _lookup_binding(dialog_aor)
+                if hit:
+                    b_uri, real_host, real_port = hit
                     if real_host and real_port and (real_host != SERVER_IP or real_port != SERVER_PORT):
                         host, port = real_host, real_port
-                        log.debug(f"[IN-DIALOG] Using contact address from REG_BINDINGS: {host}:{port}")
+                        if log.debug_on:
+                            log.debug(f"[IN-DIALOG] Using contact address from REG_BINDINGS: {host}:{port}")
                     else:
                         log.drop(f"[IN-DIALOG] Loop detected and no valid contact, skipping: {host}:{port}")
                         return
                 else:
-                    log.drop(f"[IN-DIALOG] Loop detected and no bindings for AOR {to_aor}, skipping: {host}:{port}")
+                    log.drop(f"[IN-DIALOG] Loop detected and no bindings for AOR {dialog_aor}, skipping: {host}:{port}")
                     return
             except Exception as e:
                 log.warning(f"[IN-DIALOG] Loop check failed: {e}")
@@ -881,23 +1134,20 @@ def _forward_request(msg: SIPMessage, addr, transport):
     # --- NAT/私网修正: 如果 Contact 或 R-URI 的 host 不可达，强制使用我们已知的绑定地址 ---
     # 从 REG_BINDINGS 查找被叫实际的 contact IP
     # 注意：ACK 已经在环路检测中使用了 contact 地址，这里跳过避免重复处理
-    if method in ("INVITE", "BYE", "CANCEL", "UPDATE", "PRACK", "MESSAGE", "REFER", "NOTIFY", "SUBSCRIBE"):
+    if method in _BINDING_ROUTED_METHODS:
         try:
-            aor = _aor_from_to(msg.get("to")) or msg.start_line.split()[1]
-            bindings = REG_BINDINGS.get(aor, [])
-            if bindings:
-                # 取第一个绑定的 contact，解析 IP 和端口
-                b_uri = bindings[0]["contact"]
-                real_host, real_port = _host_port_from_sip_uri(b_uri)
-                host, port = real_host, real_port
-                log.debug(f"[{method}] Using registered contact: {b_uri} -> {host}:{port}")
+            aor = to_aor or sl_parts[1]
+            hit = _lookup_binding(aor)
+            if hit:
+                # 取第一个绑定的 contact（IP 和端口已在缓存中解析）
+                b_uri, host, port = hit
+                if log.debug_on:
+                    log.debug(f"[{method}] Using registered contact: {b_uri} -> {host}:{port}")
             else:
                 # 没有找到注册绑定，回复 480 Temporarily Unavailable
-                if method in ("MESSAGE", "REFER", "NOTIFY", "SUBSCRIBE"):
+                if method in _UNAVAILABLE_480_METHODS:
                     log.warning(f"[{method}] No bindings found for AOR: {aor}")
-                    resp = _make_response(msg, 480, "Temporarily Unavailable")
-                    transport.sendto(resp.to_bytes(), addr)
-                    log.tx(addr, resp.start_line, extra=f"aor={aor}")
+                    _send_simple_response(transport, addr, msg, 480, "Temporarily Unavailable", extra=f"aor={aor}")
                     return
         except Exception as e:
             log.warning(f"NAT fix skipped: {e}")
@@ -905,24 +1155,24 @@ def _forward_request(msg: SIPMessage, addr, transport):
 
     try:
         # 详细日志：显示发送前的消息详情
-        call_id = msg.get("call-id")
-        vias = msg.headers.get("via", [])
-        routes = msg.headers.get("route", [])
-        log.debug(f"[FWD-DETAIL] Method: {method} | Call-ID: {call_id} | Target: {host}:{port} | Via hops: {len(vias)} | Route: {len(routes)}")
+        if log.debug_on:
+            vias = headers.get("via", [])
+            routes = headers.get("route", [])
+            log.debug(f"[FWD-DETAIL] Method: {method} | Call-ID: {call_id} | Target: {host}:{port} | Via hops: {len(vias)} | Route: {len(routes)}")
         
+        if ctx.ruri_changed:
+            msg.start_line = " ".join(sl_parts)
         transport.sendto(msg.to_bytes(), (host, port))
-        log.fwd(method, (host, port), f"R-URI={msg.start_line.split()[1]}")
+        log.fwd(method, (host, port), f"R-URI={sl_parts[1]}")
         
         # 记录请求映射：Call-ID -> 原始请求发送者地址（用于响应转发）
         # 注意：这里记录的是 addr（请求发送者），而非 (host, port)（转发目标）
-        call_id = msg.get("call-id")
-        if call_id and method in ("INVITE", "BYE", "CANCEL", "UPDATE", "PRACK", "MESSAGE", "REFER", "NOTIFY", "SUBSCRIBE"):
+        if call_id and method in _BINDING_ROUTED_METHODS:
             PENDING_REQUESTS[call_id] = addr  # 记录请求发送者地址
             # 记录对话信息：主叫和被叫地址
             if method == "INVITE":
                 # 判断是初始 INVITE 还是 re-INVITE
-                to_header = msg.get("to") or ""
-                has_to_tag = "tag=" in to_header
+                has_to_tag = "tag=" in to_hdr
                 
                 # 解析 SDP 提取呼叫类型和编解码信息
                 call_type, codec = extract_sdp_info(msg.body)
@@ -934,15 +1184,15 @@ def _forward_request(msg: SIPMessage, addr, transport):
                     # CDR: 记录呼叫开始
                     cdr.record_call_start(
                         call_id=call_id,
-                        caller_uri=msg.get("from") or "",
-                        callee_uri=msg.get("to") or "",
+                        caller_uri=mget("from") or "",
+                        callee_uri=to_hdr,
                         caller_addr=addr,
                         callee_ip=host,
                         callee_port=port,
                         call_type=call_type,
                         codec=codec,
-                        user_agent=msg.get("user-agent") or "",
-                        cseq=msg.get("cseq") or "",
+                        user_agent=mget("user-agent") or "",
+                        cseq=mget("cseq") or "",
                         server_ip=SERVER_IP,
                         server_port=SERVER_PORT
                     )
@@ -961,32 +1211,32 @@ def _forward_request(msg: SIPMessage, addr, transport):
             elif method == "BYE":
                 # CDR: 记录呼叫结束（只在第一次收到 BYE 时记录，避免重传导致重复）
                 # 通过检查 DIALOGS 是否存在来判断是否是第一次
-                if call_id in DIALOGS:
+                if dialog is not None:
                     cdr.record_call_end(
                         call_id=call_id,
                         termination_reason="Normal",
-                        cseq=msg.get("cseq") or ""
+                        cseq=mget("cseq") or ""
                     )
             elif method == "CANCEL":
                 # CDR: 记录呼叫取消（只在第一次收到时记录）
-                if call_id in DIALOGS:
+                if dialog is not None:
                     cdr.record_call_cancel(
                         call_id=call_id,
-                        cseq=msg.get("cseq") or ""
+                        cseq=mget("cseq") or ""
                     )
             elif method == "MESSAGE":
                 # CDR: 记录短信（MESSAGE 一般不会重传，但为了统一性也加上检查）
                 # 使用 CSeq 作为唯一性标识，防止重复记录
-                message_id = f"{call_id}-{msg.get('cseq') or ''}"
+                message_id = f"{call_id}-{mget('cseq') or ''}"
                 # MESSAGE 请求不在 DIALOGS 中，所以直接记录（CDR 层面会防重复）
                 cdr.record_message(
                     call_id=message_id,  # 使用 call_id+cseq 作为唯一标识
-                    caller_uri=msg.get("from") or "",
-                    callee_uri=msg.get("to") or "",
+                    caller_uri=mget("from") or "",
+                    callee_uri=to_hdr,
                     caller_addr=addr,
-                    message_body=msg.body.decode('utf-8', errors='ignore') if msg.body else "",
-                    user_agent=msg.get("user-agent") or "",
-                    cseq=msg.get("cseq") or "",
+                    message_body=msg.body,  # 原始字节，由 CDR 截断后再解码
+                    user_agent=mget("user-agent") or "",
+                    cseq=mget("cseq") or "",
                     server_ip=SERVER_IP,
                     server_port=SERVER_PORT
                 )
@@ -996,17 +1246,17 @@ def _forward_request(msg: SIPMessage, addr, transport):
             # RFC 3261: 转发非 2xx ACK 后，清理 DIALOGS、INVITE_BRANCHES 和最后响应状态
             # 因为 ACK 确认了收到最终响应，可以安全清理对话信息
             if not is_2xx_ack:
-                if call_id in DIALOGS:
-                    del DIALOGS[call_id]
-                    log.debug(f"[DIALOG-CLEANUP] Cleaned up DIALOGS after forwarding non-2xx ACK for Call-ID: {call_id}")
+                if DIALOGS.pop(call_id, None) is not None:
+                    if log.debug_on:
+                        log.debug(f"[DIALOG-CLEANUP] Cleaned up DIALOGS after forwarding non-2xx ACK for Call-ID: {call_id}")
                 # 清理 INVITE branch（非 2xx ACK 转发完成后不再需要）
-                if call_id in INVITE_BRANCHES:
-                    del INVITE_BRANCHES[call_id]
-                    log.debug(f"[BRANCH-CLEANUP] Cleaned up INVITE_BRANCHES after forwarding non-2xx ACK for Call-ID: {call_id}")
+                if INVITE_BRANCHES.pop(call_id, None) is not None:
+                    if log.debug_on:
+                        log.debug(f"[BRANCH-CLEANUP] Cleaned up INVITE_BRANCHES after forwarding non-2xx ACK for Call-ID: {call_id}")
             # 清理最后响应状态
-            if call_id in LAST_RESPONSE_STATUS:
-                del LAST_RESPONSE_STATUS[call_id]
-                log.debug(f"[LAST-RESP-STATUS] Cleaned up last response status for Call-ID: {call_id}")
+            if LAST_RESPONSE_STATUS.pop(call_id, None) is not None:
+                if log.debug_on:
+                    log.debug(f"[LAST-RESP-STATUS] Cleaned up last response status for Call-ID: {call_id}")
             
     except OSError as e:
         # 网络错误：目标主机不可达
@@ -1018,32 +1268,79 @@ def _forward_request(msg: SIPMessage, addr, transport):
             # 根据方法类型返回适当的错误响应
             if method in ("INVITE", "MESSAGE", "REFER", "NOTIFY", "SUBSCRIBE"):
                 # 对于需要响应的请求，返回 480 Temporarily Unavailable
-                resp = _make_response(msg, 480, "Temporarily Unavailable")
-                transport.sendto(resp.to_bytes(), addr)
-                log.tx(addr, resp.start_line, extra=f"target unreachable")
+                _send_simple_response(transport, addr, msg, 480, "Temporarily Unavailable", extra="target unreachable")
             elif method == "BYE":
                 # BYE 失败，返回 408 Request Timeout
-                resp = _make_response(msg, 408, "Request Timeout")
-                transport.sendto(resp.to_bytes(), addr)
-                log.tx(addr, resp.start_line, extra=f"target unreachable")
+                _send_simple_response(transport, addr, msg, 408, "Request Timeout", extra="target unreachable")
                 
                 # 清理 DIALOGS，防止重传 BYE 时重复记录 CDR
-                if call_id and call_id in DIALOGS:
-                    del DIALOGS[call_id]
-                    log.debug(f"[DIALOG-CLEANUP] Cleaned up unreachable call: {call_id}")
+                if call_id and DIALOGS.pop(call_id, None) is not None:
+                    if log.debug_on:
+                        log.debug(f"[DIALOG-CLEANUP] Cleaned up unreachable call: {call_id}")
             # ACK 和 CANCEL 不需要响应
         else:
             # 其他网络错误
             log.error(f"[NETWORK] Send failed to {host}:{port} - {e}")
-            resp = _make_response(msg, 503, "Service Unavailable")
-            transport.sendto(resp.to_bytes(), addr)
-            log.tx(addr, resp.start_line, extra=f"network error")
+            _send_simple_response(transport, addr, msg, 503, "Service Unavailable", extra="network error")
     except Exception as e:
         # 其他异常
         log.error(f"[ERROR] Forward failed: {e}")
-        resp = _make_response(msg, 502, "Bad Gateway")
-        transport.sendto(resp.to_bytes(), addr)
-        log.tx(addr, resp.start_line, extra=f"forward error")
+        _send_simple_response(transport, addr, msg, 502, "Bad Gateway", extra="forward error")
+
+# 本机测试模式下 Contact 改写结果缓存：原始 Contact -> 改写后的 Contact
+# 同一 UA 在各个对话中的 Contact 基本不变，命中率很高
+_LOCAL_CONTACT_CACHE: dict[str, str] = {}
+_LOCAL_CONTACT_CACHE_MAX = 4096
+
+def _localize_contact(contact_val: str) -> str:
+    """将 Contact 中的 host 替换为 127.0.0.1，保留 sip:user@host:port 的格式，只替换 host 部分"""
+    fixed = _LOCAL_CONTACT_CACHE.get(contact_val)
+    if fixed is None:
+        if "@" not in contact_val:
+            # 没有 user@host 部分，正则不会匹配
+            fixed = contact_val
+        else:
+            fixed = _RE_URI_HOST_ONLY.sub("@127.0.0.1", contact_val)
+        if len(_LOCAL_CONTACT_CACHE) >= _LOCAL_CONTACT_CACHE_MAX:
+            _LOCAL_CONTACT_CACHE.clear()
+        _LOCAL_CONTACT_CACHE[contact_val] = fixed
+    return fixed
+
+# 响应下一跳是否属于本地网络的判断结果缓存：host -> bool
+# 以 LOCAL_NETWORK_NETS 对象为版本标识，配置动态修改（整体替换）后自动失效
+_LOCAL_HOST_CACHE: dict[str, bool] = {}
+_LOCAL_HOST_CACHE_NETS: list = [None]
+_LOCAL_HOST_CACHE_MAX = 4096
+
+def _is_local_host(host: str) -> bool:
+    """判断 host 是否为本地/私网地址（同一 host 只完整判断一次）"""
+    nets = LOCAL_NETWORK_NETS
+    if _LOCAL_HOST_CACHE_NETS[0] is not nets:
+        _LOCAL_HOST_CACHE.clear()
+        _LOCAL_HOST_CACHE_NETS[0] = nets
+    hit = _LOCAL_HOST_CACHE.get(host)
+    if hit is None:
+        hit = (
+            host == "127.0.0.1" or
+            host.startswith(("192.168.", "10.", "172.")) or
+            host in ("localhost", SERVER_IP) or
+            host in LOCAL_NETWORKS or
+            in_networks(host, nets)
+        )
+        if len(_LOCAL_HOST_CACHE) >= _LOCAL_HOST_CACHE_MAX:
+            _LOCAL_HOST_CACHE.clear()
+        _LOCAL_HOST_CACHE[host] = hit
+    return hit
+
+def _last_binding_not_at(addr) -> tuple[str, int] | None:
+    """从 REG_BINDINGS 末尾的 AOR 往前查找，返回第一个不指向 addr 的绑定地址（避免回环）"""
+    target = (addr[0], addr[1])
+    for aor in reversed(REG_BINDINGS):
+        for b in REG_BINDINGS[aor]:
+            hp = _host_port_from_sip_uri(b["contact"])
+            if hp != target:
+                return hp
+    return None
 
 def _forward_response(resp: SIPMessage, addr, transport):
     """
@@ -1058,41 +1355,45 @@ def _forward_response(resp: SIPMessage, addr, transport):
         return
 
     # 处理逗号分隔的 Via 头（RFC 3261 允许在同一行用逗号分隔多个 Via）
-    # 将每个逗号分隔的 Via 头分割成独立元素
-    split_vias = []
+    # 转发判断只需要顶层 Via：从第一个非空 Via 行中分割出第一个元素即可，
+    # 不必分割整个 Via 栈（被丢弃的错误响应也不再为此付出代价）
+    top = ""
     for via_str in vias:
         # 分割逗号分隔的 Via 头（但要小心，逗号可能在参数值中）
         # RFC 3261: Via 头的逗号分隔必须正确处理
         parts = _split_via_header(via_str)
-        split_vias.extend(parts)
-    
-    # 如果没有分割出多个，使用原始值
-    if not split_vias:
-        split_vias = vias
+        if parts:
+            top = parts[0]
+            break
     
     # 检查顶层Via是否是我们
-    top = split_vias[0] if split_vias else ""
-    status_code = resp.start_line.split()[1] if len(resp.start_line.split()) > 1 else ""
-    call_id_resp = resp.get("call-id")
+    # 起始行只切分一次：SIP/2.0 <status_code> <status_text>
+    sl_parts = resp.start_line.split(None, 2)
+    status_code = sl_parts[1] if len(sl_parts) > 1 else ""
+    status_text = sl_parts[2] if len(sl_parts) > 2 else ""
+    status_flags = _status_flags(status_code)
+    call_id = call_id_resp = resp.get("call-id")
     
     # 增强日志：记录完整的 Via 头内容
-    log.debug(f"[RESP-VIA] Response {status_code} (Call-ID: {call_id_resp}) | Via count: {len(split_vias)} | Top Via: {top[:100]}")
+    if log.debug_on:
+        via_count = sum(len(_split_via_header(v)) for v in vias) or len(vias)
+        log.debug(f"[RESP-VIA] Response {status_code} (Call-ID: {call_id_resp}) | Via count: {via_count} | Top Via: {top[:100]}")
     
     if not top or f"{SERVER_IP}:{SERVER_PORT}" not in top:
         # 调试：记录为什么不转发
-        log.debug(f"[RESP-SKIP] Response {status_code} not forwarded: top Via '{top[:100] if top else 'EMPTY'}' does not contain '{SERVER_IP}:{SERVER_PORT}' | Call-ID: {call_id_resp}")
+        if log.debug_on:
+            log.debug(f"[RESP-SKIP] Response {status_code} not forwarded: top Via '{top[:100] if top else 'EMPTY'}' does not contain '{SERVER_IP}:{SERVER_PORT}' | Call-ID: {call_id_resp}")
         return
     
     # 如果是错误响应（如 482 Loop Detected），不应该继续转发
     # 这些响应应该直接返回给当前接收方
-    status_code = resp.start_line.split()[1] if len(resp.start_line.split()) > 1 else ""
-    if status_code in ("482", "483", "502", "503", "504"):
-        call_id_resp = resp.get("call-id")
-        vias_resp = resp.headers.get("via", [])
+    if status_flags & _ST_DROP:
+        vias_resp = vias
         log.warning(f"Dropping error response: {resp.start_line} | Call-ID: {call_id_resp} | Via hops: {len(vias_resp)}")
         # 打印 Via 头内容以便调试
         for i, via in enumerate(vias_resp):
-            log.debug(f"  Via[{i}]: {via}")
+            if log.debug_on:
+                log.debug(f"  Via[{i}]: {via}")
         return
 
     # 修正响应中的 Contact 头：根据网络环境处理
@@ -1100,19 +1401,14 @@ def _forward_response(resp: SIPMessage, addr, transport):
     # 模式2：FORCE_LOCAL_ADDR=False（真实网络）- 保持服务器可见地址
     contacts = resp.headers.get("contact", [])
     if contacts and FORCE_LOCAL_ADDR:
-        for i, contact_val in enumerate(contacts):
-            original = contact_val
-            # 提取端口号
-            port_match = re.search(r":(\d+)", contact_val)
-            port = port_match.group(1) if port_match else "5060"
-            
+        for i, original in enumerate(contacts):
             # 替换所有外部 IP 为 127.0.0.1（仅在本机测试模式）
-            # 保留 sip:user@host:port 的格式，只替换 host 部分
-            contact_val = re.sub(r"@[^:;>]+", f"@127.0.0.1", contact_val)
+            contact_val = _localize_contact(original)
             
             if contact_val != original:
                 contacts[i] = contact_val
-                log.debug(f"[CONTACT-FIX] Contact修正 (本机模式): {original} -> {contact_val}")
+                if log.debug_on:
+                    log.debug(f"[CONTACT-FIX] Contact修正 (本机模式): {original} -> {contact_val}")
         resp.headers["contact"] = contacts
     elif contacts:
         # 真实网络模式：检查是否需要 NAT 修正
@@ -1124,14 +1420,16 @@ def _forward_response(resp: SIPMessage, addr, transport):
     # 弹出我们的 Via
     _pop_top_via(resp)
     
+    # 查找原始请求发送者地址（只查一次，Via 兜底和 NAT 修正共用）
+    original_sender_addr = PENDING_REQUESTS.get(call_id) if call_id else None
+
     # 重新获取 Via 头（可能已分割）
     vias2 = resp.headers.get("via", [])
     if not vias2:
         # 如果没有 Via 头了，尝试使用 PENDING_REQUESTS 中的原始发送者地址
-        call_id = resp.get("call-id")
-        original_sender_addr = PENDING_REQUESTS.get(call_id) if call_id else None
         if original_sender_addr:
-            log.debug(f"[RESP-ROUTE] No Via left, using PENDING_REQUESTS: {original_sender_addr}")
+            if log.debug_on:
+                log.debug(f"[RESP-ROUTE] No Via left, using PENDING_REQUESTS: {original_sender_addr}")
             nhost, nport = original_sender_addr
         else:
             log.warning(f"[RESP-ROUTE] No Via left and no PENDING_REQUESTS for Call-ID: {call_id}, cannot forward response {status_code}")
@@ -1143,11 +1441,10 @@ def _forward_response(resp: SIPMessage, addr, transport):
         
         if not first_via_parts:
             # 无法解析，使用兜底方案
-            call_id = resp.get("call-id")
-            original_sender_addr = PENDING_REQUESTS.get(call_id) if call_id else None
             if original_sender_addr:
                 nhost, nport = original_sender_addr
-                log.debug(f"[RESP-ROUTE] Failed to parse Via, using PENDING_REQUESTS: {original_sender_addr}")
+                if log.debug_on:
+                    log.debug(f"[RESP-ROUTE] Failed to parse Via, using PENDING_REQUESTS: {original_sender_addr}")
             else:
                 log.warning(f"[RESP-ROUTE] Failed to parse Via and no PENDING_REQUESTS for Call-ID: {call_id}")
                 return
@@ -1155,41 +1452,36 @@ def _forward_response(resp: SIPMessage, addr, transport):
             # 使用第一个 Via 头
             first_via = first_via_parts[0]
             nhost, nport = _host_port_from_via(first_via)
-            log.debug(f"[RESP-ROUTE] Via头数量: {len(vias2)}, Via[0] (split): {len(first_via_parts)} parts, First Via: {first_via[:80]}")
-            log.debug(f"[RESP-ROUTE] Via解析结果 -> target: {nhost}:{nport}")
+            if log.debug_on:
+                log.debug(f"[RESP-ROUTE] Via头数量: {len(vias2)}, Via[0] (split): {len(first_via_parts)} parts, First Via: {first_via[:80]}")
+                log.debug(f"[RESP-ROUTE] Via解析结果 -> target: {nhost}:{nport}")
 
-    # 获取Call-ID，用于查找原始请求发送者地址
-    call_id = resp.get("call-id")
-    original_sender_addr = PENDING_REQUESTS.get(call_id) if call_id else None
-    log.debug(f"[RESP-ROUTE] Call-ID: {call_id}, Original sender: {original_sender_addr}, Via解析: {nhost}:{nport}")
+    if log.debug_on:
+        log.debug(f"[RESP-ROUTE] Call-ID: {call_id}, Original sender: {original_sender_addr}, Via解析: {nhost}:{nport}")
 
     # NAT修正：根据网络环境判断
-    is_local_network = (
-        nhost == "127.0.0.1" or 
-        nhost.startswith(("192.168.", "10.", "172.")) or 
-        nhost in ("localhost", SERVER_IP) or
-        nhost in LOCAL_NETWORKS
-    )
+    is_local_network = _is_local_host(nhost)
     
     if not is_local_network:
         # Via 头包含外部/公网地址，使用原始请求发送者地址
         if original_sender_addr:
-            log.debug(f"[RESP-NAT] Via指向外部地址 {nhost}:{nport}, 使用原始发送者: {original_sender_addr}")
+            if log.debug_on:
+                log.debug(f"[RESP-NAT] Via指向外部地址 {nhost}:{nport}, 使用原始发送者: {original_sender_addr}")
             nhost, nport = original_sender_addr
         else:
-            # 回退到REGISTER绑定地址
-            for aor, binds in REG_BINDINGS.items():
-                for b in binds:
-                    host2, port2 = _host_port_from_sip_uri(b["contact"])
-                    if (host2, port2) != (addr[0], addr[1]):  # 避免回环
-                        nhost, nport = host2, port2
-                        log.debug(f"[RESP-NAT] 使用绑定地址: {host2}:{port2}")
-                        break
+            # 回退到REGISTER绑定地址：取最后一个存在非回环绑定的 AOR 的首个此类绑定
+            # （与从头遍历全部 AOR、以最后一次命中为准的结果相同，但从尾部查找命中即停）
+            fallback = _last_binding_not_at(addr)
+            if fallback:
+                nhost, nport = fallback
+                if log.debug_on:
+                    log.debug(f"[RESP-NAT] 使用绑定地址: {nhost}:{nport}")
 
     # 兜底：如果还是没找到，就用当前addr（收到响应的对端）
     if not nhost or not nport:
         nhost, nport = addr
-        log.debug(f"Using fallback address: {addr}")
+        if log.debug_on:
+            log.debug(f"Using fallback address: {addr}")
 
     # 防止自环
     if (nhost == SERVER_IP and nport == SERVER_PORT):
@@ -1222,13 +1514,15 @@ def _forward_response(resp: SIPMessage, addr, transport):
     #     log.debug(f"[DIALOG-ROUTE] Non-INVITE response ({cseq_header}): using Via route to {nhost}:{nport}")
     
     # 调试日志：显示 Via 路由结果
-    status_code = resp.start_line.split()[1] if len(resp.start_line.split()) > 1 else ""
     cseq_header = resp.get("cseq") or ""
     is_invite_response = "INVITE" in cseq_header
-    log.debug(f"[VIA-ROUTE] Response {status_code} ({cseq_header}) → {nhost}:{nport}")
+    if log.debug_on:
+        log.debug(f"[VIA-ROUTE] Response {status_code} ({cseq_header}) → {nhost}:{nport}")
 
     try:
-        transport.sendto(resp.to_bytes(), (nhost, nport))
+        # 只序列化一次，发送失败重试时复用同一份字节
+        data = resp.to_bytes()
+        transport.sendto(data, (nhost, nport))
         log.fwd(f"RESP {resp.start_line}", (nhost, nport))
         
         # 清理追踪记录
@@ -1237,26 +1531,28 @@ def _forward_response(resp: SIPMessage, addr, transport):
         # - 非 2xx 响应(486, 487等)：保留 DIALOGS，等待 ACK（ACK 转发后才清理）
         # CDR: 只在第一次收到响应时记录（避免重传导致重复记录）
         need_cleanup = False
-        if status_code in ("486", "487", "488", "600", "603", "604"):
+        if status_flags & _ST_INVITE_FINAL_FAIL:
             if call_id in DIALOGS:
                 need_cleanup = True  # 第一次收到最终响应（用于 CDR 记录）
             # 清理 PENDING_REQUESTS（不再需要追踪）
-            if call_id in PENDING_REQUESTS:
-                del PENDING_REQUESTS[call_id]
+            PENDING_REQUESTS.pop(call_id, None)
             # ⚠️ 注意：不立即清理 INVITE_BRANCHES，需要等待 ACK
             # INVITE_BRANCHES 将在收到并转发 ACK 后清理（在 _forward_request 的 ACK 处理中）
             # 因为非 2xx ACK 需要复用 INVITE 的 branch 来匹配原始 Via 栈
-            log.debug(f"[BRANCH-WAIT-ACK] Keeping INVITE_BRANCHES for Call-ID {call_id}, waiting for ACK for non-2xx response {status_code}")
+            if log.debug_on:
+                log.debug(f"[BRANCH-WAIT-ACK] Keeping INVITE_BRANCHES for Call-ID {call_id}, waiting for ACK for non-2xx response {status_code}")
             # ⚠️ 注意：不立即清理 DIALOGS，需要等待 ACK
             # DIALOGS 将在收到并转发 ACK 后清理（在 _forward_request 的 ACK 处理中）
-            log.debug(f"[DIALOG-WAIT-ACK] Keeping DIALOGS for Call-ID {call_id}, waiting for ACK for non-2xx response {status_code}")
+            if log.debug_on:
+                log.debug(f"[DIALOG-WAIT-ACK] Keeping DIALOGS for Call-ID {call_id}, waiting for ACK for non-2xx response {status_code}")
         
         # 记录最后响应状态（用于 ACK 类型判断）
         if is_invite_response and call_id:
             # 只记录最终响应（非 1xx）
-            if status_code and not status_code.startswith("1"):
+            if status_flags & _ST_FINAL:
                 LAST_RESPONSE_STATUS[call_id] = status_code
-                log.debug(f"[LAST-RESP-STATUS] Recorded last response status {status_code} for Call-ID {call_id}")
+                if log.debug_on:
+                    log.debug(f"[LAST-RESP-STATUS] Recorded last response status {status_code} for Call-ID {call_id}")
         
         # CDR: 记录呼叫应答和呼叫失败（只在第一次收到响应时记录，避免重传导致重复）
         if is_invite_response:
@@ -1293,53 +1589,49 @@ def _forward_response(resp: SIPMessage, addr, transport):
                         )
             elif need_cleanup:
                 # CDR: 记录呼叫失败（仅在第一次清理时记录）
-                status_text = resp.start_line.split(maxsplit=2)[2] if len(resp.start_line.split(maxsplit=2)) > 2 else "Failed"
+                status_text = status_text or "Failed"
                 cdr.record_call_fail(
                     call_id=call_id,
                     status_code=int(status_code),
                     status_text=status_text,
                     reason=f"{status_code} {status_text}"
                 )
-            elif status_code.startswith(('4', '5', '6')) and status_code not in ("100", "180", "183", "486", "487", "488", "600", "603", "604"):
+            elif status_flags & _ST_OTHER_FAIL:
                 # CDR: 记录其他失败响应（如 480, 404 等）
-                # 只有当 call_id 还在 DIALOGS 中时才记录（第一次）
-                if call_id in DIALOGS:
-                    status_text = resp.start_line.split(maxsplit=2)[2] if len(resp.start_line.split(maxsplit=2)) > 2 else "Error"
+                # 只有当 call_id 还在 DIALOGS 中时才记录（第一次），取出即清理，避免重复记录
+                if DIALOGS.pop(call_id, None) is not None:
+                    status_text = status_text or "Error"
                     cdr.record_call_fail(
                         call_id=call_id,
                         status_code=int(status_code),
                         status_text=status_text,
                         reason=f"{status_code} {status_text}"
                     )
-                    # 立即清理，避免重复记录
-                    if call_id in PENDING_REQUESTS:
-                        del PENDING_REQUESTS[call_id]
-                    if call_id in DIALOGS:
-                        del DIALOGS[call_id]
-                    if call_id in INVITE_BRANCHES:
-                        del INVITE_BRANCHES[call_id]
+                    PENDING_REQUESTS.pop(call_id, None)
+                    INVITE_BRANCHES.pop(call_id, None)
         elif status_code == "200":
             # 200 OK：需要区分不同场景
             # - INVITE 200 OK：已在上面处理（保留 DIALOGS 等待 ACK）
             # - BYE 200 OK：应该清理 DIALOGS（呼叫已结束）
             # - CANCEL 200 OK：不应该清理 INVITE_BRANCHES（还需要等待 ACK 匹配原始 INVITE）
             # - 其他方法 200 OK：与 DIALOGS 无关
-            if "BYE" in cseq_header and call_id in DIALOGS:
+            is_bye = "BYE" in cseq_header
+            if is_bye and DIALOGS.pop(call_id, None) is not None:
                 # BYE 200 OK：清理 dialog
-                del DIALOGS[call_id]
-                log.debug(f"[DIALOG-CLEANUP] Cleaned up dialog after BYE: {call_id}")
+                if log.debug_on:
+                    log.debug(f"[DIALOG-CLEANUP] Cleaned up dialog after BYE: {call_id}")
             # 清理其他追踪数据
-            if call_id in PENDING_REQUESTS:
-                del PENDING_REQUESTS[call_id]
+            PENDING_REQUESTS.pop(call_id, None)
             # ⚠️ 注意：CANCEL 的 200 OK 不应该清理 INVITE_BRANCHES
             # 因为后续的 487 响应的 ACK 需要复用 INVITE 的 branch
             # 只有 BYE 200 OK 才清理 INVITE_BRANCHES（呼叫已完全结束）
-            if "BYE" in cseq_header and call_id in INVITE_BRANCHES:
-                del INVITE_BRANCHES[call_id]
-                log.debug(f"[BRANCH-CLEANUP] Cleaned up INVITE branch after BYE 200 OK: {call_id}")
+            if is_bye and INVITE_BRANCHES.pop(call_id, None) is not None:
+                if log.debug_on:
+                    log.debug(f"[BRANCH-CLEANUP] Cleaned up INVITE branch after BYE 200 OK: {call_id}")
             elif "CANCEL" in cseq_header:
                 # CANCEL 200 OK：保留 INVITE_BRANCHES，等待 487 响应的 ACK
-                log.debug(f"[BRANCH-KEEP] Keeping INVITE_BRANCHES for Call-ID {call_id} after CANCEL 200 OK (waiting for 487 ACK)")
+                if log.debug_on:
+                    log.debug(f"[BRANCH-KEEP] Keeping INVITE_BRANCHES for Call-ID {call_id} after CANCEL 200 OK (waiting for 487 ACK)")
     except OSError as e:
         # UDP发送错误 - 尝试备用地址
         log.error(f"UDP send failed to ({nhost}:{nport}): {e}")
@@ -1347,7 +1639,7 @@ def _forward_response(resp: SIPMessage, addr, transport):
         # 如果目标地址失败，尝试使用原始发送者地址
         if original_sender_addr and (nhost, nport) != original_sender_addr:
             try:
-                transport.sendto(resp.to_bytes(), original_sender_addr)
+                transport.sendto(data, original_sender_addr)
                 log.fwd(f"RESP {resp.start_line} (retry)", original_sender_addr)
             except Exception as e2:
                 log.error(f"Retry also failed: {e2}")
@@ -1379,12 +1671,9 @@ def on_datagram(data: bytes, addr, transport):
         if is_req:
             method = _method_of(msg)
             if method == "OPTIONS":
-                resp = _make_response(msg, 200, "OK", extra_headers={
-                    "accept": "application/sdp",
-                    "supported": "100rel, timer, path"
-                })
-                transport.sendto(resp.to_bytes(), addr)
-                log.tx(addr, resp.start_line)
+                # 心跳报文量大：直接套用预拼接的 200 OK 结尾，不构造 SIPMessage
+                transport.sendto(_fast_response_bytes(msg, 200, "OK", _OPTIONS_200_TAIL), addr)
+                log.tx(addr, "SIP/2.0 200 OK")
                 # CDR: 记录 OPTIONS 请求（心跳/能力查询）
                 cdr.record_options(
                     caller_uri=msg.get("from") or "",
@@ -1399,9 +1688,7 @@ def on_datagram(data: bytes, addr, transport):
             elif method in ("INVITE", "BYE", "CANCEL", "PRACK", "UPDATE", "REFER", "NOTIFY", "SUBSCRIBE", "MESSAGE", "ACK"):
                 _forward_request(msg, addr, transport)
             else:
-                resp = _make_response(msg, 405, "Method Not Allowed")
-                transport.sendto(resp.to_bytes(), addr)
-                log.tx(addr, resp.start_line)
+                _send_simple_response(transport, addr, msg, 405, "Method Not Allowed")
         else:
             # 响应：转发
             _forward_response(msg, addr, transport)
@@ -1426,6 +1713,7 @@ async def main():
         from autodialer_manager import AutoDialerManager
         # 添加 REG_BINDINGS 和 SERVER_IP 到 server_globals（用于清理残留注册和传递 IP）
         server_globals['REG_BINDINGS'] = REG_BINDINGS
+        server_globals['REG_LOCK'] = REG_LOCK
         server_globals['SERVER_IP'] = SERVER_IP  # 传递服务器 IP 给外呼管理器
         dialer_mgr = AutoDialerManager(config_file="sip_client_config.json", server_globals=server_globals)
         server_globals['AUTO_DIALER_MANAGER'] = dialer_mgr
@@ -1444,7 +1732,8 @@ async def main():
     # 创建并启动 UDP 服务器
     # 绑定地址使用 0.0.0.0（监听所有接口），但对外宣告使用 SERVER_IP
     log.info(f"[CONFIG] UDP server binding to {UDP_BIND_IP}:{SERVER_PORT}, public IP: {SERVER_IP}")
-    udp = UDPServer((UDP_BIND_IP, SERVER_PORT), on_datagram)
+    # 每次可读事件最多连续处理 32 个数据报（注册风暴/重传突发时减少事件循环唤醒）
+    udp = UDPServer((UDP_BIND_IP, SERVER_PORT), on_datagram, batch_size=32, on_batch=_refresh_now)
     await udp.start()
     # UDP server listening 日志已在 transport_udp.py 中输出，此处不再重复
     
@@ -1454,7 +1743,8 @@ async def main():
         pending_requests=PENDING_REQUESTS,
         dialogs=DIALOGS,
         invite_branches=INVITE_BRANCHES,
-        reg_bindings=REG_BINDINGS
+        reg_bindings=REG_BINDINGS,
+        reg_lock=REG_LOCK
     )
     
     try:
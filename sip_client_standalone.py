@@ -8,6 +8,7 @@
 """
 
 import socket
+import selectors
 import time
 import hashlib
 import random
@@ -43,6 +44,54 @@ def get_default_config():
 DEFAULT_CONFIG = get_default_config()
 
 
+# ====== 预编译正则（头域解析） ======
+_RE_TAG = re.compile(r'tag=([^;>\s]+)')  # From/To 头中的 tag 参数
+_RE_VIA_SENTBY = re.compile(r'SIP/2\.0/UDP\s+([^;]+)')  # Via 头中的 sent-by（host:port）
+_RE_REALM = re.compile(r'realm="([^"]+)"')  # 认证质询中的 realm
+_RE_NONCE = re.compile(r'nonce="([^"]+)"')  # 认证质询中的 nonce
+_RE_QOP = re.compile(r'qop="([^"]+)"')  # 认证质询中的 qop
+_RE_ROUTE_URI = re.compile(r'<?(sip:[^>;]+)')  # Route/Record-Route 中的 SIP URI（不含参数）
+_RE_SIP_HOST_PORT = re.compile(r'sip:(?:[^@]+@)?([^:;]+)(?::(\d+))?')  # SIP URI 中的 host 和可选端口
+_RE_CONTACT_URI = re.compile(r'<?(sip:[^>]+)')  # Contact 头中的 SIP URI
+
+_TAG_DELIMS = (';', '>', ' ', '\t', '\r', '\n')
+
+# 客户端实际会读取的头部（小写）；解析时其余头部直接跳过，不做 strip/存储
+_WANTED_HEADERS = frozenset((
+    'call-id', 'cseq', 'from', 'to', 'via', 'contact', 'record-route', 'www-authenticate',
+))
+
+
+def _extract_tag(header: str) -> str:
+    """提取 From/To 头中的 tag 参数（字符串查找快速路径，异常格式回退到正则）"""
+    i = header.find('tag=')
+    if i < 0:
+        return ""
+    rest = header[i + 4:]
+    end = len(rest)
+    for ch in _TAG_DELIMS:
+        j = rest.find(ch, 0, end)
+        if j >= 0:
+            end = j
+    if end:
+        return rest[:end]
+    match = _RE_TAG.search(header)
+    return match.group(1) if match else ""
+
+
+def _extract_via_sent_by(via: str) -> str:
+    """提取 Via 头中的 sent-by（SIP/2.0/UDP host:port;...），异常格式回退到正则"""
+    i = via.find('SIP/2.0/UDP')
+    if i >= 0:
+        rest = via[i + 11:]
+        if rest[:1].isspace():
+            sent_by = rest.partition(';')[0].strip()
+            if sent_by:
+                return sent_by
+    match = _RE_VIA_SENTBY.search(via)
+    return match.group(1).strip() if match else ""
+
+
 # ====== 数据结构 ======
 @dataclass
 class SIPCall:
@@ -108,6 +157,8 @@ class SIPClient:
         
         # Socket 延迟创建（在需要时创建）
         self.sock = None
+        # 监听线程复用的接收缓冲区（recvfrom_into，避免每个报文分配新的 bytes）
+        self._recv_buf = bytearray(4096)
         
         # 状态
         self.registered = False
@@ -117,10 +168,19 @@ class SIPClient:
         # 响应回调
         self.response_callbacks: Dict[str, Callable] = {}
         
+        # Digest 认证 HA1 缓存：(username, realm, password) -> HA1（与 nonce/方法无关，可复用）
+        self._ha1_cache: Dict[Tuple[str, str, str], str] = {}
+        
+        # REGISTER 报文固定部分的预编码字节：((username, server_ip, local_ip, local_port), 各片段)
+        self._register_parts: Optional[Tuple[Tuple, Tuple[bytes, ...]]] = None
+        
         # 监听线程
         self._listener_thread = None
         self._running = False
         self._lock = threading.Lock()
+        # 唤醒监听线程的本地 socket 对（停止时写入一个字节，替代超时轮询）
+        self._wakeup_r: Optional[socket.socket] = None
+        self._wakeup_w: Optional[socket.socket] = None
     
     def _get_local_ip(self) -> str:
         """自动检测本地 IP 地址"""
@@ -137,62 +197,89 @@ class SIPClient:
     def _gen_branch(self) -> str:
         """生成 Via branch（RFC 3261）"""
         self.branch_counter += 1
-        return f"z9hG4bK-{random.randint(100000, 999999)}-{self.branch_counter}"
+        return f"z9hG4bK-{os.urandom(4).hex()}-{self.branch_counter}"
     
     def _gen_tag(self) -> str:
         """生成 SIP tag"""
-        return f"{random.randint(100000, 999999)}"
+        return os.urandom(4).hex()
     
     def _gen_call_id(self) -> str:
         """生成 Call-ID"""
-        return f"{random.randint(100000, 999999)}-{int(time.time())}"
+        return f"{os.urandom(6).hex()}-{int(time.time())}"
     
     def _compute_response(self, username: str, realm: str, password: str, 
                          uri: str, method: str, nonce: str, 
                          qop: str = "", cnonce: str = "", nc: str = "00000001") -> str:
         """计算 Digest 认证响应（RFC 2617）"""
-        ha1 = hashlib.md5(f"{username}:{realm}:{password}".encode()).hexdigest()
-        ha2 = hashlib.md5(f"{method}:{uri}".encode()).hexdigest()
+        # MD5 仅用于协议摘要，不作安全用途（FIPS 环境下也可用）
+        ha1_key = (username, realm, password)
+        ha1 = self._ha1_cache.get(ha1_key)
+        if ha1 is None:
+            ha1 = hashlib.md5(f"{username}:{realm}:{password}".encode(), usedforsecurity=False).hexdigest()
+            self._ha1_cache[ha1_key] = ha1
+        ha2 = hashlib.md5(f"{method}:{uri}".encode(), usedforsecurity=False).hexdigest()
         
         if qop:
             # 带 qop 的认证（RFC 2617）
-            response = hashlib.md5(f"{ha1}:{nonce}:{nc}:{cnonce}:{qop}:{ha2}".encode()).hexdigest()
+            response = hashlib.md5(f"{ha1}:{nonce}:{nc}:{cnonce}:{qop}:{ha2}".encode(),
+                                   usedforsecurity=False).hexdigest()
         else:
             # 不带 qop 的认证（RFC 2069）
-            response = hashlib.md5(f"{ha1}:{nonce}:{ha2}".encode()).hexdigest()
+            response = hashlib.md5(f"{ha1}:{nonce}:{ha2}".encode(), usedforsecurity=False).hexdigest()
         
         return response
     
+    def _parse_message(self, data: bytes, merge_duplicates: bool) -> Tuple[str, Dict[str, str], str, str]:
+        """
+        单次遍历解析 SIP 报文（请求/响应共用）
+        
+        Args:
+            data: 原始报文（bytes 或接收缓冲区的 memoryview）
+            merge_duplicates: 重复头部（如多个 Via）是否以逗号合并；False 时后出现的覆盖先出现的
+        
+        Returns:
+            (起始行, 头部字典（键为小写，仅包含 _WANTED_HEADERS）, 消息体, 解码后的完整报文)
+        """
+        text = str(data, 'utf-8')
+        # 一次查找定位头部与消息体的分界（第一个空行）
+        head, _, body = text.partition('\r\n\r\n')
+        lines = head.split('\r\n')
+        
+        headers = {}
+        key = None
+        for line in lines[1:]:
+            if line[:1] in (' ', '\t'):
+                # 多行头部的继续行（RFC 3261）
+                if key is not None:
+                    headers[key] += ' ' + line.strip()
+                continue
+            name, sep, value = line.partition(':')
+            if not sep:
+                continue
+            key = name.strip().lower()
+            if key not in _WANTED_HEADERS:
+                # 不关心的头部：其继续行也一并跳过
+                key = None
+                continue
+            value = value.strip()
+            if merge_duplicates and key in headers:
+                # 如果头部已存在，追加（如多个 Via 头）
+                headers[key] = headers[key] + ', ' + value
+            else:
+                headers[key] = value
+        
+        return lines[0], headers, body, text
+    
     def _parse_response(self, data: bytes) -> Dict:
         """解析 SIP 响应"""
         try:
-            text = data.decode('utf-8')
-            lines = text.split('\r\n')
+            status_line, headers, body, text = self._parse_message(data, merge_duplicates=False)
             
             # 解析状态行
-            status_line = lines[0]
             parts = status_line.split(maxsplit=2)
             status_code = int(parts[1]) if len(parts) > 1 else 0
             status_text = parts[2] if len(parts) > 2 else ""
             
-            # 解析头部
-            headers = {}
-            body_start = False
-            body_lines = []
-            
-            for i, line in enumerate(lines[1:], 1):
-                if body_start:
-                    body_lines.append(line)
-                elif line == "":
-                    body_start = True
-                elif ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip().lower()
-                    value = value.strip()
-                    headers[key] = value
-            
-            body = '\r\n'.join(body_lines) if body_lines else ""
-            
             return {
                 'status_code': status_code,
                 'status_text': status_text,
@@ -201,65 +288,18 @@ class SIPClient:
                 'raw': text
             }
         except Exception as e:
-            return {'error': str(e), 'raw': data.decode('utf-8', errors='ignore')}
+            return {'error': str(e), 'raw': str(data, 'utf-8', 'ignore')}
     
     def _parse_request(self, data: bytes) -> Dict:
         """解析 SIP 请求"""
         try:
-            text = data.decode('utf-8')
-            lines = text.split('\r\n')
+            request_line, headers, body, text = self._parse_message(data, merge_duplicates=True)
             
             # 解析请求行：METHOD Request-URI SIP/2.0
-            request_line = lines[0]
             parts = request_line.split(maxsplit=2)
             method = parts[0] if len(parts) > 0 else ""
             request_uri = parts[1] if len(parts) > 1 else ""
             
-            # 解析头部（处理多行头部，如 Via）
-            headers = {}
-            body_start = False
-            body_lines = []
-            current_header = None
-            current_value = None
-            
-            for i, line in enumerate(lines[1:], 1):
-                if body_start:
-                    body_lines.append(line)
-                elif line == "":
-                    body_start = True
-                    # 保存最后一个头部
-                    if current_header and current_value:
-                        headers[current_header] = current_value
-                        current_header = None
-                        current_value = None
-                elif line.startswith(' ') or line.startswith('\t'):
-                    # 这是多行头部的继续行（RFC 3261）
-                    if current_header and current_value:
-                        current_value += ' ' + line.strip()
-                elif ':' in line:
-                    # 保存之前的头部
-                    if current_header and current_value:
-                        headers[current_header] = current_value
-                    
-                    # 解析新的头部
-                    key, value = line.split(':', 1)
-                    key = key.strip().lower()
-                    value = value.strip()
-                    
-                    # 对于某些头部（如 Via），可能需要合并多个值
-                    if key in headers:
-                        # 如果头部已存在，追加（如多个 Via 头）
-                        headers[key] = headers[key] + ', ' + value
-                    else:
-                        current_header = key
-                        current_value = value
-            
-            # 保存最后一个头部（如果还有未保存的）
-            if current_header and current_value and not body_start:
-                headers[current_header] = current_value
-            
-            body = '\r\n'.join(body_lines) if body_lines else ""
-            
             return {
                 'method': method,
                 'request_uri': request_uri,
@@ -268,7 +308,7 @@ class SIPClient:
                 'raw': text
             }
         except Exception as e:
-            return {'error': str(e), 'raw': data.decode('utf-8', errors='ignore')}
+            return {'error': str(e), 'raw': str(data, 'utf-8', 'ignore')}
     
     def _handle_request(self, data: bytes, addr: Tuple[str, int]):
         """处理收到的 SIP 请求（如 BYE）"""
@@ -321,12 +361,10 @@ class SIPClient:
         via_header = req.get('headers', {}).get('via', '')
         
         # 提取 From tag（用于 To 头）
-        from_tag_match = re.search(r'tag=([^;>\s]+)', from_header)
-        from_tag = from_tag_match.group(1) if from_tag_match else ""
+        from_tag = _extract_tag(from_header)
         
         # 提取 To tag（用于 From 头）
-        to_tag_match = re.search(r'tag=([^;>\s]+)', to_header)
-        to_tag = to_tag_match.group(1) if to_tag_match else ""
+        to_tag = _extract_tag(to_header)
         
         # 解析 Via 头（可能有多个，取第一个/顶层 Via）
         # RFC 3261: 响应必须通过顶层 Via 头路由回去
@@ -347,9 +385,8 @@ class SIPClient:
                 print(f"[SIP] 顶层 Via: {first_via[:150]}...")
                 
                 # 解析 Via sent-by（格式：SIP/2.0/UDP host:port;branch=xxx）
-                via_match = re.search(r'SIP/2\.0/UDP\s+([^;]+)', first_via)
-                if via_match:
-                    via_sent_by = via_match.group(1).strip()
+                via_sent_by = _extract_via_sent_by(first_via)
+                if via_sent_by:
                     print(f"[SIP] 提取 sent-by: {via_sent_by}")
                     
                     # 检查是否是服务器地址
@@ -371,9 +408,8 @@ class SIPClient:
                 first_via = via_header.strip()
                 print(f"[SIP] 单个 Via 头: {first_via[:150]}...")
                 
-                via_match = re.search(r'SIP/2\.0/UDP\s+([^;]+)', first_via)
-                if via_match:
-                    via_sent_by = via_match.group(1).strip()
+                via_sent_by = _extract_via_sent_by(first_via)
+                if via_sent_by:
                     print(f"[SIP] 提取 sent-by: {via_sent_by}")
         
         # 如果无法从 Via 头解析地址，或 Via 头指向非服务器地址，使用请求来源地址
@@ -389,38 +425,17 @@ class SIPClient:
                 print(f"[SIP] 警告: 使用服务器配置地址: {via_sent_by}")
         
         # 构建 200 OK 响应（按 SIP 标准顺序，确保格式正确）
-        response_lines = []
-        
-        # 状态行
-        response_lines.append("SIP/2.0 200 OK")
-        
-        # Via 头（必须保留，用于响应路由）
-        if via_header:
-            response_lines.append(f"Via: {via_header}")
-        
-        # From 头（必须保留原样）
-        if from_header:
-            response_lines.append(f"From: {from_header}")
-        
-        # To 头（必须保留原样）
-        if to_header:
-            response_lines.append(f"To: {to_header}")
-        
-        # Call-ID 头
-        response_lines.append(f"Call-ID: {call_id}")
-        
-        # CSeq 头（必须保留原样）
-        if cseq_header:
-            response_lines.append(f"CSeq: {cseq_header}")
-        
-        # Content-Length 头
-        response_lines.append("Content-Length: 0")
-        
-        # 空行（分隔头部和消息体）
-        response_lines.append("")
-        
-        # 确保格式正确：用 \r\n 分隔，最后必须有 \r\n
-        response_msg = '\r\n'.join(response_lines)
+        # Via/From/To/CSeq 必须保留原样（Via 用于响应路由），缺失时省略该行
+        via_line = f"Via: {via_header}\r\n" if via_header else ""
+        from_line = f"From: {from_header}\r\n" if from_header else ""
+        to_line = f"To: {to_header}\r\n" if to_header else ""
+        cseq_line = f"CSeq: {cseq_header}\r\n" if cseq_header else ""
+        # 一次拼接完整报文，以空行结束头部
+        response_msg = (
+            f"SIP/2.0 200 OK\r\n{via_line}{from_line}{to_line}"
+            f"Call-ID: {call_id}\r\n{cseq_line}"
+            f"Content-Length: 0\r\n\r\n"
+        )
         
         # 调试：打印响应消息（截断）
         if len(response_msg) > 200:
@@ -493,6 +508,38 @@ class SIPClient:
             self.sock.settimeout(5.0)
             print(f"[SIP] Socket 已绑定: {self.local_ip}:{self.local_port}")
     
+    def _build_register(self, call_id: str, from_tag: str, branch: str, cseq: int,
+                        expires: int, auth_value: Optional[str] = None) -> bytes:
+        """
+        构建 REGISTER 报文字节
+        
+        用户名/服务器/本地地址相关的部分预先编码并缓存（本地端口变化时重建），
+        每次只编码 branch、tag、Call-ID 等可变字段
+        """
+        key = (self.username, self.server_ip, self.local_ip, self.local_port)
+        if self._register_parts is None or self._register_parts[0] != key:
+            user_uri = f"sip:{self.username}@{self.server_ip}"
+            fragments = (
+                f"REGISTER sip:{self.server_ip} SIP/2.0\r\n"
+                f"Via: SIP/2.0/UDP {self.local_ip}:{self.local_port};branch=".encode('utf-8'),
+                f"\r\nFrom: <{user_uri}>;tag=".encode('utf-8'),
+                f"\r\nTo: <{user_uri}>\r\nCall-ID: ".encode('utf-8'),
+                f"Contact: <sip:{self.username}@{self.local_ip}:{self.local_port}>\r\nExpires: ".encode('utf-8'),
+            )
+            self._register_parts = (key, fragments)
+        head, from_prefix, to_callid, contact = self._register_parts[1]
+        
+        parts = [
+            head, branch.encode('utf-8'),
+            from_prefix, from_tag.encode('utf-8'),
+            to_callid, call_id.encode('utf-8'),
+            b"\r\nCSeq: %d REGISTER\r\n" % cseq,
+        ]
+        if auth_value:
+            parts += (b"Authorization: ", auth_value.encode('utf-8'), b"\r\n")
+        parts += (contact, b"%d" % expires, b"\r\nMax-Forwards: 70\r\nContent-Length: 0\r\n\r\n")
+        return b"".join(parts)
+    
     def register(self, expires: int = 3600) -> bool:
         """
         注册到 SIP 服务器
@@ -529,22 +576,10 @@ class SIPClient:
             branch = self._gen_branch()
             
             # 第一次 REGISTER（无认证）
-            register_msg = (
-                f"REGISTER sip:{self.server_ip} SIP/2.0\r\n"
-                f"Via: SIP/2.0/UDP {self.local_ip}:{self.local_port};branch={branch}\r\n"
-                f"From: <sip:{self.username}@{self.server_ip}>;tag={from_tag}\r\n"
-                f"To: <sip:{self.username}@{self.server_ip}>\r\n"
-                f"Call-ID: {call_id}\r\n"
-                f"CSeq: 1 REGISTER\r\n"
-                f"Contact: <sip:{self.username}@{self.local_ip}:{self.local_port}>\r\n"
-                f"Expires: {expires}\r\n"
-                f"Max-Forwards: 70\r\n"
-                f"Content-Length: 0\r\n"
-                f"\r\n"
-            )
+            register_msg = self._build_register(call_id, from_tag, branch, 1, expires)
             
             # 发送 REGISTER
-            temp_sock.sendto(register_msg.encode('utf-8'), (self.server_ip, self.server_port))
+            temp_sock.sendto(register_msg, (self.server_ip, self.server_port))
             print(f"[SIP] REGISTER 已发送，等待响应...")
             
             # 接收响应
@@ -561,9 +596,9 @@ class SIPClient:
                 # 需要认证
                 auth_header = resp['headers'].get('www-authenticate', '')
                 
-                realm_match = re.search(r'realm="([^"]+)"', auth_header)
-                nonce_match = re.search(r'nonce="([^"]+)"', auth_header)
-                qop_match = re.search(r'qop="([^"]+)"', auth_header)
+                realm_match = _RE_REALM.search(auth_header)
+                nonce_match = _RE_NONCE.search(auth_header)
+                qop_match = _RE_QOP.search(auth_header)
                 
                 if not realm_match or not nonce_match:
                     print(f"[ERROR] 无法解析认证头")
@@ -577,7 +612,7 @@ class SIPClient:
                 uri = f"sip:{self.server_ip}"
                 
                 if qop:
-                    cnonce = f"{random.randint(100000, 999999)}"
+                    cnonce = os.urandom(4).hex()
                     nc = "00000001"
                     response = self._compute_response(self.username, realm, self.password, 
                                                       uri, "REGISTER", nonce, qop, cnonce, nc)
@@ -587,23 +622,11 @@ class SIPClient:
                                                       uri, "REGISTER", nonce)
                     auth_value = f'Digest username="{self.username}", realm="{realm}", nonce="{nonce}", uri="{uri}", response="{response}"'
                 
-                register_msg = (
-                    f"REGISTER sip:{self.server_ip} SIP/2.0\r\n"
-                    f"Via: SIP/2.0/UDP {self.local_ip}:{self.local_port};branch={self._gen_branch()}\r\n"
-                    f"From: <sip:{self.username}@{self.server_ip}>;tag={from_tag}\r\n"
-                    f"To: <sip:{self.username}@{self.server_ip}>\r\n"
-                    f"Call-ID: {call_id}\r\n"
-                    f"CSeq: 2 REGISTER\r\n"
-                    f"Authorization: {auth_value}\r\n"
-                    f"Contact: <sip:{self.username}@{self.local_ip}:{self.local_port}>\r\n"
-                    f"Expires: {expires}\r\n"
-                    f"Max-Forwards: 70\r\n"
-                    f"Content-Length: 0\r\n"
-                    f"\r\n"
-                )
+                register_msg = self._build_register(call_id, from_tag, self._gen_branch(), 2,
+                                                    expires, auth_value)
                 
                 # 发送带认证的 REGISTER
-                temp_sock.sendto(register_msg.encode('utf-8'), (self.server_ip, self.server_port))
+                temp_sock.sendto(register_msg, (self.server_ip, self.server_port))
                 print(f"[SIP] 带认证的 REGISTER 已发送，等待最终响应...")
                 
                 # 接收最终响应
@@ -646,6 +669,7 @@ class SIPClient:
             return
         
         self._ensure_socket()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
         self._running = True
         self._listener_thread = threading.Thread(target=self._listen_responses, daemon=True)
         self._listener_thread.start()
@@ -658,18 +682,21 @@ class SIPClient:
         
         self._running = False
         
-        # 尝试唤醒 recvfrom
-        if self.sock:
+        # 唤醒阻塞在 select 上的监听线程
+        if self._wakeup_w:
             try:
-                temp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                temp_sock.sendto(b"STOP", (self.local_ip, self.local_port))
-                temp_sock.close()
-            except:
+                self._wakeup_w.send(b"\0")
+            except OSError:
                 pass
         
         if self._listener_thread:
             self._listener_thread.join(timeout=2.0)
         
+        for wakeup in (self._wakeup_r, self._wakeup_w):
+            if wakeup:
+                wakeup.close()
+        self._wakeup_r = self._wakeup_w = None
+        
         if self.sock:
             try:
                 self.sock.close()
@@ -681,22 +708,32 @@ class SIPClient:
     
     def _listen_responses(self):
         """监听 SIP 响应和请求（后台线程）"""
+        # 同时等待 SIP 报文和停止信号，空闲时不再按超时醒来轮询
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        selector.register(self._wakeup_r, selectors.EVENT_READ)
+        try:
+            self._listen_loop(selector)
+        finally:
+            selector.close()
+    
+    def _listen_loop(self, selector: selectors.BaseSelector):
+        """监听主循环：每次 select 就绪后收取一个报文并分发"""
         while self._running:
             try:
                 if self.sock is None:
                     break
                 
-                data, addr = self.sock.recvfrom(4096)
-                
-                # 忽略 STOP 消息
-                if data == b"STOP":
-                    continue
+                ready = [key.fileobj for key, _ in selector.select()]
+                if not self._running or self._wakeup_r in ready:
+                    break
                 
-                # 判断是请求还是响应（响应以 "SIP/2.0" 开头）
-                text = data.decode('utf-8', errors='ignore')
-                first_line = text.split('\r\n')[0] if text else ""
+                # 收到复用缓冲区中，只取本次报文长度的视图（解析时才解码为 str）
+                n, addr = self.sock.recvfrom_into(self._recv_buf)
+                data = memoryview(self._recv_buf)[:n]
                 
-                if first_line.startswith('SIP/2.0'):
+                # 判断是请求还是响应（响应以 "SIP/2.0" 开头）：直接检查原始字节，不解码整个报文
+                if self._recv_buf.startswith(b'SIP/2.0', 0, n):
                     # 这是响应
                     resp = self._parse_response(data)
                     call_id = resp.get('headers', {}).get('call-id', '')
@@ -776,22 +813,22 @@ class SIPClient:
     def parse_sdp_answer(self, sdp_body: str) -> Optional[Tuple[str, int]]:
         """解析 SDP Answer，提取 RTP 地址和端口"""
         try:
-            lines = sdp_body.split('\r\n')
-            
-            # 查找 c= 行
+            # 单次遍历：取第一个 c= 行和第一个 m=audio 行，两者都找到即停止
             connection_ip = None
-            for line in lines:
-                if line.startswith('c=IN IP4 '):
-                    connection_ip = line.split()[2]
-                    break
-            
-            # 查找 m=audio 行
             rtp_port = None
-            for line in lines:
-                if line.startswith('m=audio '):
-                    parts = line.split()
+            seen_c = seen_m = False
+            for line in sdp_body.splitlines():
+                if not seen_c and line.startswith('c=IN IP4 '):
+                    connection_ip = line.split()[2]
+                    seen_c = True
+                elif not seen_m and line.startswith('m=audio '):
+                    parts = line.split(None, 2)
                     if len(parts) >= 2:
                         rtp_port = int(parts[1])
+                    seen_m = True
+                else:
+                    continue
+                if seen_c and seen_m:
                     break
             
             if connection_ip and rtp_port:
@@ -895,9 +932,9 @@ class SIPClient:
         elif status_code == 200:
             # 200 OK - 呼叫接通
             to_header = resp.get('headers', {}).get('to', '')
-            tag_match = re.search(r'tag=([^;>\s]+)', to_header)
-            if tag_match:
-                self.current_call.to_tag = tag_match.group(1)
+            to_tag = _extract_tag(to_header)
+            if to_tag:
+                self.current_call.to_tag = to_tag
             
             # 保存 Route 和 Contact 头（用于 in-dialog 请求）
             route_header = resp.get('headers', {}).get('record-route', '')
@@ -974,11 +1011,11 @@ class SIPClient:
                     # 只有一个 Route（通常是服务器地址）
                     # 检查是否是服务器地址
                     route_uri = routes[0]
-                    route_match = re.search(r'<?(sip:[^>;]+)', route_uri)
+                    route_match = _RE_ROUTE_URI.search(route_uri)
                     if route_match:
                         route_addr = route_match.group(1)
                         # 解析地址（格式：sip:ip:port 或 sip:user@ip:port）
-                        addr_match = re.search(r'sip:(?:[^@]+@)?([^:;]+)(?::(\d+))?', route_addr)
+                        addr_match = _RE_SIP_HOST_PORT.search(route_addr)
                         if addr_match:
                             route_host = addr_match.group(1)
                             route_port = int(addr_match.group(2)) if addr_match.group(2) else 5060
@@ -986,7 +1023,7 @@ class SIPClient:
                             if route_host == self.server_ip and route_port == self.server_port:
                                 # 使用 Contact 头的地址（被叫地址）
                                 if self.current_call.contact_header:
-                                    contact_match = re.search(r'<?(sip:[^>]+)', self.current_call.contact_header)
+                                    contact_match = _RE_CONTACT_URI.search(self.current_call.contact_header)
                                     if contact_match:
                                         ack_ruri = contact_match.group(1)
                                         print(f"[SIP] 单个 Route（服务器地址），使用 Contact 头作为 ACK Request-URI: {ack_ruri}")
@@ -1013,7 +1050,7 @@ class SIPClient:
                 else:
                     # 多个 Route，使用最后一个 Route 的地址（被叫地址）
                     last_route = routes[-1]
-                    route_match = re.search(r'<?(sip:[^>;]+)', last_route)
+                    route_match = _RE_ROUTE_URI.search(last_route)
                     if route_match:
                         ack_ruri = route_match.group(1)
                         print(f"[SIP] 多个 Route，使用最后一个 Route 作为 ACK Request-URI: {ack_ruri}")
@@ -1024,7 +1061,7 @@ class SIPClient:
         # 如果没有 Route 头，尝试使用 Contact 头
         if not ack_ruri and self.current_call.contact_header:
             # 从 Contact 头提取地址（格式：<sip:user@ip:port> 或 sip:user@ip:port）
-            contact_match = re.search(r'<?(sip:[^>]+)', self.current_call.contact_header)
+            contact_match = _RE_CONTACT_URI.search(self.current_call.contact_header)
             if contact_match:
                 ack_ruri = contact_match.group(1)
                 print(f"[SIP] 使用 Contact 头作为 ACK Request-URI: {ack_ruri}")
@@ -1102,11 +1139,11 @@ class SIPClient:
                     # 只有一个 Route（通常是服务器地址）
                     # 检查是否是服务器地址
                     route_uri = routes[0]
-                    route_match = re.search(r'<?(sip:[^>;]+)', route_uri)
+                    route_match = _RE_ROUTE_URI.search(route_uri)
                     if route_match:
                         route_addr = route_match.group(1)
                         # 解析地址（格式：sip:ip:port 或 sip:user@ip:port）
-                        addr_match = re.search(r'sip:(?:[^@]+@)?([^:;]+)(?::(\d+))?', route_addr)
+                        addr_match = _RE_SIP_HOST_PORT.search(route_addr)
                         if addr_match:
                             route_host = addr_match.group(1)
                             route_port = int(addr_match.group(2)) if addr_match.group(2) else 5060
@@ -1114,7 +1151,7 @@ class SIPClient:
                             if route_host == self.server_ip and route_port == self.server_port:
                                 # 使用 Contact 头的地址（被叫地址）
                                 if self.current_call.contact_header:
-                                    contact_match = re.search(r'<?(sip:[^>]+)', self.current_call.contact_header)
+                                    contact_match = _RE_CONTACT_URI.search(self.current_call.contact_header)
                                     if contact_match:
                                         bye_ruri = contact_match.group(1)
                                         print(f"[SIP] 单个 Route（服务器地址），使用 Contact 头作为 BYE Request-URI: {bye_ruri}")
@@ -1141,7 +1178,7 @@ class SIPClient:
                 else:
                     # 多个 Route，使用最后一个 Route 的地址（被叫地址）
                     last_route = routes[-1]
-                    route_match = re.search(r'<?(sip:[^>;]+)', last_route)
+                    route_match = _RE_ROUTE_URI.search(last_route)
                     if route_match:
                         bye_ruri = route_match.group(1)
                         print(f"[SIP] 多个 Route，使用最后一个 Route 作为 BYE Request-URI: {bye_ruri}")
@@ -1152,7 +1189,7 @@ class SIPClient:
         # 如果没有 Route 头，尝试使用 Contact 头
         if not bye_ruri and self.current_call.contact_header:
             # 从 Contact 头提取地址（格式：<sip:user@ip:port> 或 sip:user@ip:port）
-            contact_match = re.search(r'<?(sip:[^>]+)', self.current_call.contact_header)
+            contact_match = _RE_CONTACT_URI.search(self.current_call.contact_header)
             if contact_match:
                 bye_ruri = contact_match.group(1)
                 print(f"[SIP] 使用 Contact 头作为 BYE Request-URI: {bye_ruri}")
@@ -1231,22 +1268,10 @@ class SIPClient:
                 branch = self._gen_branch()
                 
                 # 发送 REGISTER with Expires=0（注销）
-                register_msg = (
-                    f"REGISTER sip:{self.server_ip} SIP/2.0\r\n"
-                    f"Via: SIP/2.0/UDP {self.local_ip}:{self.local_port};branch={branch}\r\n"
-                    f"From: <sip:{self.username}@{self.server_ip}>;tag={from_tag}\r\n"
-                    f"To: <sip:{self.username}@{self.server_ip}>\r\n"
-                    f"Call-ID: {call_id}\r\n"
-                    f"CSeq: 1 REGISTER\r\n"
-                    f"Contact: <sip:{self.username}@{self.local_ip}:{self.local_port}>\r\n"
-                    f"Expires: 0\r\n"
-                    f"Max-Forwards: 70\r\n"
-                    f"Content-Length: 0\r\n"
-                    f"\r\n"
-                )
+                register_msg = self._build_register(call_id, from_tag, branch, 1, 0)
                 
                 # 发送 REGISTER
-                temp_sock.sendto(register_msg.encode('utf-8'), (self.server_ip, self.server_port))
+                temp_sock.sendto(register_msg, (self.server_ip, self.server_port))
                 
                 # 尝试接收响应（不阻塞太久）
                 try:
@@ -1257,9 +1282,9 @@ class SIPClient:
                         # 如果需要认证，发送带认证的注销请求
                         auth_header = resp['headers'].get('www-authenticate', '')
                         
-                        realm_match = re.search(r'realm="([^"]+)"', auth_header)
-                        nonce_match = re.search(r'nonce="([^"]+)"', auth_header)
-                        qop_match = re.search(r'qop="([^"]+)"', auth_header)
+                        realm_match = _RE_REALM.search(auth_header)
+                        nonce_match = _RE_NONCE.search(auth_header)
+                        qop_match = _RE_QOP.search(auth_header)
                         
                         if realm_match and nonce_match:
                             realm = realm_match.group(1)
@@ -1269,7 +1294,7 @@ class SIPClient:
                             uri = f"sip:{self.server_ip}"
                             
                             if qop:
-                                cnonce = f"{random.randint(100000, 999999)}"
+                                cnonce = os.urandom(4).hex()
                                 nc = "00000001"
                                 response = self._compute_response(self.username, realm, self.password, 
                                                                   uri, "REGISTER", nonce, qop, cnonce, nc)
@@ -1279,22 +1304,10 @@ class SIPClient:
                                                                   uri, "REGISTER", nonce)
                                 auth_value = f'Digest username="{self.username}", realm="{realm}", nonce="{nonce}", uri="{uri}", response="{response}"'
                             
-                            register_msg = (
-                                f"REGISTER sip:{self.server_ip} SIP/2.0\r\n"
-                                f"Via: SIP/2.0/UDP {self.local_ip}:{self.local_port};branch={self._gen_branch()}\r\n"
-                                f"From: <sip:{self.username}@{self.server_ip}>;tag={from_tag}\r\n"
-                                f"To: <sip:{self.username}@{self.server_ip}>\r\n"
-                                f"Call-ID: {call_id}\r\n"
-                                f"CSeq: 2 REGISTER\r\n"
-                                f"Authorization: {auth_value}\r\n"
-                                f"Contact: <sip:{self.username}@{self.local_ip}:{self.local_port}>\r\n"
-                                f"Expires: 0\r\n"
-                                f"Max-Forwards: 70\r\n"
-                                f"Content-Length: 0\r\n"
-                                f"\r\n"
-                            )
+                            register_msg = self._build_register(call_id, from_tag, self._gen_branch(), 2,
+                                                                0, auth_value)
                             
-                            temp_sock.sendto(register_msg.encode('utf-8'), (self.server_ip, self.server_port))
+                            temp_sock.sendto(register_msg, (self.server_ip, self.server_port))
                             
                             # 接收最终响应
                             try:
@@ -1850,10 +1863,12 @@ class AutoDialerClient:
             return DEFAULT_CONFIG.copy()
     
     def _save_config(self, config: Dict, config_file: str):
-        """保存配置文件"""
+        """保存配置文件（先写临时文件再原子替换，避免写入中断导致文件损坏）"""
         try:
-            with open(config_file, 'w', encoding='utf-8') as f:
+            tmp_file = f"{config_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_file, config_file)
         except Exception as e:
             print(f"[WARNING] 无法保存配置文件 {config_file}: {e}")
     
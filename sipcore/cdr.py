@@ -6,7 +6,10 @@ CDR (Call Detail Record) 话单系统
 
 import os
 import csv
+import time
+import atexit
 import threading
+from collections import deque
 from datetime import datetime
 from typing import Dict, Any, Optional
 from pathlib import Path
@@ -76,13 +79,15 @@ class CDRWriter:
         "extra_info",          # 额外信息
     ]
     
-    def __init__(self, base_dir: str = "CDR", merge_mode: bool = True):
+    def __init__(self, base_dir: str = "CDR", merge_mode: bool = True, flush_interval: float = 0):
         """
         初始化 CDR 写入器
         
         Args:
             base_dir: CDR 文件根目录
             merge_mode: 是否启用合并模式（同一 call_id 合并为一条记录）
+            flush_interval: 批量写入间隔（秒）；大于 0 时话单先进入待写队列，
+                            由后台写入线程每隔 flush_interval 统一落盘，0 表示每条立即写入
         """
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(exist_ok=True)
@@ -101,6 +106,17 @@ class CDRWriter:
         # key: call_id, value: record_type (CALL/REGISTER/MESSAGE/OPTIONS)
         self.flushed_records: Dict[str, str] = {}
         
+        # 批量写入（flush_interval > 0 时使用）
+        self.flush_interval = flush_interval
+        self._pending_rows: deque = deque()  # 待写入的话单行（生产者只 append，写入线程 popleft）
+        self._pending_event = threading.Event()  # 有新话单待写入
+        self._write_lock = threading.Lock()  # 串行化落盘
+        if flush_interval > 0:
+            # 常驻写入线程：话单处理线程只负责入队，不等待文件 I/O
+            threading.Thread(target=self._writer_loop, name="cdr-writer", daemon=True).start()
+            # 进程退出前写入尚未落盘的话单
+            atexit.register(self.flush_pending)
+        
     def _get_daily_file(self) -> Path:
         """获取当天的 CDR 文件路径"""
         today = datetime.now()
@@ -200,11 +216,7 @@ class CDRWriter:
             
             # 写入文件
             record = self.record_cache.pop(call_id)
-            csv_file = self._get_daily_file()
-            
-            with open(csv_file, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=self.FIELDS)
-                writer.writerow(record)
+            self._append_row(record)
             
             # 标记为已写入（包含时间戳，用于后续清理）
             self.flushed_records[call_id] = {
@@ -244,6 +256,9 @@ class CDRWriter:
         for call_id in call_ids:
             self.flush_record(call_id)
         
+        # 写入待写队列中的话单
+        self.flush_pending()
+        
         # 清理旧的已写入标记
         self.cleanup_flushed_records()
     
@@ -280,10 +295,50 @@ class CDRWriter:
         
         # 写入文件（线程安全）
         with self.lock:
-            csv_file = self._get_daily_file()
-            with open(csv_file, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=self.FIELDS)
-                writer.writerow(record)
+            self._append_row(record)
+    
+    def _append_row(self, record: Dict[str, Any]):
+        """
+        写入一行话单（需持有 self.lock）
+        启用批量写入时只追加到待写队列，由写入线程统一落盘
+        """
+        if self.flush_interval <= 0:
+            self._write_rows([record])
+            return
+        self._pending_rows.append(record)
+        self._pending_event.set()
+    
+    def _writer_loop(self):
+        """写入线程：有新话单时等待 flush_interval 攒批，再整批落盘"""
+        while True:
+            self._pending_event.wait()
+            self._pending_event.clear()
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_pending()
+            except Exception as e:
+                try:
+                    from .logger import get_logger
+                    get_logger().error(f"[CDR] Failed to write pending records: {e}")
+                except:
+                    pass
+    
+    def _write_rows(self, rows: list):
+        """打开一次当天的 CDR 文件写入多行"""
+        csv_file = self._get_daily_file()
+        with open(csv_file, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+            writer.writerows(rows)
+    
+    def flush_pending(self):
+        """立即写入待写队列中的话单（只从队头取出，不阻塞入队）"""
+        with self._write_lock:
+            pending = self._pending_rows
+            rows = []
+            while pending:
+                rows.append(pending.popleft())
+            if rows:
+                self._write_rows(rows)
     
     def start_session(self, call_id: str, **session_info):
         """
@@ -533,8 +588,12 @@ class CDRWriter:
             # 不立即 flush，等待呼叫结束
     
     def record_message(self, call_id: str, caller_uri: str, callee_uri: str,
-                      caller_addr: tuple, message_body: str = "", **kwargs):
-        """记录短信/消息"""
+                      caller_addr: tuple, message_body: str | bytes = "", **kwargs):
+        """记录短信/消息（message_body 可直接传入原始字节）"""
+        if isinstance(message_body, (bytes, bytearray, memoryview)):
+            # 话单只保留前 500 个字符：先截取足够的字节（UTF-8 每字符最多 4 字节）再解码，
+            # 避免整段消息体解码
+            message_body = bytes(message_body[:2000]).decode('utf-8', errors='ignore')
         self.write_record(
             record_type="MESSAGE",
             call_state="COMPLETED",
@@ -580,6 +639,9 @@ class CDRWriter:
         if date is None:
             date = datetime.now().strftime("%Y-%m-%d")
         
+        # 先写入待写队列中的话单，保证统计完整
+        self.flush_pending()
+        
         csv_file = self.base_dir / date / f"cdr_{date}.csv"
         if not csv_file.exists():
             return {}
@@ -628,13 +690,14 @@ class CDRWriter:
 _cdr_instance: Optional[CDRWriter] = None
 
 
-def init_cdr(base_dir: str = "CDR", merge_mode: bool = True) -> CDRWriter:
+def init_cdr(base_dir: str = "CDR", merge_mode: bool = True, flush_interval: float = 0) -> CDRWriter:
     """
     初始化全局 CDR 实例（单例模式）
     
     Args:
         base_dir: CDR 文件根目录
         merge_mode: 是否启用合并模式
+        flush_interval: 批量写入间隔（秒），0 表示每条立即写入
     
     Returns:
         CDRWriter 实例
@@ -649,7 +712,7 @@ def init_cdr(base_dir: str = "CDR", merge_mode: bool = True) -> CDRWriter:
         return _cdr_instance
     
     # 创建新实例
-    _cdr_instance = CDRWriter(base_dir, merge_mode=merge_mode)
+    _cdr_instance = CDRWriter(base_dir, merge_mode=merge_mode, flush_interval=flush_interval)
     
     # 只在真正创建实例时输出日志
     try:
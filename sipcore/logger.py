@@ -228,6 +228,11 @@ class SIPLogger:
     def __init__(self, name: str = "ims-sip-server"):
         self.logger = logging.getLogger(name)
     
+    @property
+    def debug_on(self) -> bool:
+        """DEBUG 级别是否启用（热路径先判断再拼接 f-string，关闭 DEBUG 时省去格式化开销）"""
+        return self.logger.isEnabledFor(logging.DEBUG)
+    
     def debug(self, msg: str, *args, **kwargs):
         """DEBUG 级别日志"""
         self.logger.debug(msg, *args, **kwargs)
@@ -28,13 +28,31 @@ class SIPMessage:
 
     def to_bytes(self) -> bytes:
         lines = [self.start_line]
+        append = lines.append
+        canon = _CANON_NAMES.get
         for k, vs in self.headers.items():
-            for v in vs:
-                lines.append(f"{self._canon(k)}: {v}")
-        # Header 部分结尾要加两个 CRLF：一个 join 的结尾 + 一个额外空行
-        data = CRLF.join(lines) + CRLF * 2
-        return data.encode() + (self.body or b"")
+            name = canon(k) or self._canon(k)
+            if len(vs) == 1:
+                append(f"{name}: {vs[0]}")
+            else:
+                lines.extend([f"{name}: {v}" for v in vs])
+        # Header 部分结尾要加两个 CRLF：追加两个空串，由同一次 join 生成，不再额外拼接字符串
+        append("")
+        append("")
+        head = CRLF.join(lines).encode()
+        return head + self.body if self.body else head
 
     @staticmethod
     def _canon(k: str) -> str:
-        return "-".join(p.capitalize() for p in k.split("-"))
+        name = _CANON_NAMES.get(k)
+        if name is None:
+            name = "-".join(p.capitalize() for p in k.split("-"))
+            # 头域名种类有限，缓存规范化结果，避免每次序列化都 split/capitalize/join
+            if len(_CANON_NAMES) < _CANON_NAMES_MAX:
+                _CANON_NAMES[k] = name
+        return name
+
+
+# 小写头域名 -> 规范化写法（如 call-id -> Call-Id）
+_CANON_NAMES: Dict[str, str] = {}
+_CANON_NAMES_MAX = 1024  # 防止异常报文中的随机头域名无限增长
@@ -11,16 +11,23 @@ def parse(raw: bytes) -> SIPMessage:
     start = lines[0]
     headers = {}
     cur = None
-    for line in lines[1:]:
-        if line == "":
+    # 单次遍历头域行：partition 代替 split(":", 1)，避免为每行分配列表
+    for i in range(1, len(lines)):
+        line = lines[i]
+        if not line:
             break
-        if (line.startswith(" ") or line.startswith("\t")) and cur:
+        if cur and line[0] in " \t":
+            # 折行：续接到上一个头域值
             headers[cur][-1] += " " + line.strip()
+            continue
+        name, colon, val = line.partition(":")
+        if not colon:
+            continue
+        name_l = name.lower()
+        vals = headers.get(name_l)
+        if vals is None:
+            headers[name_l] = [val.strip()]
         else:
-            if ":" not in line:
-                continue
-            name, val = line.split(":", 1)
-            name_l = name.lower()
-            headers.setdefault(name_l, []).append(val.strip())
-            cur = name_l
+            vals.append(val.strip())
+        cur = name_l
     return SIPMessage(start_line=start, headers=headers, body=body)
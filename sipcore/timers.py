@@ -23,6 +23,7 @@ RFC 3261 推荐值：
 
 import asyncio
 import time
+from contextlib import nullcontext
 from typing import Dict, Tuple, Callable
 import logging
 
@@ -59,7 +60,8 @@ class SIPTimers:
                    pending_requests: Dict,
                    dialogs: Dict,
                    invite_branches: Dict,
-                   reg_bindings: Dict):
+                   reg_bindings: Dict,
+                   reg_lock=None):
         """
         启动所有定时器
         
@@ -68,6 +70,7 @@ class SIPTimers:
             dialogs: DIALOGS 字典引用
             invite_branches: INVITE_BRANCHES 字典引用
             reg_bindings: REG_BINDINGS 字典引用
+            reg_lock: 保护 REG_BINDINGS 的锁（与注册处理、自动外呼清理共享），None 表示不加锁
         """
         self._running = True
         
@@ -82,7 +85,7 @@ class SIPTimers:
             self._cleanup_invite_branches(invite_branches)
         ))
         self._tasks.append(asyncio.create_task(
-            self._cleanup_expired_registrations(reg_bindings)
+            self._cleanup_expired_registrations(reg_bindings, reg_lock)
         ))
         
         self.log.info("[TIMERS] Started all SIP timers")
@@ -236,12 +239,14 @@ class SIPTimers:
             except Exception as e:
                 self.log.error(f"[TIMER-H] Error in INVITE branch cleanup: {e}")
     
-    async def _cleanup_expired_registrations(self, reg_bindings: Dict):
+    async def _cleanup_expired_registrations(self, reg_bindings: Dict, reg_lock=None):
         """
         清理过期的注册绑定
         
         RFC 3261: Contact 绑定在 expires 时间后自动失效
+        每个 AOR 的读取-过滤-回写在 reg_lock 内完成，避免与其他线程（自动外呼清理）交错
         """
+        lock = reg_lock if reg_lock is not None else nullcontext()
         while self._running:
             try:
                 await asyncio.sleep(REGISTRATION_CHECK)
@@ -250,21 +255,29 @@ class SIPTimers:
                 total_expired = 0
                 
                 for aor in list(reg_bindings.keys()):
-                    bindings = reg_bindings[aor]
-                    original_count = len(bindings)
+                    with lock:
+                        bindings = reg_bindings.get(aor)
+                        if bindings is None:
+                            # 已被其他线程删除
+                            continue
+                        original_count = len(bindings)
+                        
+                        # 过滤掉已过期的绑定
+                        reg_bindings[aor] = [b for b in bindings if b["expires"] > now]
+                        
+                        expired_count = original_count - len(reg_bindings[aor])
+                        
+                        # 如果 AOR 没有绑定了，删除这个 AOR
+                        removed = not reg_bindings[aor]
+                        if removed:
+                            del reg_bindings[aor]
                     
-                    # 过滤掉已过期的绑定
-                    reg_bindings[aor] = [b for b in bindings if b["expires"] > now]
-                    
-                    expired_count = original_count - len(reg_bindings[aor])
                     total_expired += expired_count
                     
                     if expired_count > 0:
                         self.log.info(f"[TIMER-REG] Cleaned up {expired_count} expired binding(s) for {aor}")
                     
-                    # 如果 AOR 没有绑定了，删除这个 AOR
-                    if not reg_bindings[aor]:
-                        del reg_bindings[aor]
+                    if removed:
                         self.log.debug(f"[TIMER-REG] Removed AOR {aor} (no bindings left)")
                 
                 if total_expired > 0:
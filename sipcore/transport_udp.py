@@ -1,19 +1,59 @@
 # sipcore/transport_udp.py
 import asyncio
+import socket
+from collections import deque
 from typing import Callable
 from .logger import get_logger
 
 log = get_logger()
 
+# 单个 UDP 数据报的最大长度
+MAX_DATAGRAM_SIZE = 65535
+
+
+def _log_udp_error(exc: OSError):
+    # UDP 发送错误（目标不可达等）
+    # errno 65: No route to host (macOS/BSD)
+    # errno 113: No route to host (Linux)
+    # errno 101: Network is unreachable
+    if hasattr(exc, 'errno') and exc.errno in (65, 113, 101):
+        # 目标主机不可达是常见的网络状况（客户端下线、断网等）
+        # 使用 WARNING 而不是 ERROR，因为这不是服务器错误
+        log.warning(f"UDP: Target unreachable - {exc}")
+    else:
+        # 其他 UDP 错误
+        log.error(f"UDP server error: {exc}")
+
+
 class UDPServer:
-    def __init__(self, local=("0.0.0.0", 5060), handler: Callable[[bytes, tuple, asyncio.DatagramTransport], None]=None):
+    def __init__(self, local=("0.0.0.0", 5060), handler: Callable[[bytes, tuple, asyncio.DatagramTransport], None]=None,
+                 batch_size: int = 1, on_batch: Callable[[], None] | None = None):
+        """
+        Args:
+            local: 监听地址
+            handler: 数据报处理函数 handler(data, addr, transport)
+            batch_size: 每次可读事件最多连续收取的数据报数量；
+                        大于 1 时使用批量收取的传输（突发流量下减少事件循环唤醒次数），
+                        否则使用 asyncio 默认的数据报传输（每次唤醒收取一个）
+            on_batch: 批量收取模式下，每次可读事件处理数据报之前调用一次（如刷新时间缓存）
+        """
         self.local = local
         self.handler = handler
+        self.batch_size = batch_size
+        self.on_batch = on_batch
         self.transport: asyncio.DatagramTransport | None = None
 
     async def start(self):
         loop = asyncio.get_running_loop()
-        await loop.create_datagram_endpoint(
+        if self.batch_size > 1:
+            try:
+                self.transport = _BatchedUDPTransport(loop, self.local, self.handler, self.batch_size,
+                                                     self.on_batch)
+                return
+            except NotImplementedError:
+                # 事件循环不支持 add_reader（如 Windows Proactor），回退到默认传输
+                log.warning("UDP batched receive not supported by event loop, falling back")
+        self.transport, _ = await loop.create_datagram_endpoint(
             lambda: _UDPProtocol(self.handler),
             local_addr=self.local
         )
@@ -33,14 +73,94 @@ class _UDPProtocol(asyncio.DatagramProtocol):
             self.handler(data, addr, self.transport)
 
     def error_received(self, exc):
-        # UDP 发送错误（目标不可达等）
-        # errno 65: No route to host (macOS/BSD)
-        # errno 113: No route to host (Linux)  
-        # errno 101: Network is unreachable
-        if hasattr(exc, 'errno') and exc.errno in (65, 113, 101):
-            # 目标主机不可达是常见的网络状况（客户端下线、断网等）
-            # 使用 WARNING 而不是 ERROR，因为这不是服务器错误
-            log.warning(f"UDP: Target unreachable - {exc}")
-        else:
-            # 其他 UDP 错误
-            log.error(f"UDP server error: {exc}")
+        _log_udp_error(exc)
+
+class _BatchedUDPTransport:
+    """
+    批量收取的 UDP 传输
+
+    直接在非阻塞 socket 上注册读事件，每次唤醒连续收取至多 batch_size 个数据报并逐个交给 handler，
+    而不是每个数据报都经过一次事件循环调度。对外提供与 asyncio.DatagramTransport 相同的 sendto / get_extra_info。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, local, handler, batch_size: int, on_batch=None):
+        self._loop = loop
+        self._handler = handler
+        self._batch_size = batch_size
+        self._on_batch = on_batch
+        self._send_queue: deque = deque()  # 发送缓冲区满时暂存的数据报
+
+        family, type_, proto, _, sockaddr = socket.getaddrinfo(
+            local[0], local[1], type=socket.SOCK_DGRAM)[0]
+        sock = socket.socket(family, type_, proto)
+        try:
+            sock.setblocking(False)
+            sock.bind(sockaddr)
+            self._fileno = sock.fileno()
+            loop.add_reader(self._fileno, self._read_ready)
+        except BaseException:
+            sock.close()
+            raise
+        self._sock = sock
+        log.info(f"UDP server listening on {sock.getsockname()} (batch={batch_size})")
+
+    def get_extra_info(self, name, default=None):
+        if name == "sockname":
+            return self._sock.getsockname()
+        if name == "socket":
+            return self._sock
+        return default
+
+    def sendto(self, data, addr):
+        if self._send_queue:
+            # 已有排队数据：追加到队尾，保持发送顺序
+            self._send_queue.append((data, addr))
+            return
+        try:
+            self._sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            self._send_queue.append((data, addr))
+            self._loop.add_writer(self._fileno, self._write_ready)
+        except OSError as exc:
+            _log_udp_error(exc)
+
+    def _write_ready(self):
+        sendto = self._sock.sendto
+        queue = self._send_queue
+        while queue:
+            data, addr = queue[0]
+            try:
+                sendto(data, addr)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                _log_udp_error(exc)
+            queue.popleft()
+        self._loop.remove_writer(self._fileno)
+
+    def _read_ready(self):
+        if self._on_batch:
+            self._on_batch()
+        recvfrom = self._sock.recvfrom
+        handler = self._handler
+        for _ in range(self._batch_size):
+            try:
+                data, addr = recvfrom(MAX_DATAGRAM_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                _log_udp_error(exc)
+                return
+            if handler:
+                try:
+                    handler(data, addr, self)
+                except Exception as e:
+                    # 单个数据报处理失败不影响同批次的其他数据报
+                    log.error(f"UDP handler failed for {addr}: {e}")
+
+    def close(self):
+        self._loop.remove_reader(self._fileno)
+        if self._send_queue:
+            self._loop.remove_writer(self._fileno)
+            self._send_queue.clear()
+        self._sock.close()
@@ -1,6 +1,8 @@
 # sipcore/utils.py
+import ipaddress
 import random
 import string
+from bisect import bisect_right
 from datetime import datetime, timezone
 
 def gen_tag(n=8):
@@ -10,3 +12,40 @@ def sip_date():
     # RFC 1123 date
     return datetime.now(timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT")
 
+def compile_networks(entries):
+    """
+    将 IP / CIDR 字符串列表预编译为按 IP 版本分组的有序整数区间（主机名等无法解析的条目忽略）
+    
+    Returns:
+        {4: (starts, ends), 6: (starts, ends)}，区间已排序并合并重叠部分
+    """
+    spans = {4: [], 6: []}
+    for entry in entries:
+        try:
+            net = ipaddress.ip_network(entry, strict=False)
+        except ValueError:
+            continue
+        spans[net.version].append((int(net.network_address), int(net.broadcast_address)))
+    
+    ranges = {}
+    for version, items in spans.items():
+        starts, ends = [], []
+        for lo, hi in sorted(items):
+            if ends and lo <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], hi)
+            else:
+                starts.append(lo)
+                ends.append(hi)
+        ranges[version] = (starts, ends)
+    return ranges
+
+def in_networks(host, ranges):
+    """判断 host 是否落在 compile_networks 生成的区间内（二分查找）"""
+    try:
+        addr = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    starts, ends = ranges[addr.version]
+    ip = int(addr)
+    i = bisect_right(starts, ip) - 1
+    return i >= 0 and ip <= ends[i]
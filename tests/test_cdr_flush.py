@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+CDR 批量写入测试
+验证 flush_interval > 0 时话单先进入待写队列，由 flush_pending / 写入线程按顺序落盘
+"""
+
+import csv
+import time
+from datetime import datetime
+
+from sipcore.cdr import CDRWriter
+
+
+def _read_rows(base_dir):
+    date = datetime.now().strftime("%Y-%m-%d")
+    csv_file = base_dir / date / f"cdr_{date}.csv"
+    if not csv_file.exists():
+        return []
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def test_flush_pending_writes_rows_in_order(tmp_path):
+    """flush_pending 之前不落盘，之后按写入顺序追加，表头只写一次"""
+    writer = CDRWriter(base_dir=str(tmp_path), flush_interval=60)
+
+    for i in range(5):
+        writer.record_message(call_id=f"msg-{i}", caller_uri="sip:1001@example.com",
+                              callee_uri="sip:1002@example.com",
+                              caller_addr=("10.0.0.1", 5060), message_body=f"hello {i}")
+    # 写入线程要等 flush_interval 才落盘，此时文件中还没有这些话单
+    assert _read_rows(tmp_path) == []
+
+    writer.flush_pending()
+    rows = _read_rows(tmp_path)
+    assert [r["call_id"] for r in rows] == [f"msg-{i}" for i in range(5)]
+    assert [r["message_body"] for r in rows] == [f"hello {i}" for i in range(5)]
+    assert all(r["record_type"] == "MESSAGE" for r in rows)
+
+    for i in range(3):
+        writer.record_options(caller_uri="sip:1001@example.com", callee_uri="sip:1002@example.com",
+                              caller_addr=("10.0.0.1", 5060), call_id=f"opt-{i}")
+    writer.flush_pending()
+    rows = _read_rows(tmp_path)
+    assert [r["call_id"] for r in rows] == [f"msg-{i}" for i in range(5)] + [f"opt-{i}" for i in range(3)]
+
+    # 队列已清空，重复调用不会重复写入
+    writer.flush_pending()
+    assert len(_read_rows(tmp_path)) == 8
+
+
+def test_get_stats_flushes_pending(tmp_path):
+    """get_stats 先写入待写队列，统计包含尚未落盘的话单"""
+    writer = CDRWriter(base_dir=str(tmp_path), flush_interval=60)
+    writer.record_message(call_id="m1", caller_uri="sip:1001@example.com",
+                          callee_uri="sip:1002@example.com", caller_addr=("10.0.0.1", 5060))
+    writer.record_options(caller_uri="sip:1001@example.com", callee_uri="sip:1002@example.com",
+                          caller_addr=("10.0.0.1", 5060), call_id="o1")
+    stats = writer.get_stats()
+    assert stats["total_records"] == 2
+    assert stats["messages"] == 1
+    assert stats["options"] == 1
+
+
+def test_writer_thread_flushes_after_interval(tmp_path):
+    """不主动调用 flush_pending 时，写入线程在 flush_interval 后落盘"""
+    writer = CDRWriter(base_dir=str(tmp_path), flush_interval=0.05)
+    for i in range(3):
+        writer.record_message(call_id=f"t-{i}", caller_uri="sip:1001@example.com",
+                              callee_uri="sip:1002@example.com", caller_addr=("10.0.0.1", 5060))
+
+    deadline = time.time() + 5
+    rows = []
+    while time.time() < deadline:
+        rows = _read_rows(tmp_path)
+        if len(rows) == 3:
+            break
+        time.sleep(0.02)
+    assert [r["call_id"] for r in rows] == ["t-0", "t-1", "t-2"]
+
+
+if __name__ == '__main__':
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
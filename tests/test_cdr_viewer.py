@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+CDR 查看工具测试
+验证统计对不完整行（正在写入的行、旧格式记录）的容错
+"""
+
+from pathlib import Path
+
+from tools.cdr_viewer import load_cdr_file, _aggregate_statistics, show_statistics
+
+
+DATE = "2024-01-01"
+
+
+def _write_cdr(base: Path, text: str):
+    cdr_file = base / "CDR" / DATE / f"cdr_{DATE}.csv"
+    cdr_file.parent.mkdir(parents=True)
+    cdr_file.write_text(text, encoding="utf-8")
+
+
+def test_statistics_with_truncated_row(tmp_path, monkeypatch, capsys):
+    """比表头短的行按缺失字段处理，不应抛出 IndexError"""
+    monkeypatch.chdir(tmp_path)
+    _write_cdr(tmp_path,
+               "record_type,call_id,caller_number,duration\n"
+               "CALL_END,a,1001,30\n"
+               "CALL_END,b\n"
+               "MESSAGE,c,1002\n")
+
+    records, idx, _ = load_cdr_file(DATE)
+    rows = list(records)
+    assert rows[1] == ["CALL_END", "b", None, None]
+
+    total, type_counts, duration_total, duration_count, user_activity = _aggregate_statistics(iter(rows), idx)
+    assert total == 3
+    assert type_counts == {"CALL_END": 2, "MESSAGE": 1}
+    assert (duration_total, duration_count) == (30.0, 1)
+    assert user_activity == {"1001": 1, "1002": 1}
+
+    show_statistics(DATE)
+    out = capsys.readouterr().out
+    assert "总记录数: 3" in out
+    assert "平均通话时长: 30.0 秒" in out
+
+
+if __name__ == '__main__':
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+首选绑定缓存测试
+验证 _lookup_binding 在 REG_BINDINGS 被其他模块直接删除后不会保留过期缓存
+"""
+
+import pytest
+
+
+@pytest.fixture
+def run_module(monkeypatch):
+    """导入 run 模块，并替换为空的绑定表与缓存"""
+    import sipcore.cdr as cdr_module
+    # run 导入时会创建全局 CDR 单例（写入 CDR/），恢复原值以免影响其他测试
+    previous = cdr_module._cdr_instance
+    import run
+    cdr_module._cdr_instance = previous
+    monkeypatch.setattr(run, "REG_BINDINGS", {})
+    monkeypatch.setattr(run, "_AOR_PRIMARY", {})
+    return run
+
+
+def _binding(contact, expires=2000000000):
+    return {"contact": contact, "expires": expires}
+
+
+def test_cached_primary_binding(run_module):
+    aor = "sip:1001@example.com"
+    run_module.REG_BINDINGS[aor] = [_binding("sip:1001@10.0.0.1:5062")]
+    assert run_module._lookup_binding(aor) == ("sip:1001@10.0.0.1:5062", "10.0.0.1", 5062)
+    assert aor in run_module._AOR_PRIMARY
+
+    # 重新注册替换了绑定字典，缓存随之更新
+    run_module.REG_BINDINGS[aor] = [_binding("sip:1001@10.0.0.9:5070")]
+    assert run_module._lookup_binding(aor) == ("sip:1001@10.0.0.9:5070", "10.0.0.9", 5070)
+
+
+def test_removed_aor_drops_cache(run_module):
+    """定时清理/MML 直接删除 REG_BINDINGS[aor] 后，下次查找移除缓存条目"""
+    aor = "sip:1002@example.com"
+    run_module.REG_BINDINGS[aor] = [_binding("sip:1002@10.0.0.2:5060")]
+    run_module._lookup_binding(aor)
+    del run_module.REG_BINDINGS[aor]
+    assert run_module._lookup_binding(aor) is None
+    assert aor not in run_module._AOR_PRIMARY
+
+
+def test_cache_size_is_bounded(run_module, monkeypatch):
+    monkeypatch.setattr(run_module, "_AOR_PRIMARY_MAX", 4)
+    for i in range(10):
+        aor = f"sip:{2000 + i}@example.com"
+        run_module.REG_BINDINGS[aor] = [_binding(f"sip:{2000 + i}@10.0.0.{i}:5060")]
+        run_module._lookup_binding(aor)
+        assert len(run_module._AOR_PRIMARY) <= 4
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+SIP 解析器测试
+验证单次遍历的 parse 与原始实现（split(":", 1) 逐行解析）结果一致
+"""
+
+import random
+
+from sipcore.message import SIPMessage, CRLF
+from sipcore.parser import parse
+
+
+def _reference_parse(raw: bytes) -> SIPMessage:
+    """原始解析实现（作为对照）"""
+    head, sep, body = raw.partition(b"\r\n\r\n")
+    head_str = head.decode(errors="ignore")
+    lines = head_str.split(CRLF)
+    if not lines or lines[0].strip() == "":
+        raise ValueError("Invalid SIP start line")
+
+    start = lines[0]
+    headers = {}
+    cur = None
+    for line in lines[1:]:
+        if line == "":
+            break
+        if (line.startswith(" ") or line.startswith("\t")) and cur:
+            headers[cur][-1] += " " + line.strip()
+        else:
+            if ":" not in line:
+                continue
+            name, val = line.split(":", 1)
+            name_l = name.lower()
+            headers.setdefault(name_l, []).append(val.strip())
+            cur = name_l
+    return SIPMessage(start_line=start, headers=headers, body=body)
+
+
+def _assert_same(raw: bytes):
+    expected = _reference_parse(raw)
+    actual = parse(raw)
+    assert actual.start_line == expected.start_line
+    assert actual.headers == expected.headers
+    assert actual.body == expected.body
+
+
+def test_parse_folded_lines():
+    """折行（空格/制表符开头）续接到上一个头域"""
+    raw = (b"INVITE sip:1002@example.com SIP/2.0\r\n"
+           b"Subject: first part\r\n"
+           b"  second part\r\n"
+           b"\tthird part\r\n"
+           b"Call-ID: abc\r\n"
+           b"\r\n")
+    _assert_same(raw)
+    assert parse(raw).get("subject") == "first part second part third part"
+
+
+def test_parse_continuation_before_any_header():
+    """第一个头域之前出现的续行"""
+    _assert_same(b"OPTIONS sip:a SIP/2.0\r\n folded: value\r\n\tno colon\r\nTo: <sip:a>\r\n\r\n")
+
+
+def test_parse_line_without_colon():
+    """无冒号的行被忽略"""
+    raw = b"SIP/2.0 200 OK\r\ngarbage line\r\nCSeq: 1 INVITE\r\n\r\n"
+    _assert_same(raw)
+    assert parse(raw).headers == {"cseq": ["1 INVITE"]}
+
+
+def test_parse_repeated_headers():
+    """重复头域按出现顺序保存为列表，折行续接到最后一个值"""
+    raw = (b"SIP/2.0 180 Ringing\r\n"
+           b"Via: SIP/2.0/UDP 10.0.0.1:5060;branch=z9hG4bK1\r\n"
+           b"via: SIP/2.0/UDP 10.0.0.2:5060;branch=z9hG4bK2\r\n"
+           b"  ;received=10.0.0.2\r\n"
+           b"VIA: SIP/2.0/UDP 10.0.0.3:5060;branch=z9hG4bK3\r\n"
+           b"Content-Length: 4\r\n"
+           b"\r\n"
+           b"body")
+    _assert_same(raw)
+    assert parse(raw).headers["via"] == [
+        "SIP/2.0/UDP 10.0.0.1:5060;branch=z9hG4bK1",
+        "SIP/2.0/UDP 10.0.0.2:5060;branch=z9hG4bK2 ;received=10.0.0.2",
+        "SIP/2.0/UDP 10.0.0.3:5060;branch=z9hG4bK3",
+    ]
+
+
+def test_parse_randomized_parity():
+    """随机组合头域行，与原始实现逐一比对"""
+    rng = random.Random(20240601)
+    pieces = ["Via: a", "via:b ", "To:", " cont", "\tcont2", "noline", ":empty-name",
+              "X: y: z", "Call-ID: 1", "", "  ", "CSeq: 2 BYE"]
+    for _ in range(2000):
+        lines = ["SIP/2.0 200 OK"] + [rng.choice(pieces) for _ in range(rng.randint(0, 8))]
+        raw = "\r\n".join(lines).encode() + rng.choice([b"", b"\r\n\r\nbody", b"\r\n\r\n"])
+        _assert_same(raw)
+
+
+if __name__ == '__main__':
+    test_parse_folded_lines()
+    test_parse_continuation_before_any_header()
+    test_parse_line_without_colon()
+    test_parse_repeated_headers()
+    test_parse_randomized_parity()
+    print("✓ 解析器测试通过")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+简单响应字节测试
+验证 _fast_response_bytes 的输出与 _make_response(...).to_bytes() 逐字节一致
+"""
+
+import pytest
+
+from sipcore.parser import parse
+
+
+@pytest.fixture
+def run_module(monkeypatch):
+    """导入 run 模块并固定 tag / Date，使两种构建方式的输出可直接比较"""
+    import sipcore.cdr as cdr_module
+    # run 导入时会创建全局 CDR 单例（写入 CDR/），恢复原值以免影响其他测试
+    previous = cdr_module._cdr_instance
+    import run
+    cdr_module._cdr_instance = previous
+    monkeypatch.setattr(run, "gen_tag", lambda n=8: "fixedtag")
+    monkeypatch.setattr(run, "sip_date", lambda: "Mon, 01 Jan 2024 00:00:00 GMT")
+    return run
+
+
+MULTI_VIA = (b"INVITE sip:1002@example.com SIP/2.0\r\n"
+             b"Via: SIP/2.0/UDP 10.0.0.1:5060;branch=z9hG4bK-a\r\n"
+             b"Via: SIP/2.0/UDP 10.0.0.2:5062;branch=z9hG4bK-b;rport\r\n"
+             b"From: <sip:1001@example.com>;tag=caller\r\n"
+             b"To: <sip:1002@example.com>\r\n"
+             b"Call-ID: call-1@10.0.0.2\r\n"
+             b"CSeq: 1 INVITE\r\n"
+             b"\r\n")
+
+NO_VIA = (b"OPTIONS sip:1002@example.com SIP/2.0\r\n"
+          b"From: <sip:1001@example.com>;tag=caller\r\n"
+          b"To: <sip:1002@example.com>\r\n"
+          b"Call-ID: call-2\r\n"
+          b"CSeq: 7 OPTIONS\r\n"
+          b"\r\n")
+
+TO_WITH_TAG = (b"BYE sip:1002@10.0.0.9 SIP/2.0\r\n"
+               b"Via: SIP/2.0/UDP 10.0.0.1:5060;branch=z9hG4bK-c\r\n"
+               b"From: <sip:1001@example.com>;tag=caller\r\n"
+               b"To: <sip:1002@example.com>;tag=callee\r\n"
+               b"Call-ID: call-3\r\n"
+               b"CSeq: 2 BYE\r\n"
+               b"\r\n")
+
+MISSING_HEADERS = b"MESSAGE sip:1002@example.com SIP/2.0\r\n\r\n"
+
+
+@pytest.mark.parametrize("raw", [MULTI_VIA, NO_VIA, TO_WITH_TAG, MISSING_HEADERS])
+@pytest.mark.parametrize("code,reason", [(100, "Trying"), (200, "OK"), (404, "Not Found"), (486, "Busy Here")])
+def test_fast_response_matches_make_response(run_module, raw, code, reason):
+    req = parse(raw)
+    expected = run_module._make_response(req, code, reason).to_bytes()
+    assert run_module._fast_response_bytes(req, code, reason) == expected
+
+
+@pytest.mark.parametrize("raw", [MULTI_VIA, NO_VIA, TO_WITH_TAG])
+def test_options_tail_matches_make_response(run_module, raw):
+    """OPTIONS 200 OK 的预拼接结尾与逐个 add_header 的结果一致"""
+    req = parse(raw)
+    expected = run_module._make_response(req, 200, "OK", extra_headers={
+        "accept": "application/sdp",
+        "supported": "100rel, timer, path"
+    }).to_bytes()
+    assert run_module._fast_response_bytes(req, 200, "OK", run_module._OPTIONS_200_TAIL) == expected
+
+
+def test_existing_to_tag_is_kept(run_module):
+    req = parse(TO_WITH_TAG)
+    data = run_module._fast_response_bytes(req, 200, "OK")
+    assert b"To: <sip:1002@example.com>;tag=callee\r\n" in data
+    assert b"fixedtag" not in data
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, "-q"]))
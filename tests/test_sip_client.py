@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+独立 SIP 客户端辅助函数测试
+验证报文解析、tag / Via sent-by 提取与 REGISTER 报文构建
+"""
+
+import pytest
+
+from sip_client_standalone import SIPClient, _RE_TAG, _RE_VIA_SENTBY, _extract_tag, _extract_via_sent_by
+
+
+@pytest.fixture
+def client():
+    """指定 local_ip 时不会探测本机地址，socket 也是延迟创建的"""
+    return SIPClient("1001", "secret", "10.0.0.1", local_ip="10.0.0.2", local_port=5062)
+
+
+RESPONSE = (b"SIP/2.0 401 Unauthorized\r\n"
+            b"Via: SIP/2.0/UDP 10.0.0.2:5062;branch=z9hG4bK-1\r\n"
+            b"Via: SIP/2.0/UDP 10.0.0.3:5060;branch=z9hG4bK-2\r\n"
+            b"From: <sip:1001@10.0.0.1>;tag=abc\r\n"
+            b"To: <sip:1001@10.0.0.1>\r\n"
+            b"  ;tag=xyz\r\n"
+            b"Call-ID: call-1\r\n"
+            b"CSeq: 1 REGISTER\r\n"
+            b"X-Ignored: first\r\n"
+            b"\tignored continuation\r\n"
+            b"WWW-Authenticate: Digest realm=\"ims\",\r\n"
+            b" nonce=\"n1\"\r\n"
+            b"Content-Length: 9\r\n"
+            b"\r\n"
+            b"line1\r\n\r\nx")
+
+
+def test_parse_response_folding_and_filtering(client):
+    """继续行拼接到上一个头部；不关心的头部及其继续行被跳过；重复头部后者覆盖前者"""
+    resp = client._parse_response(RESPONSE)
+    assert resp['status_code'] == 401
+    assert resp['status_text'] == "Unauthorized"
+    headers = resp['headers']
+    assert headers['to'] == "<sip:1001@10.0.0.1> ;tag=xyz"
+    assert headers['www-authenticate'] == 'Digest realm="ims", nonce="n1"'
+    assert headers['via'] == "SIP/2.0/UDP 10.0.0.3:5060;branch=z9hG4bK-2"
+    assert 'x-ignored' not in headers
+    assert 'content-length' not in headers
+    assert "ignored continuation" not in headers['cseq']
+    # 消息体从第一个空行之后开始，其中的空行保持原样
+    assert resp['body'] == "line1\r\n\r\nx"
+    assert resp['raw'] == RESPONSE.decode()
+
+
+def test_parse_request_merges_duplicates(client):
+    """请求中的重复头部（多个 Via）以逗号合并"""
+    raw = (b"MESSAGE sip:1001@10.0.0.2:5062 SIP/2.0\r\n"
+           b"Via: SIP/2.0/UDP 10.0.0.1:5060;branch=z9hG4bK-a\r\n"
+           b"via: SIP/2.0/UDP 10.0.0.9:5060;branch=z9hG4bK-b\r\n"
+           b"Call-ID: m-1\r\n"
+           b"\r\n"
+           b"hello")
+    req = client._parse_request(raw)
+    assert req['method'] == "MESSAGE"
+    assert req['request_uri'] == "sip:1001@10.0.0.2:5062"
+    assert req['headers']['via'] == ("SIP/2.0/UDP 10.0.0.1:5060;branch=z9hG4bK-a, "
+                                     "SIP/2.0/UDP 10.0.0.9:5060;branch=z9hG4bK-b")
+    assert req['body'] == "hello"
+
+
+def test_parse_message_edge_cases(client):
+    """首个头部前的继续行、无冒号的行、memoryview 输入、无消息体"""
+    buf = bytearray(b"SIP/2.0 200 OK\r\n folded first\r\ngarbage\r\nCSeq: 2 INVITE\r\n" + b"\0" * 8)
+    view = memoryview(buf)[:len(buf) - 8]
+    start, headers, body, text = client._parse_message(view, merge_duplicates=False)
+    assert start == "SIP/2.0 200 OK"
+    assert headers == {'cseq': "2 INVITE"}
+    assert body == ""
+    assert text == bytes(view).decode()
+
+
+def test_parse_response_error(client):
+    """非 UTF-8 报文返回 error，raw 以忽略错误的方式解码"""
+    resp = client._parse_response(b"SIP/2.0 200 OK\r\n\xff\r\n\r\n")
+    assert 'error' in resp
+    assert resp['raw'] == "SIP/2.0 200 OK\r\n\r\n\r\n"
+
+
+TAG_CASES = [
+    "<sip:1001@10.0.0.1>;tag=abc",
+    "<sip:1001@10.0.0.1>;tag=abc;other=1",
+    "<sip:1001@10.0.0.1;tag=inuri>",
+    "<sip:1001@10.0.0.1>;tag=abc def",
+    "<sip:1001@10.0.0.1>;tag=a\tb",
+    "<sip:1001@10.0.0.1>;tag=a\r\n",
+    "<sip:1001@10.0.0.1>",
+    "<sip:1001@10.0.0.1>;tag=",
+    "<sip:1001@10.0.0.1>;tag=;x;tag=second",
+    "<sip:1001@10.0.0.1>;tag=>;tag=third",
+    "tag=",
+    "",
+]
+
+
+@pytest.mark.parametrize("header", TAG_CASES)
+def test_extract_tag_matches_regex(header):
+    match = _RE_TAG.search(header)
+    assert _extract_tag(header) == (match.group(1) if match else "")
+
+
+VIA_CASES = [
+    "SIP/2.0/UDP 10.0.0.1:5060;branch=z9hG4bK-1",
+    "SIP/2.0/UDP 10.0.0.1:5060",
+    "SIP/2.0/UDP   10.0.0.1:5060 ;rport",
+    "SIP/2.0/UDP\t10.0.0.1;branch=x",
+    "SIP/2.0/UDP 10.0.0.1:5060;branch=a, SIP/2.0/UDP 10.0.0.2:5060;branch=b",
+    "SIP/2.0/UDP;branch=x",
+    "SIP/2.0/UDP  ;branch=x",
+    "SIP/2.0/UDPX SIP/2.0/UDP 10.0.0.5:5070",
+    "SIP/2.0/TCP 10.0.0.1:5060",
+    "",
+]
+
+
+@pytest.mark.parametrize("via", VIA_CASES)
+def test_extract_via_sent_by_matches_regex(via):
+    match = _RE_VIA_SENTBY.search(via)
+    assert _extract_via_sent_by(via) == (match.group(1).strip() if match else "")
+
+
+def _old_register(client, call_id, from_tag, branch, cseq, expires, auth_value=None):
+    """原始的 f-string 拼接实现（作为对照）"""
+    return (
+        f"REGISTER sip:{client.server_ip} SIP/2.0\r\n"
+        f"Via: SIP/2.0/UDP {client.local_ip}:{client.local_port};branch={branch}\r\n"
+        f"From: <sip:{client.username}@{client.server_ip}>;tag={from_tag}\r\n"
+        f"To: <sip:{client.username}@{client.server_ip}>\r\n"
+        f"Call-ID: {call_id}\r\n"
+        f"CSeq: {cseq} REGISTER\r\n"
+        + (f"Authorization: {auth_value}\r\n" if auth_value else "")
+        + f"Contact: <sip:{client.username}@{client.local_ip}:{client.local_port}>\r\n"
+        f"Expires: {expires}\r\n"
+        f"Max-Forwards: 70\r\n"
+        f"Content-Length: 0\r\n"
+        f"\r\n"
+    ).encode('utf-8')
+
+
+def test_build_register_matches_fstring(client):
+    args = ("call-1@10.0.0.2", "tag1", "z9hG4bK-1", 1, 3600)
+    assert client._build_register(*args) == _old_register(client, *args)
+
+    auth = 'Digest username="1001", realm="ims", nonce="n", uri="sip:10.0.0.1", response="r"'
+    args = ("call-1@10.0.0.2", "tag1", "z9hG4bK-2", 2, 0)
+    assert client._build_register(*args, auth_value=auth) == _old_register(client, *args, auth_value=auth)
+
+
+def test_build_register_rebuilds_after_port_change(client):
+    """本地端口变化（如绑定失败改用临时端口）后缓存的片段重新生成"""
+    args = ("call-2", "tag2", "z9hG4bK-3", 1, 60)
+    client._build_register(*args)
+    client.local_port = 40000
+    data = client._build_register(*args)
+    assert data == _old_register(client, *args)
+    assert b"10.0.0.2:40000" in data
+    assert b"5062" not in data
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, "-q"]))
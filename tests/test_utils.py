@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+sipcore.utils 测试
+验证 compile_networks / in_networks 的区间合并与边界判断
+"""
+
+import ipaddress
+
+from sipcore.utils import compile_networks, in_networks
+
+
+def test_overlapping_and_adjacent_cidrs_are_merged():
+    """重叠和相邻的网段合并为一个区间"""
+    ranges = compile_networks(["10.0.0.0/24", "10.0.0.128/25", "10.0.1.0/24", "10.0.3.0/24"])
+    starts, ends = ranges[4]
+    assert len(starts) == 2  # 10.0.0.0-10.0.1.255 与 10.0.3.0/24
+    assert in_networks("10.0.1.255", ranges)
+    assert not in_networks("10.0.2.0", ranges)
+    assert in_networks("10.0.3.7", ranges)
+
+
+def test_mixed_ipv4_and_ipv6():
+    """IPv4 与 IPv6 分别建表，互不干扰"""
+    ranges = compile_networks(["192.168.0.0/16", "fd00::/8", "::1"])
+    assert in_networks("192.168.10.20", ranges)
+    assert in_networks("fd12:3456::1", ranges)
+    assert in_networks("::1", ranges)
+    assert not in_networks("fe80::1", ranges)
+    assert not in_networks("172.16.0.1", ranges)
+    # 同数值的 IPv4/IPv6 地址不能混淆
+    assert not in_networks("::c0a8:a14", ranges)
+
+
+def test_hostnames_and_invalid_entries_are_skipped():
+    """主机名等无法解析的条目被忽略；非 IP 的 host 判定为不在网段内"""
+    ranges = compile_networks(["localhost", "not-an-ip", "127.0.0.1"])
+    loopback = int(ipaddress.ip_address("127.0.0.1"))
+    assert ranges[4] == ([loopback], [loopback])
+    assert ranges[6] == ([], [])
+    assert in_networks("127.0.0.1", ranges)
+    assert not in_networks("localhost", ranges)
+    assert not in_networks("", ranges)
+
+
+def test_exact_boundaries():
+    """网络地址和广播地址包含在内，相邻地址不包含"""
+    ranges = compile_networks(["172.16.0.0/12"])
+    assert in_networks("172.16.0.0", ranges)
+    assert in_networks("172.31.255.255", ranges)
+    assert not in_networks("172.15.255.255", ranges)
+    assert not in_networks("172.32.0.0", ranges)
+
+
+def test_empty_network_list():
+    ranges = compile_networks([])
+    assert not in_networks("10.0.0.1", ranges)
+    assert not in_networks("::1", ranges)
+
+
+if __name__ == '__main__':
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -5,19 +5,56 @@ CDR 查看和统计工具
 """
 
 import csv
+import json
 import sys
 import os
 from datetime import datetime
 from pathlib import Path
-from collections import defaultdict
+from collections import deque, Counter
+
+
+# 文件超过该大小时优先使用 pandas 向量化统计（pandas 为可选依赖）
+PANDAS_MIN_BYTES = 4 * 1024 * 1024
+
+
+def format_separator(title="", width=100):
+    """生成分隔线文本"""
+    if title:
+        return f"\n{'=' * 10} {title} {'=' * (width - len(title) - 12)}"
+    return "=" * width
 
 
 def print_separator(title="", width=100):
     """打印分隔线"""
-    if title:
-        print(f"\n{'=' * 10} {title} {'=' * (width - len(title) - 12)}")
-    else:
-        print("=" * width)
+    print(format_separator(title, width))
+
+
+def _flush_lines(out):
+    """一次性输出缓冲的所有行（减少逐行 print 的写调用）"""
+    sys.stdout.write('\n'.join(out) + '\n')
+
+
+def _iter_cdr_rows(f, reader, width):
+    """
+    逐行读取 CDR 文件（惰性，不整体加载到内存），读完后关闭文件
+    
+    比表头短的行（正在写入的行、旧格式记录）用 None 补齐到 width 列，
+    与 DictReader 对缺失字段的处理一致，调用方可直接按列下标访问
+    """
+    with f:
+        for row in reader:
+            if row:  # 跳过空行（与 DictReader 行为一致）
+                if len(row) < width:
+                    row.extend([None] * (width - len(row)))
+                yield row
+
+
+def _cdr_file_path(date_str=None):
+    """获取指定日期的 CDR 文件路径"""
+    if date_str is None:
+        date_str = datetime.now().strftime("%Y-%m-%d")
+    
+    return Path("CDR") / date_str / f"cdr_{date_str}.csv"
 
 
 def load_cdr_file(date_str=None):
@@ -28,225 +65,387 @@ def load_cdr_file(date_str=None):
         date_str: 日期字符串 (YYYY-MM-DD)，默认今天
         
     Returns:
-        (records, file_path) 元组
+        (rows, idx, file_path) 元组：
+        rows 为惰性行迭代器（每行为按列顺序的列表，文件不存在时为 None），
+        idx 为列名到列下标的映射
     """
-    if date_str is None:
-        date_str = datetime.now().strftime("%Y-%m-%d")
-    
-    cdr_dir = Path("CDR") / date_str
-    cdr_file = cdr_dir / f"cdr_{date_str}.csv"
+    cdr_file = _cdr_file_path(date_str)
     
     if not cdr_file.exists():
-        return None, cdr_file
+        return None, None, cdr_file
     
-    records = []
-    with open(cdr_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            records.append(row)
+    f = open(cdr_file, 'r', encoding='utf-8')
+    reader = csv.reader(f)
+    header = next(reader, [])
+    idx = {name: i for i, name in enumerate(header)}
+    
+    return _iter_cdr_rows(f, reader, len(header)), idx, cdr_file
+
+
+def load_cdr_tail(date_str=None, limit=20, record_type=None):
+    """
+    加载 CDR 文件末尾的 limit 条记录（流式读取，内存占用 O(limit)）
+    
+    注意：message_body 等字段可能包含引号内换行，因此不做按行反向扫描，
+    而是顺序解析并只保留最后 limit 条。
+    
+    Args:
+        date_str: 日期字符串 (YYYY-MM-DD)，默认今天
+        limit: 保留的记录数
+        record_type: 记录类型过滤（None 表示不过滤）
+        
+    Returns:
+        (rows, idx, file_path) 元组，rows 为按时间顺序的 deque（文件不存在时为 None）
+    """
+    records, idx, cdr_file = load_cdr_file(date_str)
+    
+    if records is None:
+        return None, None, cdr_file
+    
+    if record_type:
+        RT = idx['record_type']
+        records = (r for r in records if r[RT] == record_type)
+    
+    return deque(records, maxlen=limit), idx, cdr_file
+
+
+def _row_to_dict(row, idx):
+    """将行转换为字典（仅用于需要按字段展示的少量记录）"""
+    return {name: (row[i] if i < len(row) else None) for name, i in idx.items()}
+
+
+def _aggregate_statistics(records, idx):
+    """
+    单次遍历完成所有统计
+    
+    Returns:
+        (total, type_counts, duration_total, duration_count, user_activity)
+    """
+    type_counts = Counter()
+    user_activity = Counter()
+    duration_total = 0.0
+    duration_count = 0
+    total = 0
+    RT = idx['record_type']
+    DUR = idx['duration']
+    CALLER = idx.get('caller_number')
+    for r in records:
+        total += 1
+        rtype = r[RT]
+        type_counts[rtype] += 1
+        if rtype == 'CALL_END':
+            # 通话时长直接累加（不构建中间列表）
+            dur = r[DUR]
+            if dur:
+                duration_total += float(dur)
+                duration_count += 1
+        if CALLER is not None:
+            caller = r[CALLER]
+            if caller:
+                user_activity[caller] += 1
+    
+    return total, type_counts, duration_total, duration_count, user_activity
+
+
+def _aggregate_statistics_pandas(cdr_file):
+    """
+    使用 pandas 向量化统计（结果与 _aggregate_statistics 一致）
     
-    return records, cdr_file
+    Returns:
+        同 _aggregate_statistics；pandas 不可用或列缺失时返回 None
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        return None
+    
+    try:
+        df = pd.read_csv(
+            cdr_file,
+            usecols=['record_type', 'duration', 'caller_number'],
+            dtype=str,
+            keep_default_na=False,
+            encoding='utf-8'
+        )
+    except ValueError:
+        return None
+    
+    # sort=False 保持首次出现顺序，与逐行统计时 most_common 的并列排序一致
+    type_counts = Counter({k: int(v) for k, v in df['record_type'].value_counts(sort=False).items()})
+    
+    durations = df.loc[(df['record_type'] == 'CALL_END') & (df['duration'] != ''), 'duration'].astype(float)
+    
+    callers = df.loc[df['caller_number'] != '', 'caller_number']
+    user_activity = Counter({k: int(v) for k, v in callers.value_counts(sort=False).items()})
+    
+    return len(df), type_counts, float(durations.sum()), len(durations), user_activity
+
+
+def _stats_cache_path(cdr_file):
+    """统计缓存文件路径（与 CSV 同目录）"""
+    return cdr_file.with_suffix('.stats.json')
+
+
+def _load_cached_statistics(cdr_file, st):
+    """
+    读取统计缓存（仅当缓存记录的 CSV mtime/size 与当前一致时有效）
+    
+    Returns:
+        同 _aggregate_statistics；缓存不存在或已失效时返回 None
+    """
+    try:
+        with open(_stats_cache_path(cdr_file), 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('mtime') != st.st_mtime_ns or cache.get('size') != st.st_size:
+            return None
+        return (cache['total'], Counter(cache['type_counts']), cache['duration_total'],
+                cache['duration_count'], Counter(cache['user_activity']))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save_cached_statistics(cdr_file, st, stats):
+    """写入统计缓存（写入失败时忽略，例如目录只读）"""
+    total, type_counts, duration_total, duration_count, user_activity = stats
+    cache = {
+        'mtime': st.st_mtime_ns,
+        'size': st.st_size,
+        'total': total,
+        'type_counts': type_counts,
+        'duration_total': duration_total,
+        'duration_count': duration_count,
+        'user_activity': user_activity,
+    }
+    cache_file = _stats_cache_path(cdr_file)
+    tmp_file = cache_file.with_name(cache_file.name + '.tmp')
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
 
 
 def show_statistics(date_str=None):
     """显示 CDR 统计信息"""
-    records, cdr_file = load_cdr_file(date_str)
+    cdr_file = _cdr_file_path(date_str)
     
-    if records is None:
+    if not cdr_file.exists():
         print(f"❌ CDR 文件不存在: {cdr_file}")
         return
     
-    print_separator(f"CDR 统计报告 - {date_str or '今天'}")
-    print(f"📁 文件: {cdr_file}")
-    print(f"📊 总记录数: {len(records)}\n")
+    # CSV 未变化（mtime/size 相同）时直接复用上次的统计结果
+    st = cdr_file.stat()
+    stats = _load_cached_statistics(cdr_file, st)
     
-    # 按记录类型统计
-    type_counts = defaultdict(int)
-    for r in records:
-        type_counts[r['record_type']] += 1
+    if stats is None:
+        if st.st_size >= PANDAS_MIN_BYTES:
+            stats = _aggregate_statistics_pandas(cdr_file)
+        
+        if stats is None:
+            records, idx, cdr_file = load_cdr_file(date_str)
+            
+            if records is None:
+                print(f"❌ CDR 文件不存在: {cdr_file}")
+                return
+            
+            stats = _aggregate_statistics(records, idx)
+        
+        _save_cached_statistics(cdr_file, st, stats)
     
-    print("📈 记录类型分布:")
-    print("-" * 60)
+    total, type_counts, duration_total, duration_count, user_activity = stats
+    
+    out = []
+    out.append(format_separator(f"CDR 统计报告 - {date_str or '今天'}"))
+    out.append(f"📁 文件: {cdr_file}")
+    out.append(f"📊 总记录数: {total}\n")
+    
+    out.append("📈 记录类型分布:")
+    out.append("-" * 60)
     for rtype in sorted(type_counts.keys()):
         count = type_counts[rtype]
-        percentage = (count / len(records) * 100) if records else 0
+        percentage = (count / total * 100) if total else 0
         bar = "█" * int(percentage / 2)
-        print(f"  {rtype:25s} | {count:5d} ({percentage:5.1f}%) {bar}")
+        out.append(f"  {rtype:25s} | {count:5d} ({percentage:5.1f}%) {bar}")
     
     # 统计注册信息
-    register_success = sum(1 for r in records if r['record_type'] == 'REGISTER_SUCCESS')
-    register_fail = sum(1 for r in records if r['record_type'] == 'REGISTER_FAIL')
-    unregister = sum(1 for r in records if r['record_type'] == 'UNREGISTER')
+    register_success = type_counts['REGISTER_SUCCESS']
+    register_fail = type_counts['REGISTER_FAIL']
+    unregister = type_counts['UNREGISTER']
     
     if register_success or register_fail or unregister:
-        print(f"\n📝 注册统计:")
-        print("-" * 60)
-        print(f"  成功注册: {register_success}")
-        print(f"  失败注册: {register_fail}")
-        print(f"  注销: {unregister}")
+        out.append(f"\n📝 注册统计:")
+        out.append("-" * 60)
+        out.append(f"  成功注册: {register_success}")
+        out.append(f"  失败注册: {register_fail}")
+        out.append(f"  注销: {unregister}")
     
     # 统计呼叫信息
-    call_start = sum(1 for r in records if r['record_type'] == 'CALL_START')
-    call_answer = sum(1 for r in records if r['record_type'] == 'CALL_ANSWER')
-    call_end = sum(1 for r in records if r['record_type'] == 'CALL_END')
-    call_fail = sum(1 for r in records if r['record_type'] == 'CALL_FAIL')
-    call_cancel = sum(1 for r in records if r['record_type'] == 'CALL_CANCEL')
+    call_start = type_counts['CALL_START']
+    call_answer = type_counts['CALL_ANSWER']
+    call_end = type_counts['CALL_END']
+    call_fail = type_counts['CALL_FAIL']
+    call_cancel = type_counts['CALL_CANCEL']
     
     if call_start or call_answer or call_end or call_fail or call_cancel:
-        print(f"\n📞 呼叫统计:")
-        print("-" * 60)
-        print(f"  呼叫开始: {call_start}")
-        print(f"  呼叫应答: {call_answer}")
-        print(f"  呼叫结束: {call_end}")
-        print(f"  呼叫失败: {call_fail}")
-        print(f"  呼叫取消: {call_cancel}")
+        out.append(f"\n📞 呼叫统计:")
+        out.append("-" * 60)
+        out.append(f"  呼叫开始: {call_start}")
+        out.append(f"  呼叫应答: {call_answer}")
+        out.append(f"  呼叫结束: {call_end}")
+        out.append(f"  呼叫失败: {call_fail}")
+        out.append(f"  呼叫取消: {call_cancel}")
         
         if call_answer and call_start:
             success_rate = (call_answer / call_start * 100)
-            print(f"  接通率: {success_rate:.1f}%")
+            out.append(f"  接通率: {success_rate:.1f}%")
         
         # 计算平均通话时长
-        durations = [float(r['duration']) for r in records 
-                    if r['record_type'] == 'CALL_END' and r['duration']]
-        if durations:
-            avg_duration = sum(durations) / len(durations)
-            total_duration = sum(durations)
-            print(f"  平均通话时长: {avg_duration:.1f} 秒")
-            print(f"  总通话时长: {total_duration:.1f} 秒 ({total_duration/60:.1f} 分钟)")
+        if duration_count:
+            avg_duration = duration_total / duration_count
+            out.append(f"  平均通话时长: {avg_duration:.1f} 秒")
+            out.append(f"  总通话时长: {duration_total:.1f} 秒 ({duration_total/60:.1f} 分钟)")
     
     # 统计短信
-    messages = sum(1 for r in records if r['record_type'] == 'MESSAGE')
+    messages = type_counts['MESSAGE']
     if messages:
-        print(f"\n💬 短信统计:")
-        print("-" * 60)
-        print(f"  短信数量: {messages}")
+        out.append(f"\n💬 短信统计:")
+        out.append("-" * 60)
+        out.append(f"  短信数量: {messages}")
     
     # 统计用户活跃度
-    user_activity = defaultdict(int)
-    for r in records:
-        caller = r.get('caller_number', '')
-        if caller:
-            user_activity[caller] += 1
-    
     if user_activity:
-        print(f"\n👥 用户活跃度 TOP 10:")
-        print("-" * 60)
-        sorted_users = sorted(user_activity.items(), key=lambda x: x[1], reverse=True)[:10]
+        out.append(f"\n👥 用户活跃度 TOP 10:")
+        out.append("-" * 60)
+        sorted_users = user_activity.most_common(10)
         for i, (user, count) in enumerate(sorted_users, 1):
-            print(f"  {i:2d}. {user:15s} | {count:5d} 条记录")
+            out.append(f"  {i:2d}. {user:15s} | {count:5d} 条记录")
     
-    print_separator()
+    out.append(format_separator())
+    _flush_lines(out)
 
 
 def show_recent_records(date_str=None, limit=20, record_type=None):
     """显示最近的 CDR 记录"""
-    records, cdr_file = load_cdr_file(date_str)
+    recent, idx, cdr_file = load_cdr_tail(date_str, limit, record_type)
     
-    if records is None:
+    if recent is None:
         print(f"❌ CDR 文件不存在: {cdr_file}")
         return
     
     if record_type:
-        records = [r for r in records if r['record_type'] == record_type]
         title = f"最近 {limit} 条 {record_type} 记录"
     else:
         title = f"最近 {limit} 条记录"
     
-    print_separator(title)
-    print(f"📁 文件: {cdr_file}\n")
+    out = []
+    out.append(format_separator(title))
+    out.append(f"📁 文件: {cdr_file}\n")
     
-    if not records:
-        print("❌ 没有找到记录")
+    if not recent:
+        out.append("❌ 没有找到记录")
+        _flush_lines(out)
         return
     
-    # 显示最近的记录
-    recent = records[-limit:] if len(records) > limit else records
-    recent.reverse()  # 最新的在前
-    
-    for i, r in enumerate(recent, 1):
+    # 显示最近的记录（最新的在前）
+    emit = out.append
+    for i, r in enumerate(reversed(recent), 1):
+        g = _row_to_dict(r, idx).get
         # 兼容新旧格式
-        time_str = r.get('start_time') or r.get('time', '')
-        record_type = r.get('record_type', '')
-        call_state = r.get('call_state', '')
+        time_str = g('start_time') or g('time', '')
+        record_type = g('record_type', '')
+        call_state = g('call_state', '')
         
         # 显示记录类型和状态
         if call_state:
-            print(f"{i}. [{time_str}] {record_type} ({call_state})")
+            emit(f"{i}. [{time_str}] {record_type} ({call_state})")
         else:
-            print(f"{i}. [{time_str}] {record_type}")
+            emit(f"{i}. [{time_str}] {record_type}")
         
         # 显示 Call-ID（截取前20个字符）
-        call_id = r.get('call_id', '')
+        call_id = g('call_id', '')
         if call_id and len(call_id) > 30:
-            print(f"   Call-ID: {call_id[:30]}...")
+            emit(f"   Call-ID: {call_id[:30]}...")
         else:
-            print(f"   Call-ID: {call_id}")
+            emit(f"   Call-ID: {call_id}")
         
         # 显示主被叫信息
-        caller_uri = r.get('caller_uri', '')
-        caller_number = r.get('caller_number', '')
+        caller_uri = g('caller_uri', '')
+        caller_number = g('caller_number', '')
         if caller_number:
             caller_info = f"{caller_number}"
-            if r.get('caller_ip'):
-                caller_info += f" ({r['caller_ip']}:{r['caller_port']})"
-            print(f"   主叫: {caller_info}")
+            caller_ip = g('caller_ip')
+            if caller_ip:
+                caller_info += f" ({caller_ip}:{g('caller_port')})"
+            emit(f"   主叫: {caller_info}")
         elif caller_uri:
-            print(f"   主叫: {caller_uri}")
+            emit(f"   主叫: {caller_uri}")
         
-        callee_number = r.get('callee_number', '')
-        callee_uri = r.get('callee_uri', '')
+        callee_number = g('callee_number', '')
+        callee_uri = g('callee_uri', '')
         if callee_number:
             callee_info = f"{callee_number}"
-            if r.get('callee_ip'):
-                callee_info += f" ({r['callee_ip']}:{r['callee_port']})"
-            print(f"   被叫: {callee_info}")
+            callee_ip = g('callee_ip')
+            if callee_ip:
+                callee_info += f" ({callee_ip}:{g('callee_port')})"
+            emit(f"   被叫: {callee_info}")
         elif callee_uri:
-            print(f"   被叫: {callee_uri}")
+            emit(f"   被叫: {callee_uri}")
         
         # 显示呼叫时间信息
-        if r.get('duration'):
-            print(f"   通话时长: {r['duration']} 秒")
-        if r.get('setup_time'):
-            print(f"   建立时间: {r['setup_time']} 毫秒")
+        duration = g('duration')
+        if duration:
+            emit(f"   通话时长: {duration} 秒")
+        setup_time = g('setup_time')
+        if setup_time:
+            emit(f"   建立时间: {setup_time} 毫秒")
         
         # 显示各阶段时间（合并模式）
-        if r.get('invite_time'):
-            print(f"   INVITE: {r['invite_time']}")
-        if r.get('answer_time'):
-            print(f"   ANSWER: {r['answer_time']}")
-        if r.get('bye_time'):
-            print(f"   BYE: {r['bye_time']}")
+        invite_time = g('invite_time')
+        if invite_time:
+            emit(f"   INVITE: {invite_time}")
+        answer_time = g('answer_time')
+        if answer_time:
+            emit(f"   ANSWER: {answer_time}")
+        bye_time = g('bye_time')
+        if bye_time:
+            emit(f"   BYE: {bye_time}")
         
         # 显示状态
-        if r.get('status_code'):
-            print(f"   状态: {r['status_code']} {r.get('status_text', '')}")
-        if r.get('termination_reason'):
-            print(f"   终止原因: {r['termination_reason']}")
+        status_code = g('status_code')
+        if status_code:
+            emit(f"   状态: {status_code} {g('status_text', '')}")
+        termination_reason = g('termination_reason')
+        if termination_reason:
+            emit(f"   终止原因: {termination_reason}")
         
         # 显示消息内容
-        if r.get('message_body'):
-            msg = r['message_body'][:100]
-            print(f"   内容: {msg}{'...' if len(r['message_body']) > 100 else ''}")
+        message_body = g('message_body')
+        if message_body:
+            emit(f"   内容: {message_body[:100]}{'...' if len(message_body) > 100 else ''}")
         
         # 显示注册信息
-        if r.get('expires'):
-            print(f"   过期时间: {r['expires']} 秒")
+        expires = g('expires')
+        if expires:
+            emit(f"   过期时间: {expires} 秒")
         
-        print()
+        emit("")
     
-    print_separator()
+    emit(format_separator())
+    _flush_lines(out)
 
 
 def show_call_details(call_id, date_str=None):
     """显示特定呼叫的详细信息"""
-    records, cdr_file = load_cdr_file(date_str)
+    records, idx, cdr_file = load_cdr_file(date_str)
     
     if records is None:
         print(f"❌ CDR 文件不存在: {cdr_file}")
         return
     
     # 查找该 Call-ID 的所有记录
-    call_records = [r for r in records if r['call_id'] == call_id]
+    CID = idx['call_id']
+    call_records = [_row_to_dict(r, idx) for r in records if r[CID] == call_id]
     
     if not call_records:
         print(f"❌ 没有找到 Call-ID: {call_id}")
@@ -328,28 +527,34 @@ def show_call_details(call_id, date_str=None):
 
 def export_to_csv(date_str=None, output_file=None, record_type=None):
     """导出 CDR 到新的 CSV 文件（可按类型过滤）"""
-    records, cdr_file = load_cdr_file(date_str)
+    records, idx, cdr_file = load_cdr_file(date_str)
     
     if records is None:
         print(f"❌ CDR 文件不存在: {cdr_file}")
         return
     
     if record_type:
-        records = [r for r in records if r['record_type'] == record_type]
+        RT = idx['record_type']
+        records = (r for r in records if r[RT] == record_type)
     
-    if not records:
+    first = next(records, None)
+    if first is None:
         print(f"❌ 没有找到记录")
         return
     
     if output_file is None:
         output_file = f"cdr_export_{date_str or 'today'}_{record_type or 'all'}.csv"
     
+    count = 1
     with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=records[0].keys())
-        writer.writeheader()
-        writer.writerows(records)
-    
-    print(f"✅ 已导出 {len(records)} 条记录到: {output_file}")
+        writer = csv.writer(f)
+        writer.writerow(list(idx))
+        writer.writerow(first)
+        for r in records:
+            writer.writerow(r)
+            count += 1
+    
+    print(f"✅ 已导出 {count} 条记录到: {output_file}")
 
 
 def main():